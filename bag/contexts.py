@@ -1,38 +1,81 @@
 from decimal import Decimal
 from django.conf import settings
-from django.shortcuts import get_object_or_404
 from products.models import Product
+from boutique_ado.cache import record
 
+import json
 
-def bag_contents(request):
 
-    bag_items = []
-    total = 0
-    product_count = 0
-    bag = request.session.get('bag', {})
+def _bag_key(request):
+    return json.dumps(request.session.get('bag', {}), sort_keys=True)
+
+
+def _cached(request, attr):
+    """
+    Return the value cached on the request under attr, or None if
+    the session bag has changed since it was stored
+    """
+    cached = getattr(request, attr, None)
+    if cached is not None and cached[0] == _bag_key(request):
+        return cached[1]
+    return None
+
+
+def _memoized(request, attr, compute):
+    value = _cached(request, attr)
+    if value is None:
+        record('bag', 'miss')
+        value = compute()
+        setattr(request, attr, (_bag_key(request), value))
+    else:
+        record('bag', 'hit')
+    return value
+
+
+def _drop_stale_items(request, bag, found_ids):
+    """
+    Remove bag entries whose product no longer exists
+    """
+    stale_ids = [item_id for item_id in bag if item_id not in found_ids]
+    if stale_ids:
+        for item_id in stale_ids:
+            bag.pop(item_id)
+        request.session['bag'] = bag
 
-    for item_id, item_data in bag.items():
-        if isinstance(item_data, int):
-            product = get_object_or_404(Product, pk=item_id)
-            total += item_data * product.price
-            product_count += item_data
-            bag_items.append({
-                'item_id': item_id,
-                'quantity': item_data,
-                'product': product,
-            })
-        else:
-            product = get_object_or_404(Product, pk=item_id)
-            for size, quantity in item_data['items_by_size'].items():
-                total += quantity * product.price
-                product_count += quantity
-                bag_items.append({
-                    'item_id': item_id,
-                    'quantity': quantity,
-                    'product': product,
-                    'size': size,
-                })
 
+def _product_ids(bag):
+    return [item_id for item_id in bag if str(item_id).isdigit()]
+
+
+def _bag_products(request, bag):
+    """
+    Fetch every product in the bag with a single query, dropping any
+    entries whose product no longer exists from the session bag
+    """
+    products = Product.objects.in_bulk(_product_ids(bag))
+    found = {str(pk): product for pk, product in products.items()}
+    _drop_stale_items(request, bag, found)
+    return found
+
+
+def _bag_prices(request, bag):
+    """
+    Fetch only the price of every product in the bag
+    """
+    prices = Product.objects.filter(
+        pk__in=_product_ids(bag)).values_list('pk', 'price')
+    found = {str(pk): price for pk, price in prices}
+    _drop_stale_items(request, bag, found)
+    return found
+
+
+def _quantities(item_data):
+    if isinstance(item_data, int):
+        return [(None, item_data)]
+    return list(item_data['items_by_size'].items())
+
+
+def _totals(total, product_count):
     if total < settings.FREE_DELIVERY_THRESHOLD:
         delivery = total * Decimal(settings.STANDARD_DELIVERY_PERCENTAGE / 100)
         free_delivery_delta = settings.FREE_DELIVERY_THRESHOLD - total
@@ -40,16 +83,96 @@ def bag_contents(request):
         delivery = 0
         free_delivery_delta = 0
 
-    grand_total = delivery + total
-
-    context = {
-        'bag_items': bag_items,
+    return {
         'total': total,
         'product_count': product_count,
         'delivery': delivery,
         'free_delivery_delta': free_delivery_delta,
         'free_delivery_threshold': settings.FREE_DELIVERY_THRESHOLD,
-        'grand_total': grand_total,
+        'grand_total': delivery + total,
+    }
+
+
+def _compute_bag_contents(request):
+    bag_items = []
+    total = 0
+    product_count = 0
+    bag = request.session.get('bag', {})
+    products = _bag_products(request, bag)
+
+    for item_id, item_data in bag.items():
+        product = products[item_id]
+        for size, quantity in _quantities(item_data):
+            total += quantity * product.price
+            product_count += quantity
+            item = {
+                'item_id': item_id,
+                'quantity': quantity,
+                'product': product,
+            }
+            if size is not None:
+                item['size'] = size
+            bag_items.append(item)
+
+    context = _totals(total, product_count)
+    context['bag_items'] = bag_items
+    return context
+
+
+def _compute_bag_totals(request):
+    contents = _cached(request, '_bag_contents_cache')
+    if contents is not None:
+        return contents
+
+    total = 0
+    product_count = 0
+    bag = request.session.get('bag', {})
+    prices = _bag_prices(request, bag)
+
+    for item_id, item_data in bag.items():
+        for size, quantity in _quantities(item_data):
+            total += quantity * prices[item_id]
+            product_count += quantity
+
+    return _totals(total, product_count)
+
+
+def bag_contents(request):
+    """
+    Build the full shopping bag, including product instances. The
+    result is memoized on the request so repeated calls within a single
+    render (e.g. the checkout view and the template) only hit the
+    database once.
+    """
+    return _memoized(request, '_bag_contents_cache',
+                     lambda: _compute_bag_contents(request))
+
+
+def bag_totals(request):
+    """
+    Cheap version of bag_contents for the nav badge: totals only,
+    computed from product prices without building product instances.
+    """
+    return _memoized(request, '_bag_totals_cache',
+                     lambda: _compute_bag_totals(request))
+
+
+def bag_context(request):
+    """
+    Context processor exposing the bag lazily. Each value is a callable
+    which templates only invoke when they actually read the key, so pages
+    that never show the bag never query for it.
+    """
+
+    def lazy(key, source):
+        return lambda: source(request)[key]
+
+    context = {
+        key: lazy(key, bag_totals)
+        for key in ('total', 'product_count', 'delivery',
+                    'free_delivery_delta', 'grand_total')
     }
+    context['bag_items'] = lazy('bag_items', bag_contents)
+    context['free_delivery_threshold'] = settings.FREE_DELIVERY_THRESHOLD
 
     return context
@@ -1,3 +1,81 @@
-from django.test import TestCase
+from django.test import TestCase, RequestFactory
 
-# Create your tests here.
+from products.models import Product
+from .contexts import bag_contents, bag_context
+
+
+class BagContentsTests(TestCase):
+
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f'Product {i}', description='', price=10)
+            for i in range(5)
+        ]
+        self.request = RequestFactory().get('/')
+        self.request.session = {}
+
+    def test_products_are_loaded_in_one_query(self):
+        bag = {str(p.id): 1 for p in self.products}
+        bag[str(self.products[0].id)] = {'items_by_size': {'s': 2, 'm': 1}}
+        self.request.session['bag'] = bag
+
+        with self.assertNumQueries(1):
+            context = bag_contents(self.request)
+
+        self.assertEqual(len(context['bag_items']), 6)
+        self.assertEqual(context['product_count'], 7)
+        self.assertEqual(context['total'], 70)
+
+    def test_result_is_memoized_for_the_request(self):
+        self.request.session['bag'] = {str(self.products[0].id): 2}
+        bag_contents(self.request)
+
+        with self.assertNumQueries(0):
+            context = bag_contents(self.request)
+        self.assertEqual(context['product_count'], 2)
+
+    def test_stale_product_is_removed_from_bag(self):
+        stale_id = str(self.products[1].id)
+        self.request.session['bag'] = {
+            str(self.products[0].id): 1,
+            stale_id: 3,
+        }
+        self.products[1].delete()
+
+        context = bag_contents(self.request)
+
+        self.assertEqual(context['product_count'], 1)
+        self.assertNotIn(stale_id, self.request.session['bag'])
+
+
+class BagContextTests(TestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Product', description='', price=20)
+        self.request = RequestFactory().get('/')
+        self.request.session = {'bag': {str(self.product.id): 2}}
+
+    def test_nothing_is_queried_until_a_key_is_read(self):
+        with self.assertNumQueries(0):
+            context = bag_context(self.request)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(round(context['grand_total'](), 2), 44)
+            self.assertEqual(context['product_count'](), 2)
+
+    def test_totals_reuse_full_bag_when_already_built(self):
+        context = bag_context(self.request)
+        self.assertEqual(context['bag_items']()[0]['product'], self.product)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(context['total'](), 40)
+
+    def test_bag_page_renders_lazy_values(self):
+        session = self.client.session
+        session['bag'] = {str(self.product.id): 2}
+        session.save()
+
+        response = self.client.get('/bag/')
+
+        self.assertContains(response, 'Product')
+        self.assertContains(response, 'Grand Total: $44.00')
@@ -0,0 +1,169 @@
+import random
+import statistics
+import timeit
+from decimal import Decimal
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.base import SessionBase
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from bag.contexts import bag_contents
+from bag.templatetags.bag_tools import calc_subtotal
+from boutique_ado import datagen
+from checkout.forms import OrderForm
+from checkout.models import Order, OrderLineItem
+from products.forms import ProductForm
+from products.models import Product
+from products.registry import category_registry
+
+# name -> (sizes, setup). setup(size, rng) builds the dataset for one
+# size and returns the function to time.
+BENCHMARKS = {}
+
+
+def benchmark(name, sizes=(None,)):
+    """ Register the decorated setup function as benchmark `name` """
+    def register(setup):
+        BENCHMARKS[name] = (sizes, setup)
+        return setup
+    return register
+
+
+def _request(bag=None):
+    request = RequestFactory().get('/')
+    request.user = AnonymousUser()
+    request.session = SessionBase()
+    request.session['bag'] = bag or {}
+    return request
+
+
+def _products(count, rng):
+    datagen.create_catalog(5, count, lambda i, categories: {
+        'category': rng.choice(categories), 'sku': f'SKU{i:08d}', 'name': f'Product {i}',
+        'description': '', 'has_sizes': i % 2 == 0,
+        'price': Decimal(rng.randint(100, 9999)) / 100,
+        'rating': Decimal(rng.randint(0, 500)) / 100,
+        'image': f'product_{i}.jpg' if i % 3 else '',
+    })
+    return list(Product.objects.select_related('category').order_by('pk'))
+
+
+@benchmark('bag_contents', sizes=(1, 10, 100))
+def bench_bag_contents(size, rng):
+    bag = {}
+    for product in _products(size, rng):
+        if product.has_sizes:
+            bag[str(product.pk)] = {'items_by_size': {'s': rng.randint(1, 3),
+                                                      'm': rng.randint(1, 3)}}
+        else:
+            bag[str(product.pk)] = rng.randint(1, 3)
+    request = _request(bag)
+
+    def run():
+        # Drop the copy memoized on the request by the previous call
+        request.__dict__.pop('_bag_contents_cache', None)
+        bag_contents(request)
+    return run
+
+
+@benchmark('Order.update_total', sizes=(1, 10, 100))
+def bench_update_total(size, rng):
+    order = Order.objects.create(
+        full_name='Bench Buyer', email='buyer@example.com', phone_number='0123456789',
+        country='IE', town_or_city='Dublin', street_address1='1 Main Street')
+    OrderLineItem.objects.bulk_create(
+        OrderLineItem(order=order, product=product, quantity=quantity,
+                      lineitem_total=product.price * quantity)
+        for product, quantity in
+        ((p, rng.randint(1, 3)) for p in _products(size, rng))
+    )
+    return order.update_total
+
+
+@benchmark('ProductForm.__init__', sizes=(5, 50, 500))
+def bench_product_form(size, rng):
+    datagen.create_catalog(size, 0, None)
+    return ProductForm
+
+
+@benchmark('OrderForm.__init__')
+def bench_order_form(size, rng):
+    return OrderForm
+
+
+@benchmark('calc_subtotal')
+def bench_calc_subtotal(size, rng):
+    price = Decimal(rng.randint(100, 9999)) / 100
+    quantity = rng.randint(1, 10)
+    return lambda: calc_subtotal(price, quantity)
+
+
+@benchmark('products.html', sizes=(12, 24, 96))
+def bench_products_template(size, rng):
+    context = {
+        'products': _products(size, rng),
+        'search_term': None,
+        'current_categories': None,
+        'current_sorting': 'None_None',
+        'next_page_query': 'after=x',
+        'first_page_query': None,
+    }
+    request = _request()
+    return lambda: render_to_string('products/products.html', context, request)
+
+
+def label(name, size):
+    return name if size is None else f'{name}[{size}]'
+
+
+def measure(func, repeat=5):
+    """
+    Time func the way timeit does: enough calls per round to take at
+    least 0.2s, `repeat` rounds. Times are per call, in microseconds.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    rounds = [t / number * 1e6 for t in timer.repeat(repeat, number)]
+    return {
+        'min_us': min(rounds),
+        'median_us': statistics.median(rounds),
+        'loops': number,
+    }
+
+
+def run_benchmarks(names=None, repeat=5, seed=0, on_result=None):
+    """
+    Run the named benchmarks (all of them by default) at each of their
+    sizes and return {label: timings}. Each dataset is built in a
+    transaction that is rolled back afterwards, so no run sees another's
+    rows. on_result is called with each label and its timings.
+    """
+    results = {}
+    for name, (sizes, setup) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        for size in sizes:
+            with transaction.atomic():
+                func = setup(size, random.Random(f'{seed}:{name}:{size}'))
+                func()
+                results[label(name, size)] = timings = measure(func, repeat)
+                transaction.set_rollback(True)
+            category_registry.invalidate()
+            if on_result:
+                on_result(label(name, size), timings)
+    return results
+
+
+def find_regressions(baseline, results, threshold):
+    """
+    Labels whose best time is more than `threshold` percent slower than
+    in baseline, with (baseline, current) best times
+    """
+    regressions = {}
+    for key, timings in results.items():
+        before = baseline.get(key)
+        if before and timings['min_us'] > before['min_us'] * (1 + threshold / 100):
+            regressions[key] = (before['min_us'], timings['min_us'])
+    return regressions
@@ -0,0 +1,314 @@
+import hashlib
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Lock files shared by the keys of a LockingFileBasedCache
+LOCK_STRIPES = 64
+
+
+class LockingFileBasedCache(FileBasedCache):
+    """
+    A file based cache whose add() and incr() are atomic across every
+    process on the host. FileBasedCache implements them as a read then
+    a write, so two processes can both take the same add() lock, or
+    both increment from the same value and lose a bump.
+    """
+
+    def __init__(self, dir, params):
+        if fcntl is None:
+            raise ImproperlyConfigured(
+                'LockingFileBasedCache needs fcntl; use Redis or Memcached instead')
+        super().__init__(dir, params)
+
+    @contextmanager
+    def _locked(self, key, version):
+        # Keys share a fixed set of lock files, which clear() and culling
+        # leave alone as they only remove .djcache files
+        self._createdir()
+        name = os.path.basename(self._key_to_file(key, version))
+        path = os.path.join(self._dir, f'lock{int(name[:8], 16) % LOCK_STRIPES:02d}')
+        with open(path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._locked(key, version):
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        with self._locked(key, version):
+            return super().incr(key, delta, version)
+
+
+def shared_cache(alias='default'):
+    """
+    The cache alias, which must have an atomic add() and incr() as locks
+    and counters are kept in it
+    """
+    backend = caches[alias]
+    if type(backend) is FileBasedCache:
+        raise ImproperlyConfigured(
+            f'The {alias!r} cache needs an atomic add() and incr(); use '
+            f'boutique_ado.cache.LockingFileBasedCache, Redis or Memcached')
+    return backend
+
+
+class VersionCounter:
+    """
+    A generation number kept in the Django cache so that every worker
+    sharing the cache sees it change when bump() is called
+    """
+
+    def __init__(self, key):
+        self.key = key
+
+    def _initial(self):
+        # Time based so that a counter lost from the cache never
+        # restarts at a value a worker has already seen
+        return int(time.time() * 1000000)
+
+    def get(self):
+        cache = shared_cache()
+        version = cache.get(self.key)
+        if version is None:
+            cache.add(self.key, self._initial(), timeout=None)
+            version = cache.get(self.key)
+        return version
+
+    def bump(self):
+        cache = shared_cache()
+        try:
+            cache.incr(self.key)
+        except ValueError:
+            cache.set(self.key, self._initial(), timeout=None)
+
+
+class LRUCache:
+    """
+    Thread-safe in-process cache holding at most max_size entries, each
+    for at most ttl seconds. The least recently used entry is evicted
+    first when full.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_stats_lock = threading.Lock()
+_stats = defaultdict(Counter)
+
+
+def record(namespace, event, count=1):
+    """
+    Count a cache event such as 'hit' or 'miss' for a namespace. Counters
+    are kept per worker.
+    """
+    with _stats_lock:
+        _stats[namespace][event] += count
+
+
+def cache_stats(namespace=None):
+    """
+    Snapshot of this worker's counters, for one namespace or all of them
+    """
+    with _stats_lock:
+        if namespace is not None:
+            return dict(_stats[namespace])
+        return {ns: dict(counts) for ns, counts in _stats.items()}
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+class TieredCache:
+    """
+    A per-worker L1 (an LRUCache) in front of a shared L2 (a Django cache
+    alias with an atomic add(), file based and locked by default).
+
+    get_or_set() protects against stampedes in two ways:
+
+    * Probabilistic early expiry (XFetch): a reader may recompute a value
+      shortly before it expires. Values that were slow to compute are
+      more likely to be refreshed early, so they rarely expire for
+      everybody at once.
+    * Single-flight: only one thread per worker, and one worker per L2,
+      recomputes a key at a time. Everybody else keeps getting the stale
+      value, or waits for the new one on a cold miss.
+
+    Hits, misses and recomputes are counted under the namespace, see
+    cache_stats().
+    """
+
+    def __init__(self, namespace, l2_alias='default', l1_size=1000, l1_ttl=30,
+                 beta=1.0, lock_timeout=10, poll_interval=0.05):
+        self.namespace = namespace
+        self.l1 = LRUCache(max_size=l1_size, ttl=l1_ttl)
+        self.l2_alias = l2_alias
+        self.beta = beta
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        # Striped so the number of locks stays fixed however many keys
+        self._flights = [threading.Lock() for _ in range(64)]
+
+    @property
+    def l2(self):
+        return shared_cache(self.l2_alias)
+
+    def _key(self, key):
+        if not isinstance(key, str) or len(key) > 200:
+            key = hashlib.sha1(repr(key).encode()).hexdigest()
+        return f'{self.namespace}:{key}'
+
+    def _expired(self, entry):
+        """
+        Whether the entry should be recomputed now, possibly ahead of
+        its expiry time
+        """
+        _, delta, expires_at = entry
+        early = delta * self.beta * -math.log(random.random() or 1e-12)
+        return time.time() + early >= expires_at
+
+    def _flight(self, key):
+        return self._flights[hash(key) % len(self._flights)]
+
+    def _compute(self, key, compute, timeout):
+        start = time.time()
+        value = compute()
+        delta = time.time() - start
+        self.set(key, value, timeout, delta=delta)
+        return value
+
+    def get(self, key, default=None):
+        full_key = self._key(key)
+        entry = self.l1.get(full_key)
+        event = 'l1_hit'
+        if entry is None:
+            entry = self.l2.get(full_key)
+            event = 'l2_hit'
+            if entry is not None:
+                self.l1.set(full_key, entry)
+        if entry is None or entry[2] < time.time():
+            record(self.namespace, 'miss')
+            return default
+        record(self.namespace, event)
+        return entry[0]
+
+    def set(self, key, value, timeout, delta=0):
+        """
+        Store value for timeout seconds. The L2 keeps it for a further
+        timeout seconds so it can be served stale while being recomputed.
+        """
+        full_key = self._key(key)
+        entry = (value, delta, time.time() + timeout)
+        self.l1.set(full_key, entry)
+        self.l2.set(full_key, entry, timeout * 2)
+
+    def delete(self, key):
+        """
+        Remove key from this worker's L1 and the shared L2. Other
+        workers' L1 copies expire within l1_ttl.
+        """
+        full_key = self._key(key)
+        self.l1.delete(full_key)
+        self.l2.delete(full_key)
+
+    def get_or_set(self, key, compute, timeout):
+        full_key = self._key(key)
+
+        entry = self.l1.get(full_key)
+        if entry is not None and not self._expired(entry):
+            record(self.namespace, 'l1_hit')
+            return entry[0]
+
+        entry = self.l2.get(full_key)
+        if entry is not None and not self._expired(entry):
+            record(self.namespace, 'l2_hit')
+            self.l1.set(full_key, entry)
+            return entry[0]
+
+        with self._flight(full_key):
+            # Another thread may have refreshed it while we waited
+            fresh = self.l2.get(full_key)
+            if fresh is not None and not self._expired(fresh):
+                record(self.namespace, 'l2_hit')
+                self.l1.set(full_key, fresh)
+                return fresh[0]
+
+            lock_key = f'{full_key}:lock'
+            if self.l2.add(lock_key, 1, self.lock_timeout):
+                try:
+                    record(self.namespace, 'early_refresh' if entry else 'miss')
+                    return self._compute(key, compute, timeout)
+                finally:
+                    self.l2.delete(lock_key)
+
+            if entry is not None:
+                # Someone else is already recomputing it
+                record(self.namespace, 'stale_hit')
+                return entry[0]
+
+            record(self.namespace, 'lock_wait')
+            deadline = time.time() + self.lock_timeout
+            while time.time() < deadline:
+                time.sleep(self.poll_interval)
+                fresh = self.l2.get(full_key)
+                if fresh is not None:
+                    record(self.namespace, 'l2_hit')
+                    self.l1.set(full_key, fresh)
+                    return fresh[0]
+
+            record(self.namespace, 'miss')
+            return self._compute(key, compute, timeout)
@@ -0,0 +1,248 @@
+import bisect
+import json
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from checkout.models import Order, OrderLineItem
+from checkout.ulid import ulid
+from products.models import Product, Category
+from products.registry import category_registry
+from profiles.models import UserProfile
+
+SIZES = ('xs', 's', 'm', 'l', 'xl')
+ADJECTIVES = ('Classic', 'Slim', 'Relaxed', 'Vintage', 'Organic', 'Striped',
+              'Washed', 'Cropped', 'Essential', 'Heritage', 'Stretch', 'Linen')
+COLOURS = ('Black', 'White', 'Navy', 'Olive', 'Grey', 'Indigo', 'Rust',
+           'Cream', 'Burgundy', 'Khaki', 'Teal', 'Charcoal')
+GARMENTS = ('Jeans', 'Shirt', 'Tee', 'Jacket', 'Hoodie', 'Chinos', 'Dress',
+            'Sweater', 'Shorts', 'Blazer', 'Towel', 'Mug', 'Sheet Set', 'Sock')
+# Garments sold in sizes; the rest are one size
+SIZED = {'Jeans', 'Shirt', 'Tee', 'Jacket', 'Hoodie', 'Chinos', 'Dress',
+         'Sweater', 'Shorts', 'Blazer'}
+FIRST_NAMES = ('Aoife', 'Sean', 'Maria', 'James', 'Priya', 'Liam', 'Chloe',
+               'Tomasz', 'Fatima', 'Oisin', 'Emma', 'Kenji', 'Grace', 'Luca')
+LAST_NAMES = ('Murphy', 'Kelly', 'Byrne', 'Nowak', 'Khan', 'Walsh', 'Smith',
+              'Garcia', 'Ryan', 'Tanaka', 'Rossi', "O'Brien", 'Doyle', 'Lee')
+TOWNS = (('IE', 'Dublin', 'D02 X285'), ('IE', 'Cork', 'T12 W8DE'),
+         ('GB', 'London', 'SW1A 1AA'), ('GB', 'Leeds', 'LS1 4DY'),
+         ('US', 'Boston', '02108'), ('US', 'Austin', '78701'),
+         ('DE', 'Berlin', '10115'), ('FR', 'Lyon', '69001'))
+STREETS = ('Main Street', 'High Street', 'Church Road', 'Station Road',
+           'Park Avenue', 'Mill Lane', 'Green Street', 'Bridge Street')
+
+
+def chunks(total, size):
+    """ (start, count) of each chunk of `size` rows in `total` """
+    return [(start, min(size, total - start)) for start in range(0, total, size)]
+
+
+def create_catalog(category_count, product_count, product_fields,
+                   product_model=Product, category_model=Category, batch_size=None):
+    """
+    Bulk create categories category_0, category_1, ... and product_count
+    products with the fields product_fields(i, categories) returns, for
+    the benchmarks and load test. Commands working at an earlier
+    migration pass its historical models. Returns the categories.
+    """
+    names = [f'category_{i}' for i in range(category_count)]
+    category_model.objects.bulk_create(
+        category_model(name=name, friendly_name=f'Category {i}')
+        for i, name in enumerate(names)
+    )
+    # Read back, as bulk_create doesn't set primary keys on SQLite
+    categories = list(category_model.objects.filter(name__in=names).order_by('pk'))
+    product_model.objects.bulk_create(
+        (product_model(**product_fields(i, categories)) for i in range(product_count)),
+        batch_size=batch_size,
+    )
+    # bulk_create sends no signals
+    category_registry.invalidate()
+    return categories
+
+
+def _rng(seed, kind, first_pk):
+    # Seeded per chunk, so a chunk comes out the same in whichever
+    # process and order it is generated. The seed includes the chunk's
+    # first id so a second run adds new rows rather than repeat the first.
+    return random.Random(f'{seed}:{kind}:{first_pk}')
+
+
+def _wait_for_writers():
+    # SQLite has one writer at a time, and a chunk written by another
+    # process can hold the lock far longer than the default 5s
+    if connection.vendor == 'sqlite':
+        connection.settings_dict['OPTIONS'].setdefault('timeout', 600)
+
+
+def _address(rng):
+    country, town, postcode = rng.choice(TOWNS)
+    return {
+        'country': country,
+        'town_or_city': town,
+        'postcode': postcode,
+        'street_address1': f'{rng.randint(1, 250)} {rng.choice(STREETS)}',
+        'street_address2': '' if rng.random() < 0.8 else f'Apartment {rng.randint(1, 40)}',
+        'county': '',
+        'phone_number': f'0{rng.randint(10 ** 8, 10 ** 9 - 1)}',
+    }
+
+
+def generate_products(seed, start, count, first_pk, category_ids, batch_size):
+    rng = _rng(seed, 'products', first_pk + start)
+    products = []
+    for i in range(start, start + count):
+        garment = rng.choice(GARMENTS)
+        products.append(Product(
+            pk=first_pk + i,
+            category_id=rng.choice(category_ids),
+            sku=f'GEN{first_pk + i:09d}',
+            name=f'{rng.choice(ADJECTIVES)} {rng.choice(COLOURS)} {garment}',
+            description=f'A {garment.lower()} generated for testing at scale.',
+            has_sizes=garment in SIZED,
+            price=Decimal(rng.randint(299, 19999)) / 100,
+            rating=None if rng.random() < 0.15 else Decimal(rng.randint(100, 500)) / 100,
+        ))
+    _wait_for_writers()
+    with transaction.atomic():
+        Product.objects.bulk_create(products, batch_size=batch_size)
+    return count
+
+
+def generate_users(seed, start, count, first_user_pk, first_profile_pk,
+                   password, since, batch_size):
+    """ Users with their profiles, some of which hold a default address """
+    rng = _rng(seed, 'users', first_user_pk + start)
+    users = []
+    profiles = []
+    for i in range(start, start + count):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        user_pk = first_user_pk + i
+        users.append(User(
+            pk=user_pk,
+            username=f'shopper{user_pk}',
+            email=f'shopper{user_pk}@example.com',
+            first_name=first_name,
+            last_name=last_name,
+            password=password,
+            date_joined=since + timedelta(seconds=rng.randint(0, 365 * 86400)),
+        ))
+        profile = UserProfile(pk=first_profile_pk + i, user_id=user_pk)
+        if rng.random() < 0.6:
+            address = _address(rng)
+            profile.default_phone_number = address['phone_number']
+            profile.default_street_address1 = address['street_address1']
+            profile.default_street_address2 = address['street_address2']
+            profile.default_town_or_city = address['town_or_city']
+            profile.default_postcode = address['postcode']
+            profile.default_country = address['country']
+        profiles.append(profile)
+    _wait_for_writers()
+    with transaction.atomic():
+        User.objects.bulk_create(users, batch_size=batch_size)
+        UserProfile.objects.bulk_create(profiles, batch_size=batch_size)
+    return count
+
+
+def _existing(queryset, ids):
+    """ The sorted subset of ids which are primary keys in queryset """
+    found = set()
+    ids = sorted(set(ids))
+    for i in range(0, len(ids), 500):
+        found.update(queryset.filter(pk__in=ids[i:i + 500]).values_list('pk', flat=True))
+    return sorted(found)
+
+
+def _nearest(found, pk):
+    """ pk if it is in sorted list found, otherwise the next one along """
+    return found[bisect.bisect_left(found, pk) % len(found)]
+
+
+@contextmanager
+def _explicit_dates():
+    """ Let bulk_create keep the order dates given rather than use now """
+    field = Order._meta.get_field('date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def generate_orders(seed, start, count, total, first_pk, product_range,
+                    profile_range, since, days, batch_size):
+    """
+    Orders with one to five line items each, spread evenly from `since`
+    over `days` days in primary key order. Seven in ten are placed by a
+    user whose profile pk falls in profile_range, the rest anonymously.
+    """
+    _wait_for_writers()
+    rng = _rng(seed, 'orders', first_pk + start)
+    plans = []
+    for i in range(start, start + count):
+        lines = min(5, 1 + int(rng.expovariate(0.9)))
+        product_ids = [rng.randint(*product_range) for _ in range(lines)]
+        profile_id = (rng.randint(*profile_range)
+                      if profile_range and rng.random() < 0.7 else None)
+        plans.append((i, product_ids, profile_id))
+
+    products = Product.objects.only('price', 'has_sizes').in_bulk(
+        {pk for _, ids, _ in plans for pk in ids})
+    found_products = sorted(products)
+    found_profiles = set(_existing(UserProfile.objects.all(),
+                                   [p for _, _, p in plans if p]))
+
+    span = days * 86400
+    orders = []
+    lineitems = []
+    for i, product_ids, profile_id in plans:
+        date = since + timedelta(seconds=span * i / total + rng.random() * 60)
+        bag = {}
+        for pk in product_ids:
+            product = products[_nearest(found_products, pk)]
+            quantity = rng.randint(1, 3)
+            if product.has_sizes:
+                size = rng.choice(SIZES)
+                entry = bag.setdefault(str(product.pk), {'items_by_size': {}})
+                entry['items_by_size'][size] = quantity
+            elif str(product.pk) not in bag:
+                bag[str(product.pk)] = quantity
+
+        order = Order(
+            pk=first_pk + i,
+            order_number=ulid(date, rng),
+            user_profile_id=profile_id if profile_id in found_profiles else None,
+            full_name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            email=f'customer{first_pk + i}@example.com',
+            date=date,
+            original_bag=json.dumps(bag),
+            stripe_pid=f'pi_{rng.getrandbits(96):024x}',
+            **_address(rng),
+        )
+        order_total = 0
+        item_count = 0
+        for item_id, item_data in bag.items():
+            product = products[int(item_id)]
+            if isinstance(item_data, int):
+                quantities = [(None, item_data)]
+            else:
+                quantities = item_data['items_by_size'].items()
+            for size, quantity in quantities:
+                lineitem_total = product.price * quantity
+                lineitems.append(OrderLineItem(
+                    order_id=order.pk, product_id=product.pk, product_size=size,
+                    quantity=quantity, lineitem_total=lineitem_total))
+                order_total += lineitem_total
+                item_count += quantity
+        order.set_totals(order_total, item_count)
+        orders.append(order)
+
+    with _explicit_dates(), transaction.atomic():
+        Order.objects.bulk_create(orders, batch_size=batch_size)
+        OrderLineItem.objects.bulk_create(lineitems, batch_size=batch_size)
+    return count
@@ -0,0 +1,249 @@
+import hashlib
+import hmac
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+# The steps of one shopper's visit, in the order they happen
+STEPS = (
+    'all_products',
+    'product_detail',
+    'add_to_bag',
+    'adjust_bag',
+    'checkout',
+    'cache_checkout_data',
+    'checkout_submit',
+    'checkout_success',
+    'webhook',
+)
+
+CLIENT_SECRET = re.compile(r'value="([^"]+)" name="client_secret"')
+SUCCESS_URL = re.compile(r'/checkout/checkout_success/(\w+)$')
+
+ADDRESS = {
+    'full_name': 'Load Tester',
+    'email': 'shopper@example.com',
+    'phone_number': '0123456789',
+    'country': 'IE',
+    'postcode': '',
+    'town_or_city': 'Dublin',
+    'street_address1': '1 Main Street',
+    'street_address2': '',
+    'county': '',
+}
+
+
+class StepFailed(Exception):
+    pass
+
+
+class Recorder:
+    """ Latencies and error counts per step, shared by every shopper """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.orders = 0
+
+    def add(self, step, seconds, ok):
+        with self._lock:
+            self.latencies[step].append(seconds)
+            if not ok:
+                self.errors[step] += 1
+
+    def order_placed(self):
+        with self._lock:
+            self.orders += 1
+
+    def summary(self, elapsed):
+        steps = {}
+        for step in STEPS:
+            samples = sorted(self.latencies.get(step, []))
+            if not samples:
+                continue
+
+            def percentile(p):
+                return samples[max(0, math.ceil(p / 100 * len(samples)) - 1)] * 1000
+
+            steps[step] = {
+                'count': len(samples),
+                'errors': self.errors.get(step, 0),
+                'throughput': len(samples) / elapsed,
+                'mean_ms': sum(samples) / len(samples) * 1000,
+                'p50_ms': percentile(50),
+                'p95_ms': percentile(95),
+                'p99_ms': percentile(99),
+                'max_ms': samples[-1] * 1000,
+            }
+        return {
+            'elapsed': elapsed,
+            'orders': self.orders,
+            'orders_per_second': self.orders / elapsed,
+            'steps': steps,
+        }
+
+
+def signed_event(event, secret):
+    """ The body and Stripe-Signature header Stripe would send for event """
+    payload = json.dumps(event)
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(),
+                         hashlib.sha256).hexdigest()
+    return payload, f't={timestamp},v1={signature}'
+
+
+class Shopper:
+    """
+    One simulated customer. Each visit starts a new session, browses
+    to a random product, puts it in the bag and pays for it. Payment
+    is confirmed on the fake Stripe directly, standing in for Stripe.js,
+    and its payment_intent.succeeded webhook delivered straight after.
+    """
+
+    def __init__(self, base_url, product_ids, fake_stripe, wh_secret, recorder, rng):
+        self.base_url = base_url
+        self.product_ids = product_ids
+        self.fake_stripe = fake_stripe
+        self.wh_secret = wh_secret
+        self.recorder = recorder
+        self.rng = rng
+
+    def _request(self, step, method, path, expect=200, **kwargs):
+        kwargs.setdefault('allow_redirects', False)
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, **kwargs)
+        except requests.RequestException as e:
+            self.recorder.add(step, time.perf_counter() - start, False)
+            raise StepFailed(f'{step}: {e}')
+        ok = response.status_code == expect
+        self.recorder.add(step, time.perf_counter() - start, ok)
+        if not ok:
+            raise StepFailed(f'{step}: {method} {path} returned {response.status_code}')
+        return response
+
+    def _post(self, step, path, data, expect=302):
+        data = dict(data, csrfmiddlewaretoken=self.session.cookies.get('csrftoken', ''))
+        return self._request(step, 'POST', path, expect, data=data,
+                             headers={'Referer': self.base_url + path})
+
+    def visit(self):
+        self.session = requests.Session()
+        try:
+            self._request('all_products', 'GET', '/products/')
+            item_id = self.rng.choice(self.product_ids)
+            product_url = f'/products/{item_id}/'
+            self._request('product_detail', 'GET', product_url)
+
+            quantity = self.rng.randint(1, 3)
+            self._post('add_to_bag', f'/bag/add/{item_id}/',
+                       {'quantity': quantity, 'redirect_url': product_url})
+            self._post('adjust_bag', f'/bag/adjust/{item_id}/',
+                       {'quantity': quantity + 1})
+
+            page = self._request('checkout', 'GET', '/checkout/')
+            match = CLIENT_SECRET.search(page.text)
+            if not match:
+                raise StepFailed('checkout: no client secret on the page')
+            client_secret = match.group(1)
+            self._post('cache_checkout_data', '/checkout/cache_checkout_data/',
+                       {'client_secret': client_secret, 'save_info': ''}, expect=200)
+
+            pid = client_secret.split('_secret')[0]
+            intent = self._confirm(pid)
+            response = self._post('checkout_submit', '/checkout/',
+                                  dict(ADDRESS, client_secret=client_secret))
+            location = response.headers.get('Location', '')
+            if not SUCCESS_URL.search(location):
+                raise StepFailed(f'checkout_submit: redirected to {location}')
+            self._request('checkout_success', 'GET', location)
+            self.recorder.order_placed()
+
+            payload, signature = signed_event(self._event(intent), self.wh_secret)
+            self._request('webhook', 'POST', '/checkout/wh/', data=payload,
+                          headers={'Content-Type': 'application/json',
+                                   'Stripe-Signature': signature})
+        finally:
+            self.session.close()
+
+    def _confirm(self, pid):
+        intent = self.fake_stripe.intents[pid]
+        intent['status'] = 'succeeded'
+        intent['charges'] = {'data': [{
+            'amount': intent['amount'],
+            'billing_details': {'email': ADDRESS['email']},
+        }]}
+        intent['shipping'] = {
+            'name': ADDRESS['full_name'],
+            'phone': ADDRESS['phone_number'],
+            'address': {'country': ADDRESS['country'], 'postal_code': '',
+                        'city': ADDRESS['town_or_city'],
+                        'line1': ADDRESS['street_address1'],
+                        'line2': '', 'state': ''},
+        }
+        return intent
+
+    def _event(self, intent):
+        return {
+            'id': f'evt_{intent["id"][3:]}',
+            'object': 'event',
+            'type': 'payment_intent.succeeded',
+            'data': {'object': intent},
+        }
+
+
+def run(base_url, product_ids, fake_stripe, wh_secret, shoppers=10,
+        iterations=None, duration=None, seed=0, on_error=None):
+    """
+    Run `shoppers` concurrent shoppers against base_url until each has
+    made `iterations` visits or `duration` seconds have passed, and
+    return the per-step summary. on_error is called with each failure.
+    """
+    recorder = Recorder()
+    deadline = time.monotonic() + duration if duration else None
+
+    def shop(number):
+        shopper = Shopper(base_url, product_ids, fake_stripe, wh_secret,
+                          recorder, random.Random(f'{seed}:{number}'))
+        visits = 0
+        while iterations is None or visits < iterations:
+            if deadline and time.monotonic() >= deadline:
+                break
+            visits += 1
+            try:
+                shopper.visit()
+            except StepFailed as e:
+                if on_error:
+                    on_error(e)
+
+    threads = [threading.Thread(target=shop, args=(n,)) for n in range(shoppers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.summary(time.perf_counter() - start)
+
+
+def compare(previous, current):
+    """
+    Rows of (step, metric, before, after, change %) for the throughput
+    and latency percentiles of the steps in both results
+    """
+    rows = []
+    for step, after in current['steps'].items():
+        before = previous.get('steps', {}).get(step)
+        if not before:
+            continue
+        for metric in ('throughput', 'p50_ms', 'p95_ms', 'p99_ms'):
+            old, new = before[metric], after[metric]
+            change = (new - old) / old * 100 if old else 0.0
+            rows.append((step, metric, old, new, change))
+    return rows
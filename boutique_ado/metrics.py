@@ -0,0 +1,74 @@
+import logging
+import math
+import threading
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+# Recent samples kept per timer for the percentiles
+SAMPLES = 1000
+
+_lock = threading.Lock()
+_timers = {}
+_counters = Counter()
+
+
+class _Timer:
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=SAMPLES)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def snapshot(self):
+        samples = sorted(self.samples)
+
+        def percentile(p):
+            return samples[max(0, math.ceil(p / 100 * len(samples)) - 1)]
+
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000,
+            'max_ms': self.max * 1000,
+            'p50_ms': percentile(50) * 1000,
+            'p95_ms': percentile(95) * 1000,
+            'p99_ms': percentile(99) * 1000,
+        }
+
+
+def observe(name, seconds):
+    """ Record one timing, in seconds, for name. Kept per worker. """
+    with _lock:
+        _timers.setdefault(name, _Timer()).add(seconds)
+    logger.debug('%s %.1fms', name, seconds * 1000)
+
+
+def increment(name, count=1):
+    with _lock:
+        _counters[name] += count
+
+
+def timings(prefix=''):
+    """ Count, mean, max and percentiles for every timer under prefix """
+    with _lock:
+        return {name: timer.snapshot() for name, timer in _timers.items()
+                if name.startswith(prefix)}
+
+
+def counters(prefix=''):
+    with _lock:
+        return {name: count for name, count in _counters.items()
+                if name.startswith(prefix)}
+
+
+def reset_metrics():
+    with _lock:
+        _timers.clear()
+        _counters.clear()
@@ -0,0 +1,135 @@
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Statements Django issues around transactions, which aren't the view's doing
+TRANSACTION_SQL = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+_django_dir = os.path.dirname(os.path.dirname(sys.modules['django'].__file__))
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _call_site():
+    """
+    file:line of the innermost frame in the project's own code, which
+    for queries run while rendering a template is the view's render call
+    """
+    frame = sys._getframe(2)
+    while frame:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(str(settings.BASE_DIR))
+                and not filename.startswith(_django_dir)
+                and filename != __file__):
+            path = os.path.relpath(filename, settings.BASE_DIR)
+            return f'{path}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return '<django>'
+
+
+class QueryLog:
+    """
+    Records the SQL, duration and call site of every query run on any
+    database connection while it is active:
+
+        with QueryLog() as log:
+            ...
+        log.count, log.duration, log.duplicates()
+    """
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if not sql.startswith(TRANSACTION_SQL):
+                self.queries.append((sql, time.perf_counter() - start, _call_site()))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration, _ in self.queries)
+
+    def duplicates(self):
+        """
+        (sql, times run, call sites) of every statement run more than
+        once, whatever its parameters, most repeated first. An N+1 shows
+        up here as one statement run once per row.
+        """
+        runs = defaultdict(list)
+        for sql, _, site in self.queries:
+            runs[sql].append(site)
+        repeated = [(sql, len(sites), sorted(set(sites)))
+                    for sql, sites in runs.items() if len(sites) > 1]
+        return sorted(repeated, key=lambda r: -r[1])
+
+    def report(self):
+        lines = [f'{self.count} queries in {self.duration * 1000:.1f}ms']
+        for sql, times, sites in self.duplicates():
+            lines.append(f'  {times}x {sql[:200]}')
+            lines.extend(f'      from {site}' for site in sites)
+        return '\n'.join(lines)
+
+
+class QueryBudgetMiddleware:
+    """
+    Counts the queries each request runs and the time they take, and
+    warns of any statement run more than once. GET requests to views
+    named in QUERY_BUDGETS that run more queries than their budget are
+    logged, or with QUERY_BUDGET_STRICT, as in tests, fail with
+    QueryBudgetExceeded. Only used in development and tests.
+    """
+
+    def __init__(self, get_response):
+        if not (settings.DEBUG or settings.TESTING):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryLog() as log:
+            response = self.get_response(request)
+
+        response['X-DB-Queries'] = str(log.count)
+        response['X-DB-Time'] = f'{log.duration * 1000:.1f}ms'
+
+        match = request.resolver_match
+        view_name = match.view_name if match else request.path
+        # Saving a form legitimately runs queries for every row submitted
+        budget = None
+        if request.method in ('GET', 'HEAD'):
+            budget = settings.QUERY_BUDGETS.get(view_name)
+        if budget is not None and log.count > budget:
+            message = f'{view_name} ran more than its budget of {budget} queries: {log.report()}'
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        elif settings.DEBUG and log.duplicates():
+            logger.warning('%s repeated queries: %s', view_name, log.report())
+        return response
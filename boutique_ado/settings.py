@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
+import tempfile
 import dj_database_url
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -26,6 +28,7 @@ SECRET_KEY = os.environ.get('SECRET_KEY', '')
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = 'DEVELOPMENT' in os.environ
+TESTING = sys.argv[1:2] == ['test']
 
 ALLOWED_HOSTS = ['mattjboland-boutique-ado.herokuapp.com', 'localhost']
 
@@ -48,6 +51,8 @@ INSTALLED_APPS = [
     'bag',
     'checkout',
     'profiles',
+    'jobs',
+    'profiler',
 
     # Other
     'crispy_forms',
@@ -55,11 +60,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'boutique_ado.query_budget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'profiler.middleware.RequestProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -83,7 +90,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.media',
-                'bag.contexts.bag_contents',
+                'bag.contexts.bag_context',
             ],
 
             # Now normally if you are going to use crispy forms in a couple
@@ -131,6 +138,7 @@ ACCOUNT_EMAIL_REQUIRED = True
 ACCOUNT_EMAIL_VERIFICATION = 'mandatory'
 ACCOUNT_SIGNUP_EMAIL_ENTER_TWICE = True
 ACCOUNT_USERNAME_MIN_LENGTH = 4
+ACCOUNT_ADAPTER = 'profiles.adapter.AccountAdapter'
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/'
 
@@ -151,6 +159,29 @@ else:
             'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
         }
     }
+# Cache
+# The default cache is the shared L2 behind boutique_ado.cache.TieredCache,
+# so it must be visible to every gunicorn worker. Its add() and incr() must
+# also be atomic across processes, as single-flight locks and version
+# counters rely on them: Django's own FileBasedCache is not, so the file
+# cache here locks them with fcntl, which works on a single host. Point
+# CACHES at Redis or Memcached to share it between hosts. Tests get a cache
+# of their own rather than the dev server's.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'boutique_ado.cache.LockingFileBasedCache',
+        'LOCATION': os.environ.get(
+            'CACHE_DIR', os.path.join(tempfile.gettempdir(), 'boutique_ado_cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+if TESTING:
+    CACHES['default']['LOCATION'] = os.path.join(
+        tempfile.gettempdir(), 'boutique_ado_test_cache')
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -291,10 +322,75 @@ But for consistency, I'm adding it here anyway."""
 
 FREE_DELIVERY_THRESHOLD = 50
 STANDARD_DELIVERY_PERCENTAGE = 10
+PRODUCTS_PER_PAGE = 24
+ORDERS_PER_PAGE = 10
+PRODUCT_LISTING_CACHE_SIZE = 256
+PRODUCT_LISTING_CACHE_TTL = 300
+PRODUCT_IMAGE_WIDTHS = [240, 480, 960]
+THUMBNAIL_WORKERS = 2
+JOB_BATCH_SIZE = 50
+JOB_MAX_ATTEMPTS = 5
+# Seconds before a failed job's first retry, doubling with each attempt
+JOB_RETRY_DELAY = 30
+# Seconds a worker has to finish a job before another may take it over
+JOB_LEASE = 300
+# Where manage.py benchmark keeps its baseline timings, and the percentage
+# slowdown against them that fails a run
+BENCHMARK_BASELINE = BASE_DIR / 'benchmarks.json'
+BENCHMARK_REGRESSION_THRESHOLD = 20
+# Most queries a GET of each view may run, checked in development and tests
+# by QueryBudgetMiddleware. Strict mode fails the request rather than logging.
+QUERY_BUDGETS = {
+    'home': 5,
+    'products': 5,
+    'product_detail': 5,
+    'view_bag': 4,
+    'checkout_success': 7,
+    'profile': 6,
+    'order_history': 5,
+    'admin:checkout_order_changelist': 5,
+    'admin:checkout_order_change': 7,
+    'admin:products_product_changelist': 5,
+    'admin:products_product_change': 5,
+}
+QUERY_BUDGET_STRICT = TESTING
+# Where request profiles are kept, outside MEDIA_ROOT as only the admin
+# serves them, and how many of the newest are kept
+PROFILER_ROOT = os.getenv('PROFILER_ROOT', os.path.join(BASE_DIR, 'request_profiles'))
+PROFILER_KEEP = 500
+# Fraction of all requests profiled at random, e.g. 0.001
+PROFILER_SAMPLE_RATE = float(os.getenv('PROFILER_SAMPLE_RATE', '0'))
+# Seconds a token from manage.py profile_token profiles requests for
+PROFILER_TOKEN_MAX_AGE = 3600
+# Frames kept of each allocation's traceback, and rows in each profile's summary
+PROFILER_TRACEBACK_DEPTH = 10
+PROFILER_SUMMARY_LINES = 25
 STRIPE_CURRENCY = 'usd'
 STRIPE_PUBLIC_KEY = os.getenv('STRIPE_PUBLIC_KEY', '')
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
 STRIPE_WH_SECRET = os.getenv('STRIPE_WH_SECRET', '')
+# Seconds before an event whose processing never finished may be retried,
+# and days processed event ids are kept to spot redeliveries
+STRIPE_WH_CLAIM_TIMEOUT = 300
+STRIPE_WH_EVENT_RETENTION_DAYS = 30
+# Threads processing webhook events, and retries of events that fail
+STRIPE_WH_DRAIN_WORKERS = 4
+STRIPE_WH_MAX_ATTEMPTS = 10
+STRIPE_WH_RETRY_DELAY = 30
+# Overridden to use a local stand-in such as `manage.py fake_stripe`
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE', 'https://api.stripe.com')
+# Seconds to wait for a connection and for a response
+STRIPE_CONNECT_TIMEOUT = 3
+STRIPE_TIMEOUT = 10
+STRIPE_MAX_RETRIES = 2
+STRIPE_RETRY_DELAY = 0.5
+STRIPE_POOL_SIZE = 10
+# Consecutive failures that open the circuit, and seconds it stays open
+STRIPE_BREAKER_THRESHOLD = 5
+STRIPE_BREAKER_RESET = 30
+# Seconds to wait for the checkout form before a webhook creates the order,
+# and the base retry delay should creating it fail
+CHECKOUT_RECONCILE_DELAY = 60
 
 # The last thing we need to do is add the DEFAULT_FROM_EMAIL to settings.py
 
@@ -37,12 +37,53 @@
 
 
 from django.contrib import admin
-from .models import Order, OrderLineItem
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.forms.models import BaseInlineFormSet
+from profiles.models import UserProfile
+from .models import Order, OrderLineItem, PendingPayment
+from .signals import defer_total_updates
+
+
+class LineItemProductSelect(AutocompleteSelect):
+    """
+    Product autocomplete which labels the product already on a line item
+    from the line item, rather than querying for it once per row
+    """
+    product = None
+
+    def optgroups(self, name, value, attr=None):
+        product = self.product
+        if product is None or [str(v) for v in value] != [str(product.pk)]:
+            return super().optgroups(name, value, attr)
+        label = self.choices.field.label_from_instance(product)
+        return [(None, [self.create_option(name, product.pk, label, True, 0)], 0)]
+
+
+class OrderLineItemFormSet(BaseInlineFormSet):
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        if form.instance.product_id:
+            # The admin wraps the widget to add its add/change links
+            form.fields['product'].widget.widget.product = form.instance.product
+        return form
 
 
 class OrderLineItemAdminInline(admin.TabularInline):
     model = OrderLineItem
+    formset = OrderLineItemFormSet
     readonly_fields = ('lineitem_total',)
+    # Rather than a <select> of the whole catalog on every row
+    autocomplete_fields = ('product',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'product':
+            kwargs['widget'] = LineItemProductSelect(
+                db_field.remote_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
 class OrderAdmin(admin.ModelAdmin):
@@ -66,5 +107,27 @@ class OrderAdmin(admin.ModelAdmin):
 
     ordering = ('-date',)
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # Each profile option is labelled with its user's name
+        if db_field.name == 'user_profile':
+            kwargs['queryset'] = UserProfile.objects.select_related('user')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def save_related(self, request, form, formsets, change):
+        """ Update the order's totals once rather than for every line item """
+        with defer_total_updates():
+            super().save_related(request, form, formsets, change)
+
 
 admin.site.register(Order, OrderAdmin)
+
+
+class PendingPaymentAdmin(admin.ModelAdmin):
+    readonly_fields = ('stripe_pid', 'intent', 'created', 'last_error')
+
+    list_display = ('stripe_pid', 'created', 'check_after', 'attempts')
+
+    ordering = ('check_after',)
+
+
+admin.site.register(PendingPayment, PendingPaymentAdmin)
@@ -0,0 +1,223 @@
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from boutique_ado import metrics
+from .models import WebhookEvent, WebhookOrderLease
+from .webhook_handler import StripeWH_Handler
+
+import stripe
+
+
+def _order_key(event):
+    obj = event['data']['object']
+    if obj.get('object') == 'payment_intent':
+        return obj['id']
+    return obj.get('payment_intent') or event['id']
+
+
+def enqueue_event(event):
+    """
+    Store a verified event for the drain to process, returning False if
+    it had already been received
+    """
+    _, created = WebhookEvent.objects.get_or_create(
+        event_id=event['id'],
+        defaults={
+            'event_type': event['type'],
+            'payload': event.to_dict_recursive(),
+            'order_key': _order_key(event),
+            'received': timezone.now(),
+        },
+    )
+    return created
+
+
+def _pending(now):
+    return WebhookEvent.objects.filter(
+        processed_at__isnull=True,
+        attempts__lt=settings.STRIPE_WH_MAX_ATTEMPTS,
+    ).filter(Q(claimed_until__isnull=True) | Q(claimed_until__lt=now))
+
+
+def queue_stats(now=None):
+    """
+    The number of events waiting to be processed and how long, in
+    seconds, the oldest of them has waited
+    """
+    now = now or timezone.now()
+    pending = WebhookEvent.objects.filter(
+        processed_at__isnull=True, attempts__lt=settings.STRIPE_WH_MAX_ATTEMPTS)
+    oldest = pending.aggregate(oldest=Min('received'))['oldest']
+    return {
+        'depth': pending.count(),
+        'lag_seconds': (now - oldest).total_seconds() if oldest else 0,
+    }
+
+
+def handle_event(event):
+    """ Pass a stripe event to the matching StripeWH_Handler method """
+    handler = StripeWH_Handler(None)
+
+    # Map webhook events to relevant handler functions
+    event_map = {
+        'payment_intent.succeeded': handler.handle_payment_intent_succeeded,
+        'payment_intent.payment_failed': handler.handle_payment_intent_payment_failed,
+    }
+    return event_map.get(event['type'], handler.handle_event)(event)
+
+
+def _claim(event, now):
+    """
+    Lease event to this drain, returning False if another drain has
+    claimed it since it was read
+    """
+    lease = now + timedelta(seconds=settings.STRIPE_WH_CLAIM_TIMEOUT)
+    claimed = WebhookEvent.objects.filter(
+        pk=event.pk, processed_at__isnull=True, claimed_until=event.claimed_until,
+    ).update(claimed_until=lease)
+    return bool(claimed)
+
+
+def process_event(event_row):
+    """ Run one claimed event, returning whether it succeeded """
+    start = time.perf_counter()
+    event = stripe.Event.construct_from(event_row.payload, settings.STRIPE_SECRET_KEY)
+    try:
+        response = handle_event(event)
+        error = ''
+        if response.status_code >= 400:
+            error = response.content.decode() or f'HTTP {response.status_code}'
+    except Exception as e:
+        error = repr(e)
+
+    now = timezone.now()
+    metrics.observe('webhooks.process', time.perf_counter() - start)
+    if error:
+        metrics.increment('webhooks.failed')
+        attempts = event_row.attempts + 1
+        delay = settings.STRIPE_WH_RETRY_DELAY * 2 ** (attempts - 1)
+        WebhookEvent.objects.filter(pk=event_row.pk).update(
+            attempts=attempts, last_error=error,
+            claimed_until=now + timedelta(seconds=delay))
+        return False
+
+    metrics.observe('webhooks.lag', (now - event_row.received).total_seconds())
+    WebhookEvent.objects.filter(pk=event_row.pk).update(processed_at=now, last_error='')
+    return True
+
+
+def _lease_order(order_key, now):
+    """
+    Take the lease on an order's events, returning its token, or None if
+    another drain holds it. Leases are rows in the database, so drains in
+    any process or on any host see each other's.
+    """
+    token = uuid.uuid4().hex
+    lease = now + timedelta(seconds=settings.STRIPE_WH_CLAIM_TIMEOUT)
+    # Take over a lease whose drain died without releasing it
+    if WebhookOrderLease.objects.filter(
+            order_key=order_key, leased_until__lt=now,
+    ).update(token=token, leased_until=lease):
+        return token
+    try:
+        with transaction.atomic():
+            WebhookOrderLease.objects.create(order_key=order_key, token=token,
+                                             leased_until=lease)
+    except IntegrityError:
+        return None
+    return token
+
+
+def _waiting_before(order_key, event, now):
+    """
+    Whether an earlier event for the order failed and is waiting to be
+    retried, which the event must not overtake
+    """
+    return WebhookEvent.objects.filter(
+        order_key=order_key, processed_at__isnull=True,
+        attempts__lt=settings.STRIPE_WH_MAX_ATTEMPTS, claimed_until__gt=now,
+    ).filter(
+        Q(received__lt=event.received) | Q(received=event.received, pk__lt=event.pk)
+    ).exists()
+
+
+def _drain_group(order_key, events, now):
+    """
+    Process one order's events in the order they arrived, holding a
+    lease on the order so no other drain processes them at the same time.
+    Nothing runs while an earlier event waits to be retried.
+    """
+    token = _lease_order(order_key, now)
+    if token is None:
+        return 0, 0
+    done = failed = 0
+    try:
+        if _waiting_before(order_key, events[0], now):
+            return 0, 0
+        for event in events:
+            if not _claim(event, now):
+                # Later events wait for this one, wherever it went
+                break
+            if process_event(event):
+                done += 1
+            else:
+                failed += 1
+                # Later events for the order may depend on this one
+                break
+    finally:
+        WebhookOrderLease.objects.filter(order_key=order_key, token=token).delete()
+    return done, failed
+
+
+def _drain_group_in_thread(*args):
+    try:
+        return _drain_group(*args)
+    finally:
+        connections.close_all()
+
+
+def drain(workers=0, batch_size=100, now=None):
+    """
+    Process up to batch_size pending events, the oldest first. Each
+    order's events run one after another while different orders run on
+    up to `workers` threads, or inline if workers is 0.
+    Returns the number processed and the number that failed.
+    """
+    now = now or timezone.now()
+    groups = OrderedDict()
+    for event in _pending(now).order_by('received', 'pk')[:batch_size]:
+        groups.setdefault(event.order_key, []).append(event)
+
+    if workers > 0:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                lambda group: _drain_group_in_thread(*group, now),
+                groups.items()))
+    else:
+        results = [_drain_group(key, events, now) for key, events in groups.items()]
+    return (sum(done for done, _ in results),
+            sum(failed for _, failed in results))
+
+
+def prune_events(older_than, batch_size=1000):
+    """
+    Delete processed events received before older_than, batch_size rows
+    at a time so no single delete holds locks for long. Returns the
+    number deleted.
+    """
+    deleted = 0
+    while True:
+        batch = list(WebhookEvent.objects.filter(
+            received__lt=older_than, processed_at__isnull=False,
+        ).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        deleted += WebhookEvent.objects.filter(pk__in=batch).delete()[0]
@@ -0,0 +1,149 @@
+import json
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+INTENT_PATH = re.compile(r'^/v1/payment_intents(?:/(?P<id>[\w]+))?$')
+
+
+def _decode_form(body):
+    """ Stripe's form encoding, with metadata[key]=value nested one level """
+    data = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        match = re.match(r'^(\w+)\[(\w+)\]$', key)
+        if match:
+            data.setdefault(match.group(1), {})[match.group(2)] = value
+        else:
+            data[key] = value
+    return data
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep connections alive, as Stripe does
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._respond(status, {'error': {
+            'type': 'invalid_request_error', 'message': message}})
+
+    def _handle(self):
+        server = self.server.fake
+        length = int(self.headers.get('Content-Length') or 0)
+        params = _decode_form(self.rfile.read(length).decode())
+        server.requests.append((self.command, self.path, params))
+        server.connections.add(self.client_address)
+        if server.latency:
+            time.sleep(server.latency)
+        if server.failures:
+            server.failures -= 1
+            return self._respond(500, {'error': {
+                'type': 'api_error', 'message': 'Simulated failure'}})
+
+        match = INTENT_PATH.match(self.path.split('?')[0])
+        if not match:
+            return self._error(404, f'Unrecognized request URL ({self.path})')
+        pid = match.group('id')
+        if pid is None:
+            if self.command != 'POST':
+                return self._error(405, 'Listing intents is not supported')
+            return self._respond(200, server.create_intent(params))
+
+        intent = server.intents.get(pid)
+        if intent is None:
+            return self._error(404, f'No such payment_intent: {pid}')
+        if self.command == 'POST':
+            if intent['status'] in ('succeeded', 'canceled'):
+                return self._error(
+                    400, f'This PaymentIntent has a status of {intent["status"]}')
+            intent['metadata'].update(params.pop('metadata', {}))
+            if 'amount' in params:
+                params['amount'] = int(params['amount'])
+            intent.update(params)
+        self._respond(200, intent)
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    block_on_close = False
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up before the response is written
+        pass
+
+
+class FakeStripe:
+    """
+    A local stand-in for the parts of the Stripe API checkout uses,
+    for exercising the payment flow offline. Every request is recorded
+    in requests and the client address of every connection used in
+    connections. latency seconds are added to each request, and the
+    next `failures` requests get a 500 response.
+
+        with FakeStripe(latency=0.2) as fake:
+            stripe.api_base = fake.url
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0):
+        self.latency = latency
+        self.intents = {}
+        self.requests = []
+        self.connections = set()
+        self.failures = 0
+        self._server = _Server((host, port), _Handler)
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def create_intent(self, params):
+        pid = f'pi_{secrets.token_hex(12)}'
+        intent = {
+            'id': pid,
+            'object': 'payment_intent',
+            'amount': int(params.get('amount', 0)),
+            'currency': params.get('currency', 'usd'),
+            'client_secret': f'{pid}_secret_{secrets.token_hex(12)}',
+            'status': 'requires_payment_method',
+            'metadata': params.get('metadata', {}),
+        }
+        self.intents[pid] = intent
+        return intent
+
+    def serve_forever(self):
+        self._server.serve_forever(poll_interval=0.05)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,74 @@
+import hashlib
+import json
+
+from django.conf import settings
+
+from .models import Order, PendingPayment
+from .stripe_client import stripe_client
+
+import stripe
+
+SESSION_KEY = 'payment_intent'
+# Statuses in which Stripe.js can still confirm an intent
+PAYABLE_STATUSES = ('requires_payment_method', 'requires_confirmation')
+
+
+def _bag_hash(bag):
+    return hashlib.sha256(json.dumps(bag, sort_keys=True).encode()).hexdigest()
+
+
+def _remember(request, intent, bag):
+    request.session[SESSION_KEY] = {
+        'id': intent.id,
+        'client_secret': intent.client_secret,
+        'amount': intent.amount,
+        'currency': intent.currency,
+        'bag_hash': _bag_hash(bag),
+    }
+    return intent.client_secret
+
+
+def _paid(pid):
+    """
+    Whether the intent has an order, or a payment waiting for one, which
+    happens when the shopper never reaches checkout_success to forget it
+    """
+    return (Order.objects.filter(stripe_pid=pid).exists()
+            or PendingPayment.objects.filter(stripe_pid=pid).exists())
+
+
+def payment_intent_secret(request, bag, amount):
+    """
+    The client secret of the PaymentIntent for this checkout. The intent
+    is kept in the session so reloading the checkout page with the same
+    bag doesn't call Stripe at all, and a changed bag only updates the
+    intent's amount. An intent that has been paid is never reused.
+    """
+    stored = request.session.get(SESSION_KEY)
+    if (stored and stored['currency'] == settings.STRIPE_CURRENCY
+            and not _paid(stored['id'])):
+        try:
+            if stored['amount'] != amount:
+                intent = stripe_client().modify_payment_intent(stored['id'], amount=amount)
+                return _remember(request, intent, bag)
+            if stored['bag_hash'] == _bag_hash(bag):
+                return stored['client_secret']
+            # A different bag with the same total, most likely on a later
+            # visit, so check with Stripe the intent can still be paid
+            intent = stripe_client().retrieve_payment_intent(stored['id'])
+            if intent.status in PAYABLE_STATUSES:
+                return _remember(request, intent, bag)
+        except stripe.error.InvalidRequestError:
+            # Already paid or cancelled, so start a new one
+            pass
+
+    intent = stripe_client().create_payment_intent(
+        amount=amount,
+        currency=settings.STRIPE_CURRENCY,
+    )
+    return _remember(request, intent, bag)
+
+
+def forget_payment_intent(request):
+    """ Stop reusing the session's PaymentIntent once it has been paid """
+    request.session.pop(SESSION_KEY, None)
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from checkout.events import drain, queue_stats
+
+
+class Command(BaseCommand):
+    help = 'Process the Stripe webhook events queued by the webhook endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.STRIPE_WH_DRAIN_WORKERS,
+                            help='Orders processed in parallel; 0 runs inline')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--once', action='store_true',
+                            help='Process the events pending now, then exit')
+        parser.add_argument('--interval', type=float, default=0.5,
+                            help='Seconds to wait when no events are pending')
+
+    def handle(self, *args, **options):
+        while True:
+            done, failed = drain(options['workers'], options['batch_size'])
+            if done or failed:
+                stats = queue_stats()
+                self.stdout.write(
+                    f'Processed {done} events, {failed} failed; '
+                    f'{stats["depth"]} pending, oldest {stats["lag_seconds"]:.1f}s')
+            if options['once'] and done + failed < options['batch_size']:
+                return
+            if not done and not failed:
+                time.sleep(options['interval'])
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from checkout.fake_stripe import FakeStripe
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a local stand-in for the Stripe API. Point the site at it '
+        'by setting STRIPE_API_BASE to the URL it prints.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=12111)
+        parser.add_argument('--latency', type=float, default=0,
+                            help='Seconds to add to every request')
+
+    def handle(self, *args, **options):
+        fake = FakeStripe(port=options['port'], latency=options['latency'])
+        self.stdout.write(f'Fake Stripe listening on {fake.url}')
+        try:
+            fake.serve_forever()
+        except KeyboardInterrupt:
+            fake.stop()
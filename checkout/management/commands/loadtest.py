@@ -0,0 +1,160 @@
+import json
+import os
+import random
+import tempfile
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer
+from django.db import connection
+from django.test.testcases import QuietWSGIRequestHandler
+from django.test.utils import override_settings
+
+from boutique_ado import datagen, loadtest
+from checkout.events import queue_stats
+from checkout.fake_stripe import FakeStripe
+from products.models import Product
+
+WH_SECRET = 'whsec_loadtest'
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive concurrent simulated shoppers from the product list through '
+        'to a paid order and its webhook, against a throwaway test database, '
+        'a local fake Stripe and the locmem mail backend. Reports throughput '
+        'and p50/p95/p99 latency per step.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shoppers', type=int, default=10)
+        parser.add_argument('--iterations', type=int, default=None,
+                            help='Visits per shopper (default 5 unless --duration is given)')
+        parser.add_argument('--duration', type=float, default=None,
+                            help='Stop after this many seconds')
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--stripe-latency', type=float, default=0,
+                            help='Seconds the fake Stripe adds to every request')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Compare with the results in this JSON file')
+
+    def handle(self, *args, **options):
+        if options['iterations'] is None and options['duration'] is None:
+            options['iterations'] = 5
+        previous = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    previous = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Cannot read {options["compare"]}: {e}')
+
+        old_name, test_file = self._create_database()
+        try:
+            product_ids = self._populate(options)
+            with FakeStripe(latency=options['stripe_latency']) as fake, \
+                    self._serve() as base_url, \
+                    override_settings(
+                        ALLOWED_HOSTS=['*'],
+                        STRIPE_API_BASE=fake.url,
+                        STRIPE_PUBLIC_KEY='pk_test_loadtest',
+                        STRIPE_SECRET_KEY='sk_test_loadtest',
+                        STRIPE_WH_SECRET=WH_SECRET,
+                        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+                results = loadtest.run(
+                    base_url, product_ids, fake, WH_SECRET,
+                    shoppers=options['shoppers'],
+                    iterations=options['iterations'],
+                    duration=options['duration'],
+                    seed=options['seed'],
+                    on_error=lambda e: self.stderr.write(str(e)),
+                )
+                results['webhook_queue'] = queue_stats()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if test_file and os.path.exists(test_file):
+                os.remove(test_file)
+
+        results['config'] = {
+            key: options[key] for key in
+            ('shoppers', 'iterations', 'duration', 'products', 'seed', 'stripe_latency')
+        }
+        results['config']['database'] = connection.vendor
+        self._report(results, previous)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+    def _create_database(self):
+        """
+        A test database the server threads can all share. SQLite's
+        default in-memory test database is private to each connection,
+        so it is put in a temporary file instead. SQLite still lets only
+        one transaction write at a time, and one that has already read
+        gives up at once rather than wait, so expect errors on checkout
+        under load; set DATABASE_URL for figures from PostgreSQL.
+        """
+        test_file = None
+        if connection.vendor == 'sqlite':
+            fd, test_file = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(fd)
+            connection.settings_dict['TEST']['NAME'] = test_file
+            # Every request writes its session, so shoppers queue for the lock
+            connection.settings_dict['OPTIONS'].setdefault('timeout', 30)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        return old_name, test_file
+
+    def _populate(self, options):
+        rng = random.Random(options['seed'])
+        datagen.create_catalog(10, options['products'], lambda i, categories: {
+            'category': rng.choice(categories),
+            'sku': f'SKU{i:08d}',
+            'name': f'Product {i}',
+            'description': '',
+            'price': Decimal(rng.randint(100, 9999)) / 100,
+            'rating': Decimal(rng.randint(0, 500)) / 100,
+        })
+        return list(Product.objects.values_list('pk', flat=True))
+
+    @contextmanager
+    def _serve(self):
+        """ Serve the site from a thread, yielding its base URL """
+        httpd = ThreadedWSGIServer(
+            ('127.0.0.1', 0), QuietWSGIRequestHandler, allow_reuse_address=False)
+        httpd.set_app(WSGIHandler())
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        host, port = httpd.server_address[:2]
+        try:
+            yield f'http://{host}:{port}'
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+
+    def _report(self, results, previous):
+        self.stdout.write(
+            f'{results["config"]["shoppers"]} shoppers, {results["orders"]} orders '
+            f'in {results["elapsed"]:.1f}s ({results["orders_per_second"]:.1f} orders/s)\n')
+        self.stdout.write(
+            f'{"step":<20} {"count":>6} {"errors":>6} {"req/s":>8} '
+            f'{"p50":>9} {"p95":>9} {"p99":>9}')
+        for step, s in results['steps'].items():
+            self.stdout.write(
+                f'{step:<20} {s["count"]:>6} {s["errors"]:>6} {s["throughput"]:>8.1f} '
+                f'{s["p50_ms"]:>7.1f}ms {s["p95_ms"]:>7.1f}ms {s["p99_ms"]:>7.1f}ms')
+        queue = results['webhook_queue']
+        self.stdout.write(
+            f'\nWebhook queue: {queue["depth"]} events waiting, '
+            f'oldest {queue["lag_seconds"]:.1f}s')
+        if results['config']['database'] == 'sqlite':
+            self.stdout.write('SQLite serialises writes; set DATABASE_URL to test against PostgreSQL')
+
+        if previous:
+            self.stdout.write(f'\n{"step":<20} {"metric":<10} {"before":>10} {"after":>10} {"change":>8}')
+            for step, metric, old, new, change in loadtest.compare(previous, results):
+                self.stdout.write(
+                    f'{step:<20} {metric:<10} {old:>10.1f} {new:>10.1f} {change:>+7.1f}%')
@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from checkout.events import prune_events
+
+
+class Command(BaseCommand):
+    help = 'Delete the record of Stripe webhook events older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.STRIPE_WH_EVENT_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted = prune_events(cutoff, options['batch_size'])
+        self.stdout.write(f'Deleted {deleted} webhook events')
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from checkout.reconciliation import reconcile_due
+
+
+class Command(BaseCommand):
+    help = (
+        'Create the orders for paid payment intents whose checkout form '
+        'never arrived, and send their confirmation emails'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running, checking every this many seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            done, failed = reconcile_due()
+            if done or failed or not options['interval']:
+                self.stdout.write(f'Reconciled {done} payments, {failed} failed')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
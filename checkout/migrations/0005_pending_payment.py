@@ -0,0 +1,30 @@
+# Generated by Django 3.1.3 on 2026-10-18 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0004_order_user_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingPayment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe_pid', models.CharField(max_length=254, unique=True)),
+                ('intent', models.JSONField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('check_after', models.DateTimeField(db_index=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='stripe_pid',
+            field=models.CharField(db_index=True, default='', max_length=254),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 3.1.3 on 2026-10-18 08:51
+
+from django.db import migrations, models
+from django.db.models import Count
+
+from checkout.ulid import ulid
+
+
+def number_unnumbered_orders(apps, schema_editor):
+    """
+    Orders saved without an order number get one, from the time they
+    were placed, so the unique index can be built. Every other order
+    keeps the number it has.
+    """
+    Order = apps.get_model('checkout', 'Order')
+    for order in Order.objects.filter(order_number='').order_by('date', 'id'):
+        order.order_number = ulid(order.date)
+        order.save(update_fields=['order_number'])
+
+
+def prepare_stripe_pids(apps, schema_editor):
+    """
+    Orders without a payment intent get NULL rather than '', which a
+    unique index allows any number of. Where the webhook and the
+    checkout form both created an order for one payment, every copy
+    but the first gets a suffix so the index can be built.
+    """
+    Order = apps.get_model('checkout', 'Order')
+    Order.objects.filter(stripe_pid='').update(stripe_pid=None)
+
+    duplicated = (Order.objects.exclude(stripe_pid=None)
+                  .values('stripe_pid').annotate(n=Count('id')).filter(n__gt=1)
+                  .values_list('stripe_pid', flat=True))
+    for pid in list(duplicated):
+        for i, order in enumerate(Order.objects.filter(stripe_pid=pid).order_by('id')[1:], 2):
+            order.stripe_pid = f'{pid}#{i}'
+            order.save(update_fields=['stripe_pid'])
+
+
+def restore_stripe_pids(apps, schema_editor):
+    Order = apps.get_model('checkout', 'Order')
+    Order.objects.filter(stripe_pid=None).update(stripe_pid='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0007_webhook_event_queue'),
+    ]
+
+    operations = [
+        migrations.RunPython(number_unnumbered_orders, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='order_number',
+            field=models.CharField(editable=False, max_length=32, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='stripe_pid',
+            field=models.CharField(blank=True, default=None, max_length=254, null=True),
+        ),
+        migrations.RunPython(prepare_stripe_pids, restore_stripe_pids),
+        migrations.AlterField(
+            model_name='order',
+            name='stripe_pid',
+            field=models.CharField(blank=True, default=None, max_length=254, null=True, unique=True),
+        ),
+    ]
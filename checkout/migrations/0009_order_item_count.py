@@ -0,0 +1,29 @@
+# Generated by Django 3.1.3 on 2026-10-18 08:52
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def count_items(apps, schema_editor):
+    Order = apps.get_model('checkout', 'Order')
+    OrderLineItem = apps.get_model('checkout', 'OrderLineItem')
+    quantities = (OrderLineItem.objects.filter(order=OuterRef('pk'))
+                  .values('order').annotate(total=Sum('quantity')).values('total'))
+    Order.objects.update(item_count=Coalesce(Subquery(quantities), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0008_unique_order_number_stripe_pid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_items, migrations.RunPython.noop),
+    ]
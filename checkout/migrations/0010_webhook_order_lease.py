@@ -0,0 +1,22 @@
+# Generated by Django 3.1.3 on 2026-10-18 09:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0009_order_item_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookOrderLease',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_key', models.CharField(max_length=255, unique=True)),
+                ('token', models.CharField(max_length=32)),
+                ('leased_until', models.DateTimeField()),
+            ],
+        ),
+    ]
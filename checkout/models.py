@@ -1,8 +1,5 @@
-import uuid
-
-
 # We'll need some imports here at the top.
-# Starting with UUID which will be used to generate the order number.
+# Starting with ulid which will be used to generate the order number.
 # We'll also need the sum function from django.db.models.
 # And our settings module from django.conf
 # And of course the product. since the order line item model
@@ -16,6 +13,8 @@ from django_countries.fields import CountryField
 
 from products.models import Product
 
+from .ulid import ulid
+
 # Before we migrate those changes though let's go to the order
 # model and attach the user profile to it.
 # First I'll import the user profile model.
@@ -43,8 +42,16 @@ from profiles.models import UserProfile
 # equals false attribute on the order number field.
 
 
+class OrderQuerySet(models.QuerySet):
+
+    def with_lineitems(self):
+        """ Fetch each order's line items and their products up front """
+        return self.prefetch_related(models.Prefetch(
+            'lineitems', queryset=OrderLineItem.objects.select_related('product')))
+
+
 class Order(models.Model):
-    order_number = models.CharField(max_length=32, null=False, editable=False)
+    order_number = models.CharField(max_length=32, null=False, editable=False, unique=True)
 
     # And then I'll create a new foreign key to it on the order. We'll use
     # models.SET_NULL if the profile is deleted since that will allow us to
@@ -69,22 +76,26 @@ class Order(models.Model):
     delivery_cost = models.DecimalField(max_digits=6, decimal_places=2, null=False, default=0)
     order_total = models.DecimalField(max_digits=10, decimal_places=2, null=False, default=0)
     grand_total = models.DecimalField(max_digits=10, decimal_places=2, null=False, default=0)
+    # Total quantity across the line items, kept by set_totals
+    item_count = models.PositiveIntegerField(default=0, editable=False)
     original_bag = models.TextField(null=False, blank=False, default='')
-    stripe_pid = models.CharField(max_length=254, null=False, blank=False, default='')
+    stripe_pid = models.CharField(max_length=254, null=True, blank=True, default=None, unique=True)
+
+    objects = OrderQuerySet.as_manager()
 
 # With those imports done, let's write a few quick model methods.
 # In the order model, I'll begin with a method called generate order number.
 # And it's prepended with an underscore by convention to indicate it's a
 # private method which will only be used inside this class.
-# All it's going to do is return uuid.uuid4().hex.upper()
-# which will just generate a random string of 32 characters we can use
-# as an order number.
+# It returns a ULID, 26 characters which start with the time the order
+# was made, so new order numbers sort after older ones and are added to
+# the end of the order_number index.
 
     def _generate_order_number(self):
         """
-        Generate a random, unique order number using UUID
+        Generate a unique, time-ordered order number
         """
-        return uuid.uuid4().hex.upper()
+        return ulid()
 
 # Also in this model let's write a method to update the total which we
 # can do using the aggregate function.
@@ -113,13 +124,22 @@ class Order(models.Model):
         # none is less than or equal to the delivery threshold.
         # Now let's see if the whole checkout flow is working.
 
-        self.order_total = self.lineitems.aggregate(Sum('lineitem_total'))['lineitem_total__sum'] or 0
+        totals = self.lineitems.aggregate(Sum('lineitem_total'), Sum('quantity'))
+        self.set_totals(totals['lineitem_total__sum'] or 0, totals['quantity__sum'] or 0)
+        self.save()
+
+    def set_totals(self, order_total, item_count):
+        """
+        Set the order total, delivery cost, grand total and
+        item count without saving
+        """
+        self.order_total = order_total
+        self.item_count = item_count
         if self.order_total < settings.FREE_DELIVERY_THRESHOLD:
             self.delivery_cost = self.order_total * settings.STANDARD_DELIVERY_PERCENTAGE / 100
         else:
             self.delivery_cost = 0
         self.grand_total = self.order_total + self.delivery_cost
-        self.save()
 
 # Next I'll override the default save method.
 # So that if the order we're saving right now doesn't
@@ -209,3 +229,61 @@ class OrderLineItem(models.Model):
 def __str__(self):
 
     return f'SKU {self.product.sku} on order {self.order.order_number}'
+
+
+class PendingPayment(models.Model):
+    """
+    A paid payment intent whose order hadn't been saved when its
+    webhook arrived, to be reconciled once check_after has passed
+    """
+    stripe_pid = models.CharField(max_length=254, unique=True)
+    intent = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True)
+    check_after = models.DateTimeField(db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return self.stripe_pid
+
+
+class WebhookEvent(models.Model):
+    """
+    A Stripe event as it was received, queued for the drain_webhooks
+    command until processed_at is set. Kept after that so redeliveries
+    can be recognised.
+    """
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict)
+    # Events sharing a key, those for one payment intent, run one at a time
+    order_key = models.CharField(max_length=255, blank=True, default='')
+    received = models.DateTimeField(db_index=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['processed_at', 'received'],
+                         name='webhook_event_pending_idx'),
+        ]
+
+    def __str__(self):
+        return self.event_id
+
+
+class WebhookOrderLease(models.Model):
+    """
+    Held by the drain processing one order's webhook events, so no other
+    drain processes that order's events at the same time. Deleted when
+    released; one left by a drain that died can be taken over once
+    leased_until has passed.
+    """
+    order_key = models.CharField(max_length=255, unique=True)
+    token = models.CharField(max_length=32)
+    leased_until = models.DateTimeField()
+
+    def __str__(self):
+        return self.order_key
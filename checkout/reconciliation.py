@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order, PendingPayment
+
+import stripe
+
+# Attempts after which a pending payment is left for someone to look at
+MAX_ATTEMPTS = 10
+
+
+def schedule_reconciliation(intent):
+    """
+    Record a paid intent whose order hasn't been saved yet, to be
+    checked again once the checkout form has had time to arrive
+    """
+    PendingPayment.objects.get_or_create(
+        stripe_pid=intent.id,
+        defaults={
+            'intent': intent.to_dict_recursive(),
+            'check_after': timezone.now() + timedelta(
+                seconds=settings.CHECKOUT_RECONCILE_DELAY),
+        },
+    )
+
+
+def _claim(pending, now):
+    """
+    Push check_after back so no other reconciler picks pending up,
+    returning False if one already has
+    """
+    lease = now + timedelta(seconds=settings.CHECKOUT_RECONCILE_DELAY)
+    claimed = PendingPayment.objects.filter(
+        pk=pending.pk, check_after=pending.check_after,
+    ).update(check_after=lease)
+    pending.check_after = lease
+    return bool(claimed)
+
+
+def reconcile(pending):
+    """
+    Send the confirmation email for pending's order, first creating
+    the order from the stored intent if the form never saved it
+    """
+    from .webhook_handler import StripeWH_Handler
+
+    handler = StripeWH_Handler(None)
+    order = Order.objects.filter(stripe_pid=pending.stripe_pid).first()
+    with transaction.atomic():
+        if order is None:
+            intent = stripe.PaymentIntent.construct_from(
+                pending.intent, settings.STRIPE_SECRET_KEY)
+            order = handler.create_order(intent)
+        pending.delete()
+    handler._send_confirmation_email(order)
+    return order
+
+
+def reconcile_due(now=None):
+    """
+    Reconcile every pending payment whose check_after has passed.
+    Failures are retried with exponential backoff.
+    Returns the number reconciled and the number that failed.
+    """
+    now = now or timezone.now()
+    done = failed = 0
+    due = PendingPayment.objects.filter(
+        check_after__lte=now, attempts__lt=MAX_ATTEMPTS).order_by('check_after')
+    for pending in due:
+        if not _claim(pending, now):
+            continue
+        try:
+            reconcile(pending)
+            done += 1
+        except Exception as e:
+            failed += 1
+            delay = settings.CHECKOUT_RECONCILE_DELAY * 2 ** pending.attempts
+            PendingPayment.objects.filter(pk=pending.pk).update(
+                attempts=pending.attempts + 1,
+                last_error=str(e),
+                check_after=now + timedelta(seconds=delay),
+            )
+    return done, failed
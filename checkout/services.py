@@ -0,0 +1,53 @@
+from django.db import transaction
+
+from products.models import Product
+
+from .models import OrderLineItem
+from .signals import defer_total_updates
+
+
+def _bag_lines(bag):
+    """ Yield (item_id, size, quantity) for every line in a bag """
+    for item_id, item_data in bag.items():
+        if isinstance(item_data, int):
+            yield item_id, None, item_data
+        else:
+            for size, quantity in item_data['items_by_size'].items():
+                yield item_id, size, quantity
+
+
+def build_order(order, bag):
+    """
+    Save an unsaved order together with a line item for everything in
+    the bag, in one transaction and a constant number of queries.
+
+    Raises Product.DoesNotExist, saving nothing, if any product in the
+    bag is missing.
+    """
+    with transaction.atomic(), defer_total_updates():
+        product_ids = [item_id for item_id in bag if str(item_id).isdigit()]
+        products = {
+            str(pk): product
+            for pk, product in Product.objects.in_bulk(product_ids).items()
+        }
+        if len(products) != len(bag):
+            raise Product.DoesNotExist(
+                f'Products not found: {", ".join(sorted(set(bag) - set(products)))}')
+
+        line_items = [
+            OrderLineItem(
+                product=products[item_id],
+                product_size=size,
+                quantity=quantity,
+                lineitem_total=products[item_id].price * quantity,
+            )
+            for item_id, size, quantity in _bag_lines(bag)
+        ]
+        order.set_totals(sum(item.lineitem_total for item in line_items),
+                         sum(item.quantity for item in line_items))
+        order.save()
+        for item in line_items:
+            item.order = order
+        OrderLineItem.objects.bulk_create(line_items)
+
+    return order
@@ -31,18 +31,52 @@
 # And now to let django know that there's a new signals module with
 # some listeners in it.
 
+import threading
+from contextlib import contextmanager
+
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
 from .models import OrderLineItem
 
+_deferred = threading.local()
+
+
+@contextmanager
+def defer_total_updates():
+    """
+    Within this block line item saves and deletes only mark their order,
+    and each marked order's total is updated once on the way out
+    """
+    if getattr(_deferred, 'orders', None) is not None:
+        yield
+        return
+
+    _deferred.orders = {}
+    try:
+        yield
+    except BaseException:
+        _deferred.orders = None
+        raise
+    orders, _deferred.orders = _deferred.orders, None
+    for order in orders.values():
+        order.update_total()
+
+
+def _update_total(order):
+    pending = getattr(_deferred, 'orders', None)
+    if pending is None:
+        order.update_total()
+    else:
+        pending[order.pk] = order
+
 
 @receiver(post_save, sender=OrderLineItem)
 def update_on_save(sender, instance, created, **kwargs):
     """
     Update order total on lineitem update/create
     """
-    instance.order.update_total()
+    _update_total(instance.order)
 
 
 @receiver(post_delete, sender=OrderLineItem)
@@ -50,4 +84,4 @@ def update_on_delete(sender, instance, **kwargs):
     """
     Update order total on lineitem delete
     """
-    instance.order.update_total()
+    _update_total(instance.order)
@@ -0,0 +1,192 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from boutique_ado import metrics
+
+import requests
+import stripe
+from stripe.api_requestor import APIRequestor
+from stripe.http_client import RequestsClient
+from stripe.util import convert_to_stripe_object
+
+
+class StripeUnavailable(stripe.error.StripeError):
+    """ Raised instead of calling Stripe while the circuit breaker is open """
+
+    def __init__(self):
+        super().__init__(
+            'Sorry, our payment provider is not responding right now. '
+            'Please try again in a few minutes.')
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast once failure_threshold calls in a row have failed.
+    After reset_timeout seconds a single trial call is let through,
+    closing the circuit again if it succeeds.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if self.clock() - self._opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+            self._trial_running = False
+
+
+class _PooledHTTPClient(RequestsClient):
+    """ stripe's requests client with its own retry count and backoff """
+
+    def __init__(self, session, timeout, max_retries, retry_delay):
+        super().__init__(timeout=timeout, session=session)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def _max_network_retries(self):
+        return self.max_retries
+
+    def _sleep_time_seconds(self, num_retries, response=None):
+        return min(self.retry_delay * 2 ** (num_retries - 1), self.MAX_DELAY)
+
+
+class StripeClient:
+    """
+    Calls the Stripe API over a pool of kept-alive connections with
+    bounded timeouts and retries, without touching stripe's global
+    configuration. Calls fail fast with StripeUnavailable while the
+    circuit breaker is open, and each call's latency is recorded under
+    stripe.<endpoint> in boutique_ado.metrics.
+    """
+
+    # Errors which say nothing about Stripe's health
+    CLIENT_ERRORS = (
+        stripe.error.CardError,
+        stripe.error.InvalidRequestError,
+        stripe.error.AuthenticationError,
+        stripe.error.PermissionError,
+        stripe.error.IdempotencyError,
+    )
+
+    def __init__(self, api_key, api_base, timeout, connect_timeout,
+                 max_retries, retry_delay, pool_size, breaker):
+        self.api_key = api_key
+        self.api_base = api_base
+        self.breaker = breaker
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        self.http_client = _PooledHTTPClient(
+            session, (connect_timeout, timeout), max_retries, retry_delay)
+
+    def request(self, endpoint, method, url, params=None):
+        if not self.breaker.allow():
+            metrics.increment(f'stripe.{endpoint}.rejected')
+            raise StripeUnavailable()
+
+        headers = {}
+        if method == 'post':
+            # Makes it safe for the http client to retry
+            headers['Idempotency-Key'] = str(uuid.uuid4())
+        requestor = APIRequestor(
+            key=self.api_key, client=self.http_client, api_base=self.api_base)
+        start = time.perf_counter()
+        try:
+            response, api_key = requestor.request(method, url, params, headers)
+        except self.CLIENT_ERRORS:
+            self.breaker.record_success()
+            raise
+        except stripe.error.StripeError:
+            self.breaker.record_failure()
+            metrics.increment(f'stripe.{endpoint}.error')
+            raise
+        else:
+            self.breaker.record_success()
+        finally:
+            metrics.observe(f'stripe.{endpoint}', time.perf_counter() - start)
+        return convert_to_stripe_object(response, api_key)
+
+    def create_payment_intent(self, **params):
+        return self.request(
+            'payment_intents.create', 'post', '/v1/payment_intents', params)
+
+    def modify_payment_intent(self, pid, **params):
+        return self.request(
+            'payment_intents.modify', 'post', f'/v1/payment_intents/{pid}', params)
+
+    def retrieve_payment_intent(self, pid):
+        return self.request(
+            'payment_intents.retrieve', 'get', f'/v1/payment_intents/{pid}')
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def stripe_client():
+    """ The shared StripeClient, built from settings on first use """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = StripeClient(
+                api_key=settings.STRIPE_SECRET_KEY,
+                api_base=settings.STRIPE_API_BASE,
+                timeout=settings.STRIPE_TIMEOUT,
+                connect_timeout=settings.STRIPE_CONNECT_TIMEOUT,
+                max_retries=settings.STRIPE_MAX_RETRIES,
+                retry_delay=settings.STRIPE_RETRY_DELAY,
+                pool_size=settings.STRIPE_POOL_SIZE,
+                breaker=CircuitBreaker(settings.STRIPE_BREAKER_THRESHOLD,
+                                       settings.STRIPE_BREAKER_RESET),
+            )
+        return _client
+
+
+@receiver(setting_changed)
+def _reset_client(setting, **kwargs):
+    global _client
+    if setting.startswith('STRIPE_'):
+        with _client_lock:
+            _client = None
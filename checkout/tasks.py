@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+
+from jobs.mail import connection
+
+from .models import Order
+
+
+def send_confirmation_email(order_id):
+    """ Render and send the confirmation email for an order """
+    order = Order.objects.filter(pk=order_id).first()
+    if order is None:
+        return
+    subject = render_to_string(
+        'checkout/confirmation_emails/confirmation_email_subject.txt',
+        {'order': order})
+    body = render_to_string(
+        'checkout/confirmation_emails/confirmation_email_body.txt',
+        {'order': order, 'contact_email': settings.DEFAULT_FROM_EMAIL})
+
+    send_mail(
+        subject,
+        body,
+        settings.DEFAULT_FROM_EMAIL,
+        [order.email],
+        connection=connection(),
+    )
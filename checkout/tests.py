@@ -1,3 +1,616 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.db import IntegrityError, connection
+from django.http import HttpResponse
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from boutique_ado import loadtest, metrics
+from jobs.queue import run_batch
+from products.models import Product
+from .events import drain, handle_event, prune_events, queue_stats
+from .fake_stripe import FakeStripe
+from .intents import SESSION_KEY
+from .models import Order, OrderLineItem, PendingPayment, WebhookEvent, WebhookOrderLease
+from .reconciliation import reconcile_due
+from .services import build_order
+from .stripe_client import CircuitBreaker, StripeClient, StripeUnavailable
+from .ulid import ulid
+from .signals import defer_total_updates
+from .webhook_handler import StripeWH_Handler
+
+import stripe
+from stripe.error import APIConnectionError, APIError, InvalidRequestError
+
+
+def make_order(**kwargs):
+    fields = {
+        'full_name': 'Test Buyer', 'email': 'buyer@example.com',
+        'phone_number': '0123456789', 'country': 'IE',
+        'town_or_city': 'Dublin', 'street_address1': '1 Main Street',
+    }
+    fields.update(kwargs)
+    return Order(**fields)
+
+
+def succeeded_event(bag, event_id='evt_123'):
+    return {
+        'id': event_id,
+        'object': 'event',
+        'type': 'payment_intent.succeeded',
+        'data': {'object': {
+            'id': 'pi_123',
+            'object': 'payment_intent',
+            'metadata': {'bag': bag, 'save_info': '',
+                         'username': 'AnonymousUser'},
+            'charges': {'data': [{
+                'amount': 2000,
+                'billing_details': {'email': 'buyer@example.com'},
+            }]},
+            'shipping': {
+                'name': 'Test Buyer', 'phone': '0123456789',
+                'address': {'country': 'IE', 'postal_code': '',
+                            'city': 'Dublin', 'line1': '1 Main Street',
+                            'line2': '', 'state': ''},
+            },
+        }},
+    }
+
+
+class BuildOrderTests(TestCase):
+
+    def setUp(self):
+        self.shirt = Product.objects.create(name='Shirt', description='', price=10)
+        self.hat = Product.objects.create(name='Hat', description='', price=Decimal('2.50'))
+        self.sock = Product.objects.create(name='Sock', description='', price=1)
+
+    def test_builds_line_items_and_totals(self):
+        bag = {
+            str(self.shirt.pk): 2,
+            str(self.hat.pk): {'items_by_size': {'s': 1, 'l': 3}},
+        }
+        order = build_order(make_order(), bag)
+
+        order.refresh_from_db()
+        self.assertEqual(order.order_total, Decimal('30.00'))
+        self.assertEqual(order.grand_total, order.order_total + order.delivery_cost)
+        self.assertEqual(order.item_count, 6)
+        lines = {(i.product_id, i.product_size): (i.quantity, i.lineitem_total)
+                 for i in order.lineitems.all()}
+        self.assertEqual(lines, {
+            (self.shirt.pk, None): (2, Decimal('20.00')),
+            (self.hat.pk, 's'): (1, Decimal('2.50')),
+            (self.hat.pk, 'l'): (3, Decimal('7.50')),
+        })
+
+    def test_query_count_does_not_grow_with_the_bag(self):
+        def queries(bag):
+            with CaptureQueriesContext(connection) as ctx:
+                build_order(make_order(), bag)
+            return len(ctx.captured_queries)
+
+        small = queries({str(self.shirt.pk): 1})
+        large = queries({
+            str(self.shirt.pk): 1,
+            str(self.hat.pk): {'items_by_size': {'s': 1, 'm': 1, 'l': 1}},
+            str(self.sock.pk): 4,
+        })
+        self.assertEqual(small, large)
+
+    def test_missing_product_saves_nothing(self):
+        bag = {str(self.shirt.pk): 1, '999999': 1}
+        with self.assertRaises(Product.DoesNotExist):
+            build_order(make_order(), bag)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderLineItem.objects.exists())
+
+
+class DeferTotalUpdatesTests(TestCase):
+
+    def test_total_is_updated_once_on_exit(self):
+        product = Product.objects.create(name='Shirt', description='', price=10)
+        order = make_order()
+        order.save()
+
+        with CaptureQueriesContext(connection) as ctx:
+            with defer_total_updates():
+                for _ in range(3):
+                    OrderLineItem.objects.create(order=order, product=product, quantity=1)
+                order.refresh_from_db()
+                self.assertEqual(order.order_total, 0)
+        aggregates = [q for q in ctx.captured_queries if 'SUM' in q['sql']]
+        self.assertEqual(len(aggregates), 1)
+
+        order.refresh_from_db()
+        self.assertEqual(order.order_total, Decimal('30.00'))
+        self.assertEqual(order.item_count, 3)
+
+
+class PaymentSucceededWebhookTests(TestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Shirt', description='', price=10)
+        self.bag = json.dumps({str(self.product.pk): 2})
+        self.event = stripe.Event.construct_from(succeeded_event(self.bag), 'sk_test')
+
+    def handle(self):
+        return StripeWH_Handler(None).handle_payment_intent_succeeded(self.event)
+
+    def reconcile_later(self):
+        return reconcile_due(timezone.now() + timedelta(hours=1))
+
+    def test_existing_order_is_confirmed(self):
+        build_order(make_order(stripe_pid='pi_123'), json.loads(self.bag))
+
+        response = self.handle()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(run_batch(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['buyer@example.com'])
+        self.assertFalse(PendingPayment.objects.exists())
+
+    def test_missing_order_is_reconciled_later(self):
+        response = self.handle()
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(mail.outbox, [])
+
+        self.assertEqual(reconcile_due(), (0, 0))
+        self.assertEqual(self.reconcile_later(), (1, 0))
+        order = Order.objects.get(stripe_pid='pi_123')
+        self.assertEqual(order.order_total, Decimal('20.00'))
+        self.assertIsNone(order.postcode)
+        run_batch()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(PendingPayment.objects.exists())
+
+    def test_late_form_submission_is_not_duplicated(self):
+        self.handle()
+        build_order(make_order(stripe_pid='pi_123'), json.loads(self.bag))
+
+        self.assertEqual(self.reconcile_later(), (1, 0))
+        self.assertEqual(Order.objects.count(), 1)
+        run_batch()
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_reconciliation_is_retried(self):
+        self.handle()
+        self.product.delete()
+
+        self.assertEqual(self.reconcile_later(), (0, 1))
+        pending = PendingPayment.objects.get()
+        self.assertEqual(pending.attempts, 1)
+        self.assertIn('not found', pending.last_error)
+        self.assertFalse(Order.objects.exists())
+
+
+class PaymentIntentReuseTests(TestCase):
+
+    def setUp(self):
+        self.fake = FakeStripe().start()
+        self.addCleanup(self.fake.stop)
+        self.override = override_settings(STRIPE_API_BASE=self.fake.url,
+                                          STRIPE_SECRET_KEY='sk_test')
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+        self.shirt = Product.objects.create(name='Shirt', description='', price=100)
+
+    def set_bag(self, bag):
+        session = self.client.session
+        session['bag'] = bag
+        session.save()
+
+    def checkout(self):
+        response = self.client.get('/checkout/')
+        self.assertEqual(response.status_code, 200)
+        return response.context['client_secret']
+
+    def requests(self):
+        return [(method, path) for method, path, _ in self.fake.requests]
+
+    def test_reloading_reuses_the_intent_without_calling_stripe(self):
+        self.set_bag({str(self.shirt.pk): 1})
+        secret = self.checkout()
+        self.assertEqual(self.checkout(), secret)
+        self.assertEqual(self.requests(), [('POST', '/v1/payment_intents')])
+        self.assertEqual(self.client.session[SESSION_KEY]['amount'], 10000)
+
+    def test_changed_amount_modifies_the_intent(self):
+        self.set_bag({str(self.shirt.pk): 1})
+        secret = self.checkout()
+        pid = self.client.session[SESSION_KEY]['id']
+
+        self.set_bag({str(self.shirt.pk): 2})
+        self.assertEqual(self.checkout(), secret)
+        self.assertEqual(self.requests()[1:], [('POST', f'/v1/payment_intents/{pid}')])
+        self.assertEqual(self.fake.intents[pid]['amount'], 20000)
+
+    def test_paid_intent_is_replaced(self):
+        self.set_bag({str(self.shirt.pk): 1})
+        self.checkout()
+        pid = self.client.session[SESSION_KEY]['id']
+        self.fake.intents[pid]['status'] = 'succeeded'
+
+        self.set_bag({str(self.shirt.pk): 3})
+        self.checkout()
+        self.assertNotEqual(self.client.session[SESSION_KEY]['id'], pid)
+        self.assertEqual(len(self.fake.intents), 2)
+
+    def test_paid_intent_with_same_amount_is_replaced(self):
+        # Paid and ordered, but the shopper never reached checkout_success
+        self.set_bag({str(self.shirt.pk): 1})
+        secret = self.checkout()
+        pid = self.client.session[SESSION_KEY]['id']
+        self.fake.intents[pid]['status'] = 'succeeded'
+        build_order(make_order(stripe_pid=pid), {str(self.shirt.pk): 1})
+
+        self.assertNotEqual(self.checkout(), secret)
+        self.assertNotEqual(self.client.session[SESSION_KEY]['id'], pid)
+        self.assertEqual(self.requests(), [('POST', '/v1/payment_intents')] * 2)
+
+    def test_changed_bag_with_same_amount_checks_the_intent(self):
+        other = Product.objects.create(name='Other shirt', description='', price=100)
+        self.set_bag({str(self.shirt.pk): 1})
+        secret = self.checkout()
+        pid = self.client.session[SESSION_KEY]['id']
+
+        self.set_bag({str(other.pk): 1})
+        self.assertEqual(self.checkout(), secret)
+        self.assertEqual(self.requests()[1:], [('GET', f'/v1/payment_intents/{pid}')])
+
+        self.fake.intents[pid]['status'] = 'canceled'
+        self.set_bag({str(self.shirt.pk): 1})
+        self.assertNotEqual(self.checkout(), secret)
+        self.assertEqual(len(self.fake.intents), 2)
+
+    def test_intent_is_forgotten_after_checkout(self):
+        self.set_bag({str(self.shirt.pk): 1})
+        self.checkout()
+        order = build_order(make_order(stripe_pid='pi_paid'), {str(self.shirt.pk): 1})
+
+        self.client.get(f'/checkout/checkout_success/{order.order_number}')
+        self.assertNotIn(SESSION_KEY, self.client.session)
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class StripeClientTests(TestCase):
+
+    def setUp(self):
+        self.fake = FakeStripe().start()
+        self.addCleanup(self.fake.stop)
+        self.clock = FakeClock()
+        metrics.reset_metrics()
+
+    def stripe(self, timeout=5, max_retries=0, threshold=2):
+        return StripeClient(
+            api_key='sk_test', api_base=self.fake.url, timeout=timeout,
+            connect_timeout=1, max_retries=max_retries, retry_delay=0,
+            pool_size=2, breaker=CircuitBreaker(threshold, 30, clock=self.clock))
+
+    def test_calls_share_a_connection_and_record_latency(self):
+        client = self.stripe()
+        intent = client.create_payment_intent(amount=1000, currency='usd')
+        client.modify_payment_intent(intent.id, amount=2000)
+        self.assertEqual(client.retrieve_payment_intent(intent.id).amount, 2000)
+
+        self.assertEqual(len(self.fake.connections), 1)
+        timings = metrics.timings('stripe.')
+        self.assertEqual(set(timings), {'stripe.payment_intents.create',
+                                        'stripe.payment_intents.modify',
+                                        'stripe.payment_intents.retrieve'})
+        self.assertEqual(timings['stripe.payment_intents.create']['count'], 1)
+
+    def test_server_errors_are_retried(self):
+        self.fake.failures = 1
+        intent = self.stripe(max_retries=1).create_payment_intent(amount=1000)
+        self.assertEqual(intent.amount, 1000)
+        self.assertEqual(len(self.fake.requests), 2)
+
+    def test_slow_calls_time_out(self):
+        self.fake.latency = 0.5
+        with self.assertRaises(APIConnectionError):
+            self.stripe(timeout=0.1).create_payment_intent(amount=1000)
+
+    def test_circuit_opens_after_failures_and_recovers(self):
+        client = self.stripe()
+        self.fake.failures = 2
+        for _ in range(2):
+            with self.assertRaises(APIError):
+                client.create_payment_intent(amount=1000)
+
+        with self.assertRaises(StripeUnavailable):
+            client.create_payment_intent(amount=1000)
+        self.assertEqual(len(self.fake.requests), 2)
+        self.assertEqual(metrics.counters('stripe.'), {
+            'stripe.payment_intents.create.error': 2,
+            'stripe.payment_intents.create.rejected': 1,
+        })
+
+        self.clock.now = 31
+        client.create_payment_intent(amount=1000)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_client_errors_do_not_open_the_circuit(self):
+        client = self.stripe(threshold=1)
+        with self.assertRaises(InvalidRequestError):
+            client.retrieve_payment_intent('pi_missing')
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_checkout_explains_when_stripe_is_unavailable(self):
+        shirt = Product.objects.create(name='Shirt', description='', price=100)
+        session = self.client.session
+        session['bag'] = {str(shirt.pk): 1}
+        session.save()
+        self.fake.failures = 100
+        with override_settings(STRIPE_API_BASE=self.fake.url, STRIPE_SECRET_KEY='sk_test',
+                               STRIPE_MAX_RETRIES=0, STRIPE_BREAKER_THRESHOLD=1):
+            self.client.get('/checkout/')
+            response = self.client.get('/checkout/', follow=True)
+        self.assertRedirects(response, '/bag/')
+        self.assertEqual(len(self.fake.requests), 1)
+        self.assertIn('not responding', str(list(response.context['messages'])[-1]))
+
+
+@override_settings(STRIPE_WH_SECRET='whsec_test', STRIPE_WH_RETRY_DELAY=10)
+class WebhookQueueTests(TestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Shirt', description='', price=10)
+        self.bag = json.dumps({str(self.product.pk): 2})
+
+    def deliver(self, event):
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(b'whsec_test', f'{timestamp}.{payload}'.encode(),
+                             hashlib.sha256).hexdigest()
+        return self.client.post(
+            '/checkout/wh/', payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=f't={timestamp},v1={signature}')
+
+    def test_events_are_queued_and_drained(self):
+        build_order(make_order(stripe_pid='pi_123'), json.loads(self.bag))
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.deliver(succeeded_event(self.bag))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Queued', response.content)
+        self.assertFalse(any('checkout_order' in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(queue_stats()['depth'], 1)
+
+        self.assertEqual(drain(), (1, 0))
+        run_batch()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(queue_stats(), {'depth': 0, 'lag_seconds': 0})
+        self.assertIsNotNone(WebhookEvent.objects.get().processed_at)
+
+    def test_redelivered_events_are_not_processed_again(self):
+        build_order(make_order(stripe_pid='pi_123'), json.loads(self.bag))
+        event = succeeded_event(self.bag)
+
+        self.deliver(event)
+        self.assertEqual(drain(), (1, 0))
+        response = self.deliver(event)
+        self.assertIn(b'Already received', response.content)
+        self.assertEqual(drain(), (0, 0))
+
+        run_batch()
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_events_are_retried_later(self):
+        event = succeeded_event(self.bag)
+        event['data']['object']['metadata']['username'] = 'nobody'
+        self.deliver(event)
+
+        self.assertEqual(drain(), (0, 1))
+        row = WebhookEvent.objects.get()
+        self.assertEqual(row.attempts, 1)
+        self.assertIn('DoesNotExist', row.last_error)
+        self.assertEqual(drain(), (0, 0))
+        self.assertEqual(queue_stats()['depth'], 1)
+
+        WebhookEvent.objects.update(claimed_until=timezone.now())
+        self.assertEqual(drain(), (0, 1))
+        self.assertEqual(WebhookEvent.objects.get().attempts, 2)
+
+    def test_events_for_one_order_run_in_order(self):
+        first = succeeded_event(self.bag, 'evt_1')
+        first['type'] = 'payment_intent.payment_failed'
+        other = succeeded_event(self.bag, 'evt_2')
+        other['type'] = 'payment_intent.payment_failed'
+        other['data']['object']['id'] = 'pi_other'
+        second = succeeded_event(self.bag, 'evt_3')
+        for event in (first, other, second):
+            self.deliver(event)
+
+        with mock.patch('checkout.events.handle_event', wraps=handle_event) as handle:
+            # Another drain holds pi_123, so only pi_other runs
+            lease = WebhookOrderLease.objects.create(
+                order_key='pi_123', token='other',
+                leased_until=timezone.now() + timedelta(seconds=60))
+            self.assertEqual(drain(), (1, 0))
+            lease.delete()
+            self.assertEqual(drain(), (2, 0))
+        self.assertEqual([c.args[0]['id'] for c in handle.call_args_list],
+                         ['evt_2', 'evt_1', 'evt_3'])
+        self.assertFalse(WebhookOrderLease.objects.exists())
+
+    def test_later_events_wait_for_a_failed_event_to_be_retried(self):
+        first = succeeded_event(self.bag, 'evt_1')
+        second = succeeded_event(self.bag, 'evt_2')
+        for event in (first, second):
+            self.deliver(event)
+        responses = [HttpResponse(status=500), HttpResponse(), HttpResponse()]
+
+        with mock.patch('checkout.events.handle_event', side_effect=responses) as handle:
+            self.assertEqual(drain(), (0, 1))
+            # evt_1 is backing off, and evt_2 must not overtake it
+            self.assertEqual(drain(), (0, 0))
+            later = timezone.now() + timedelta(seconds=settings.STRIPE_WH_RETRY_DELAY + 1)
+            self.assertEqual(drain(now=later), (2, 0))
+        self.assertEqual([c.args[0]['id'] for c in handle.call_args_list],
+                         ['evt_1', 'evt_1', 'evt_2'])
+
+    def test_lease_left_by_a_dead_drain_is_taken_over_once_expired(self):
+        event = succeeded_event(self.bag)
+        event['type'] = 'payment_intent.payment_failed'
+        self.deliver(event)
+        now = timezone.now()
+        WebhookOrderLease.objects.create(order_key='pi_123', token='dead',
+                                         leased_until=now + timedelta(seconds=60))
+
+        self.assertEqual(drain(now=now), (0, 0))
+        self.assertEqual(drain(now=now + timedelta(seconds=61)), (1, 0))
+        self.assertFalse(WebhookOrderLease.objects.exists())
+
+    def test_stats_are_staff_only(self):
+        self.deliver(succeeded_event(self.bag))
+        self.assertEqual(self.client.get('/checkout/wh/stats/').status_code, 302)
+
+        User.objects.create_user('staff', password='pass', is_staff=True)
+        self.client.login(username='staff', password='pass')
+        stats = self.client.get('/checkout/wh/stats/').json()
+        self.assertEqual(stats['depth'], 1)
+
+    def test_old_processed_events_are_pruned_in_batches(self):
+        now = timezone.now()
+        for i in range(5):
+            WebhookEvent.objects.create(
+                event_id=f'evt_{i}', event_type='payment_intent.succeeded',
+                received=now - timedelta(days=i * 10), processed_at=now)
+        WebhookEvent.objects.create(
+            event_id='evt_pending', event_type='payment_intent.succeeded',
+            received=now - timedelta(days=100))
+
+        with CaptureQueriesContext(connection) as ctx:
+            deleted = prune_events(now - timedelta(days=15), batch_size=2)
+        self.assertEqual(deleted, 3)
+        deletes = [q for q in ctx.captured_queries if q['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 2)
+        self.assertEqual(set(WebhookEvent.objects.values_list('event_id', flat=True)),
+                         {'evt_0', 'evt_1', 'evt_pending'})
+
+
+class OrderNumberTests(TestCase):
+
+    def test_ulids_sort_in_creation_order(self):
+        ids = [ulid() for _ in range(1000)]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 1000)
+        self.assertEqual({len(i) for i in ids}, {26})
+
+    def test_ulids_for_a_time_start_with_that_time(self):
+        earlier = ulid(timezone.now() - timedelta(days=1))
+        self.assertLess(earlier, ulid())
+        self.assertEqual(ulid(timezone.now() - timedelta(days=1))[:6], earlier[:6])
+
+    def test_order_numbers_and_payment_intents_are_unique(self):
+        first = make_order(stripe_pid='pi_1')
+        first.save()
+        second = make_order()
+        second.save()
+        self.assertLess(first.order_number, second.order_number)
+        make_order().save()
+
+        with self.assertRaises(IntegrityError):
+            make_order(stripe_pid='pi_1').save()
+
+
+class OrderAdminTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.login(username='admin', password='pass')
+        self.products = [Product.objects.create(name=f'Catalog item {i}', description='',
+                                                price=10, sku=f'SKU{i}')
+                         for i in range(20)]
+        self.order = build_order(make_order(), {str(self.products[0].pk): 1})
+        self.url = f'/admin/checkout/order/{self.order.pk}/change/'
+
+    def test_change_page_does_not_list_the_catalog(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Catalog item 0')
+        self.assertNotContains(response, 'Catalog item 19')
+
+    def test_saving_line_items_updates_the_total_once(self):
+        line = self.order.lineitems.get()
+        data = {
+            'user_profile': '', 'full_name': 'Test Buyer', 'email': 'buyer@example.com',
+            'phone_number': '0123456789', 'country': 'IE', 'postcode': '',
+            'town_or_city': 'Dublin', 'street_address1': '1 Main Street',
+            'street_address2': '', 'county': '',
+            'lineitems-TOTAL_FORMS': '4', 'lineitems-INITIAL_FORMS': '1',
+            'lineitems-MIN_NUM_FORMS': '0', 'lineitems-MAX_NUM_FORMS': '1000',
+            'lineitems-0-id': str(line.pk), 'lineitems-0-order': str(self.order.pk),
+            'lineitems-0-product': str(self.products[0].pk),
+            'lineitems-0-product_size': '', 'lineitems-0-quantity': '2',
+        }
+        for i in (1, 2, 3):
+            data.update({
+                f'lineitems-{i}-id': '', f'lineitems-{i}-order': str(self.order.pk),
+                f'lineitems-{i}-product': str(self.products[i].pk),
+                f'lineitems-{i}-product_size': '', f'lineitems-{i}-quantity': '1',
+            })
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 302)
+        aggregates = [q for q in ctx.captured_queries if 'SUM' in q['sql']]
+        self.assertEqual(len(aggregates), 1)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_total, Decimal('50.00'))
+        self.assertEqual(self.order.item_count, 5)
+
+
+class LoadTestTests(LiveServerTestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Shirt', description='', price=10)
+        self.fake = FakeStripe().start()
+        self.addCleanup(self.fake.stop)
+        override = override_settings(
+            STRIPE_API_BASE=self.fake.url, STRIPE_SECRET_KEY='sk_test',
+            STRIPE_WH_SECRET='whsec_test')
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_a_shopper_places_an_order_and_its_webhook_is_queued(self):
+        errors = []
+        results = loadtest.run(self.live_server_url, [self.product.pk], self.fake,
+                               'whsec_test', shoppers=1, iterations=1,
+                               on_error=errors.append)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(results['orders'], 1)
+        self.assertEqual(list(results['steps']), list(loadtest.STEPS))
+        order = Order.objects.get()
+        self.assertIn(order.stripe_pid, self.fake.intents)
+        self.assertEqual(WebhookEvent.objects.get().order_key, order.stripe_pid)
+
+    def test_compare_reports_the_change_in_each_metric(self):
+        step = {'throughput': 10.0, 'p50_ms': 20.0, 'p95_ms': 40.0, 'p99_ms': 50.0}
+        faster = dict(step, p95_ms=30.0)
+        rows = loadtest.compare({'steps': {'checkout': step}},
+                                {'steps': {'checkout': faster, 'webhook': step}})
+        self.assertIn(('checkout', 'p95_ms', 40.0, 30.0, -25.0), rows)
+        self.assertFalse(any(row[0] == 'webhook' for row in rows))
@@ -0,0 +1,45 @@
+import os
+import threading
+import time
+
+# Crockford's base 32, which sorts the same as the numbers it encodes
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+_lock = threading.Lock()
+_last = (0, 0)
+
+
+def _encode(value, length):
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def ulid(at=None, rng=None):
+    """
+    A 26 character ULID: a 48 bit millisecond timestamp followed by 80
+    random bits. IDs sort in the order they were made, including those
+    made by this process within the same millisecond, whose random part
+    is incremented rather than redrawn. Pass a datetime as `at` to make
+    an ID for that time instead of now, and a random.Random as `rng` to
+    draw its random part from, for IDs that can be made again.
+    """
+    global _last
+    if at is not None:
+        millis = int(at.timestamp() * 1000)
+        if rng is not None:
+            randomness = rng.getrandbits(80)
+        else:
+            randomness = int.from_bytes(os.urandom(10), 'big')
+        return _encode(millis, 10) + _encode(randomness, 16)
+    with _lock:
+        millis = time.time_ns() // 1000000
+        last_millis, last_random = _last
+        if millis <= last_millis:
+            millis, randomness = last_millis, last_random + 1
+        else:
+            randomness = int.from_bytes(os.urandom(10), 'big')
+        _last = (millis, randomness)
+    return _encode(millis, 10) + _encode(randomness, 16)
@@ -5,7 +5,7 @@
 
 from django.urls import path
 from . import views
-from .webhooks import webhook
+from .webhooks import webhook, webhook_stats
 
 urlpatterns = [
     path('', views.checkout, name='checkout'),
@@ -32,4 +32,5 @@ urlpatterns = [
     # I'll import the webhook function from .webhooks
 
     path('wh/', webhook, name='webhook'),
+    path('wh/stats/', webhook_stats, name='webhook_stats'),
 ]
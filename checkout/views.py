@@ -33,9 +33,13 @@ from django.shortcuts import render, redirect, reverse, get_object_or_404, HttpR
 from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.conf import settings
+from django.db import IntegrityError
 
 from .forms import OrderForm
-from .models import Order, OrderLineItem
+from .intents import forget_payment_intent, payment_intent_secret
+from .models import Order
+from .services import build_order
+from .stripe_client import StripeUnavailable, stripe_client
 
 from products.models import Product
 from profiles.models import UserProfile
@@ -79,8 +83,7 @@ import json
 def cache_checkout_data(request):
     try:
         pid = request.POST.get('client_secret').split('_secret')[0]
-        stripe.api_key = settings.STRIPE_SECRET_KEY
-        stripe.PaymentIntent.modify(pid, metadata={
+        stripe_client().modify_payment_intent(pid, metadata={
             'bag': json.dumps(request.session.get('bag', {})),
             'save_info': request.POST.get('save_info'),
             'username': request.user,
@@ -103,7 +106,6 @@ def cache_checkout_data(request):
 # For now, let's just print it out.
 def checkout(request):
     stripe_public_key = settings.STRIPE_PUBLIC_KEY
-    stripe_secret_key = settings.STRIPE_SECRET_KEY
 
 # To confirm it we verified that the form on the checkout page was submitted.
 # However, at the moment the form data doesn't actually go anywhere
@@ -162,35 +164,24 @@ def checkout(request):
         if order_form.is_valid():
             order = order_form.save(commit=False)
             pid = request.POST.get('client_secret').split('_secret')[0]
+            # A delayed webhook may already have created this order
+            existing = Order.objects.filter(stripe_pid=pid).first()
+            if existing:
+                return redirect(reverse('checkout_success', args=[existing.order_number]))
             order.stripe_pid = pid
             order.original_bag = json.dumps(bag)
-            order.save()
-            for item_id, item_data in bag.items():
-                try:
-                    product = Product.objects.get(id=item_id)
-                    if isinstance(item_data, int):
-                        order_line_item = OrderLineItem(
-                            order=order,
-                            product=product,
-                            quantity=item_data,
-                        )
-                        order_line_item.save()
-                    else:
-                        for size, quantity in item_data['items_by_size'].items():
-                            order_line_item = OrderLineItem(
-                                order=order,
-                                product=product,
-                                quantity=quantity,
-                                product_size=size,
-                            )
-                            order_line_item.save()
-                except Product.DoesNotExist:
-                    messages.error(request, (
-                        "One of the products in your bag wasn't found in our database. "
-                        "Please call us for assistance!")
-                    )
-                    order.delete()
-                    return redirect(reverse('view_bag'))
+            try:
+                build_order(order, bag)
+            except Product.DoesNotExist:
+                messages.error(request, (
+                    "One of the products in your bag wasn't found in our database. "
+                    "Please call us for assistance!")
+                )
+                return redirect(reverse('view_bag'))
+            except IntegrityError:
+                # The webhook created the order for this payment meanwhile
+                existing = get_object_or_404(Order, stripe_pid=pid)
+                return redirect(reverse('checkout_success', args=[existing.order_number]))
 
             request.session['save_info'] = 'save-info' in request.POST
             return redirect(reverse('checkout_success', args=[order.order_number]))
@@ -207,11 +198,15 @@ def checkout(request):
         current_bag = bag_contents(request)
         total = current_bag['grand_total']
         stripe_total = round(total * 100)
-        stripe.api_key = stripe_secret_key
-        intent = stripe.PaymentIntent.create(
-            amount=stripe_total,
-            currency=settings.STRIPE_CURRENCY,
-        )
+        try:
+            client_secret = payment_intent_secret(request, bag, stripe_total)
+        except StripeUnavailable as e:
+            messages.error(request, e.user_message)
+            return redirect(reverse('view_bag'))
+        except stripe.error.StripeError:
+            messages.error(request, 'Sorry, your payment cannot be \
+                processed right now. Please try again later.')
+            return redirect(reverse('view_bag'))
 
         # Attempt to prefill the form with any info the user maintains in their profile
         # All we need to do is check whether the user is authenticated.
@@ -251,7 +246,7 @@ def checkout(request):
     context = {
         'order_form': order_form,
         'stripe_public_key': stripe_public_key,
-        'client_secret': intent.client_secret,
+        'client_secret': client_secret,
     }
 
     return render(request, template, context)
@@ -285,7 +280,7 @@ def checkout_success(request, order_number):
     Handle successful checkouts
     """
     save_info = request.session.get('save_info')
-    order = get_object_or_404(Order, order_number=order_number)
+    order = get_object_or_404(Order.objects.with_lineitems(), order_number=order_number)
 
     if request.user.is_authenticated:
         profile = UserProfile.objects.get(user=request.user)
@@ -314,6 +309,7 @@ def checkout_success(request, order_number):
 
     if 'bag' in request.session:
         del request.session['bag']
+    forget_payment_intent(request)
 
     template = 'checkout/checkout_success.html'
     context = {
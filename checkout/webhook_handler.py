@@ -45,19 +45,17 @@ from django.http import HttpResponse
 # And also our settings file from django.conf
 # With these imported, it's easy to send an email.
 
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.conf import settings
-
-from .models import Order, OrderLineItem
-from products.models import Product
+from .models import Order
+from .reconciliation import schedule_reconciliation
+from .services import build_order
+from .tasks import send_confirmation_email
 
 # Finally we just need to import the user profile model here at the top.
 
+from jobs.queue import enqueue
 from profiles.models import UserProfile
 
 import json
-import time
 
 
 class StripeWH_Handler:
@@ -109,20 +107,9 @@ class StripeWH_Handler:
             The payment has definitely been completed at this point.
             So we'll want to send an email no matter what."""
 
-        cust_email = order.email
-        subject = render_to_string(
-            'checkout/confirmation_emails/confirmation_email_subject.txt',
-            {'order': order})
-        body = render_to_string(
-            'checkout/confirmation_emails/confirmation_email_body.txt',
-            {'order': order, 'contact_email': settings.DEFAULT_FROM_EMAIL})
-
-        send_mail(
-            subject,
-            body,
-            settings.DEFAULT_FROM_EMAIL,
-            [cust_email]
-        )
+        # Rendering and sending happen in a worker, so a slow mail
+        # server can't hold up the response to stripe.
+        enqueue(send_confirmation_email, order.pk)
 
     def handle_event(self, event):
         """
@@ -202,12 +189,9 @@ class StripeWH_Handler:
         This will cause stripe to automatically try the webhook again later.
         """
         pid = intent.id
-        bag = intent.metadata.bag
         save_info = intent.metadata.save_info
 
-        billing_details = intent.charges.data[0].billing_details
         shipping_details = intent.shipping
-        grand_total = round(intent.charges.data[0].amount / 100, 2)
 
         # Clean data in the shipping details
         for field, value in shipping_details.address.items():
@@ -249,42 +233,14 @@ class StripeWH_Handler:
                 profile.default_county = shipping_details.address.state
                 profile.save()
 
-        order_exists = False
-        # Instead of just immediately going to create the order if it's
-        # not found in the database. let's introduce a bit of delay.
-        # I'll create a simple variable called attempt and set it to 1.
-        # Now let's create a while loop that will execute up to 5 times.
-        # I'll move all this code into the loop, but now instead of creating
-        # the order if it's not found the first time. I'll increment attempt
-        # by 1. And then use pythons time module to sleep for one second.
-        # This will in effect cause the webhook handler to try to find the
-        # order five times over five seconds before giving up and creating the
-        # order itself. Now since the attempt is in a while loop though, if
-        # the order is found we should break out of the loop. attempt = 1
+        # The checkout form has usually saved the order by the time this
+        # webhook arrives, so look it up once by its indexed stripe_pid.
+        # Rather than holding this worker while we wait for a slow form
+        # submission, schedule a re-check which will create the order
+        # if the form still hasn't arrived by then.
 
-        attempt = 1
-        while attempt <= 5:
-            try:
-                order = Order.objects.get(
-                    full_name__iexact=shipping_details.name,
-                    email__iexact=billing_details.email,
-                    phone_number__iexact=shipping_details.phone,
-                    country__iexact=shipping_details.address.country,
-                    postcode__iexact=shipping_details.address.postal_code,
-                    town_or_city__iexact=shipping_details.address.city,
-                    street_address1__iexact=shipping_details.address.line1,
-                    street_address2__iexact=shipping_details.address.line2,
-                    county__iexact=shipping_details.address.state,
-                    grand_total=grand_total,
-                    original_bag=bag,
-                    stripe_pid=pid,
-                )
-                order_exists = True
-                break
-            except Order.DoesNotExist:
-                attempt += 1
-                time.sleep(1)
-        if order_exists:
+        order = Order.objects.filter(stripe_pid=pid).first()
+        if order:
             self._send_confirmation_email(order)
 
             """If we found the order in the database because it was already created by the form.
@@ -293,66 +249,48 @@ class StripeWH_Handler:
             return HttpResponse(
                 content=f'Webhook received: {event["type"]} | SUCCESS: Verified order already in database',
                 status=200)
-        else:
-            order = None
-            try:
-                order = Order.objects.create(
-                    full_name=shipping_details.name,
 
-                    # Now since we've already got their profile and if they weren't logged
-                    # in it will just be none.
-                    # We can simply add it to their order when the webhook creates it.
-                    # In this way, the webhook handler can create orders for both
-                    # authenticated users by attaching their profile.
-                    # And for anonymous users by setting that field to none.
+        schedule_reconciliation(intent)
+        return HttpResponse(
+            content=f'Webhook received: {event["type"]} | SUCCESS: Scheduled order reconciliation',
+            status=200)
+
+    def create_order(self, intent):
+        """
+        Create the order for a paid payment intent from the details
+        stored on it, for when the checkout form never arrived
+        """
+        billing_details = intent.charges.data[0].billing_details
+        shipping_details = intent.shipping
+
+        profile = None
+        username = intent.metadata.username
+        if username != 'AnonymousUser':
+            profile = UserProfile.objects.filter(user__username=username).first()
 
-                    user_profile=profile,
-                    email=billing_details.email,
-                    phone_number=shipping_details.phone,
-                    country=shipping_details.address.country,
-                    postcode=shipping_details.address.postal_code,
-                    town_or_city=shipping_details.address.city,
-                    street_address1=shipping_details.address.line1,
-                    street_address2=shipping_details.address.line2,
-                    county=shipping_details.address.state,
-                    original_bag=bag,
-                    stripe_pid=pid,
-                )
-                for item_id, item_data in json.loads(bag).items():
-                    product = Product.objects.get(id=item_id)
-                    if isinstance(item_data, int):
-                        order_line_item = OrderLineItem(
-                            order=order,
-                            product=product,
-                            quantity=item_data,
-                        )
-                        order_line_item.save()
-                    else:
-                        for size, quantity in item_data['items_by_size'].items():
-                            order_line_item = OrderLineItem(
-                                order=order,
-                                product=product,
-                                quantity=quantity,
-                                product_size=size,
-                            )
-                            order_line_item.save()
-            except Exception as e:
-                if order:
-                    order.delete()
-                return HttpResponse(
-                    content=f'Webhook received: {event["type"]} | ERROR: {e}',
-                    status=500)
+        order = Order(
+            full_name=shipping_details.name,
 
-        # If the order was created by the webhook handler I'll send the email at
-        # the bottom here just before returning that response to stripe.
-        # In both cases whether the order already existed or whether the webhook
-        # handler just created it. We'll pass it along to our new method in order
-        # to send the email.
+            # Now since we've already got their profile and if they weren't logged
+            # in it will just be none.
+            # We can simply add it to their order when the webhook creates it.
+            # In this way, the webhook handler can create orders for both
+            # authenticated users by attaching their profile.
+            # And for anonymous users by setting that field to none.
 
-        self._send_confirmation_email(order)
-        return HttpResponse(
-            content=f'Webhook received: {event["type"]} | SUCCESS: Created order in webhook',
-            status=200)
+            user_profile=profile,
+            email=billing_details.email,
+            phone_number=shipping_details.phone,
+            country=shipping_details.address.country,
+            postcode=shipping_details.address.postal_code,
+            town_or_city=shipping_details.address.city,
+            street_address1=shipping_details.address.line1,
+            street_address2=shipping_details.address.line2,
+            county=shipping_details.address.state,
+            original_bag=intent.metadata.bag,
+            stripe_pid=intent.id,
+        )
+        return build_order(order, json.loads(intent.metadata.bag))
 
     def handle_payment_intent_payment_failed(self, event):
         """
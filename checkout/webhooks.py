@@ -21,11 +21,12 @@
 # we'd normally need.
 
 from django.conf import settings
-from django.http import HttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 
-from checkout.webhook_handler import StripeWH_Handler
+from checkout.events import enqueue_event, queue_stats
 
 import stripe
 
@@ -36,7 +37,6 @@ def webhook(request):
     """Listen for webhooks from Stripe"""
     # Setup
     wh_secret = settings.STRIPE_WH_SECRET
-    stripe.api_key = settings.STRIPE_SECRET_KEY
 
     # Get the webhook data and verify its signature
     payload = request.body
@@ -45,7 +45,8 @@ def webhook(request):
 
     try:
         event = stripe.Webhook.construct_event(
-            payload, sig_header, wh_secret
+            payload, sig_header, wh_secret,
+            api_key=settings.STRIPE_SECRET_KEY,
         )
     except ValueError as e:
         # Invalid payload
@@ -56,22 +57,19 @@ def webhook(request):
     except Exception as e:
         return HttpResponse(content=e, status=400)
 
-    # Set up a webhook handler
-    handler = StripeWH_Handler(request)
+    # Processing happens in the drain_webhooks command, so just store
+    # the event and answer straight away. Stripe redelivers events it
+    # isn't sure we received, and those we already have are ignored.
+    if enqueue_event(event):
+        result = 'Queued'
+    else:
+        result = 'Already received'
+    return HttpResponse(
+        content=f'Webhook received: {event["type"]} | {result}',
+        status=200)
 
-    # Map webhook events to relevant handler functions
-    event_map = {
-        'payment_intent.succeeded': handler.handle_payment_intent_succeeded,
-        'payment_intent.payment_failed': handler.handle_payment_intent_payment_failed,
-    }
 
-    # Get the webhook type from Stripe
-    event_type = event['type']
-
-    # If there's a handler for it, get it from the event map
-    # Use the generic one by default
-    event_handler = event_map.get(event_type, handler.handle_event)
-
-    # Call the event handler with the event
-    response = event_handler(event)
-    return response
+@staff_member_required
+def webhook_stats(request):
+    """ Depth and lag of the webhook queue, for monitoring """
+    return JsonResponse(queue_stats())
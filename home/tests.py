@@ -1,3 +1,72 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from boutique_ado.query_budget import QueryBudgetExceeded, QueryLog
+from checkout.models import Order
+from checkout.services import build_order
+from products.models import Product, Category
+
+
+class QueryBudgetTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        categories = [Category.objects.create(name=f'category_{i}') for i in range(3)]
+        self.products = [
+            Product.objects.create(name=f'Product {i}', description='', price=10,
+                                   category=categories[i % 3])
+            for i in range(30)
+        ]
+        self.orders = []
+        for i in range(12):
+            order = Order(user_profile=self.user.userprofile, full_name='Test Buyer',
+                          email='buyer@example.com', phone_number='0123456789',
+                          country='IE', town_or_city='Dublin',
+                          street_address1='1 Main Street', stripe_pid=f'pi_{i}')
+            bag = {str(p.pk): 1 for p in self.products[i:i + 4]}
+            self.orders.append(build_order(order, bag))
+        self.client.force_login(self.user)
+        session = self.client.session
+        session['bag'] = {str(p.pk): 2 for p in self.products[:10]}
+        session.save()
+
+    def test_budgeted_views_stay_within_budget_as_data_grows(self):
+        order = self.orders[0]
+        product = self.products[0]
+        urls = [
+            '/', '/products/', '/products/?category=category_1',
+            f'/products/{product.pk}/', '/bag/', '/profile/',
+            f'/profile/order_history/{order.order_number}',
+            f'/checkout/checkout_success/{order.order_number}',
+            '/admin/checkout/order/', f'/admin/checkout/order/{order.pk}/change/',
+            '/admin/products/product/', f'/admin/products/product/{product.pk}/change/',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                # Strict in tests, so a view over its budget raises
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('X-DB-Queries', response)
+
+    @override_settings(QUERY_BUDGETS={'products': 1})
+    def test_exceeding_a_budget_fails_the_request(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'products ran more than its budget of 1'):
+            self.client.get('/products/')
+
+    @override_settings(QUERY_BUDGETS={'products': 1}, QUERY_BUDGET_STRICT=False)
+    def test_exceeding_a_budget_is_logged_when_not_strict(self):
+        with self.assertLogs('boutique_ado.query_budget', 'WARNING'):
+            response = self.client.get('/products/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_repeated_queries_are_reported_with_their_call_site(self):
+        with QueryLog() as log:
+            names = [p.category.name for p in Product.objects.all()]
+
+        self.assertEqual(len(names), 30)
+        self.assertEqual(log.count, 31)
+        (sql, times, sites), = log.duplicates()
+        self.assertIn('products_category', sql)
+        self.assertEqual(times, 30)
+        self.assertEqual(len(sites), 1)
+        self.assertTrue(sites[0].startswith('home/tests.py:'))
@@ -0,0 +1,24 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    readonly_fields = ('task', 'args', 'kwargs', 'attempts',
+                       'last_error', 'created')
+
+    list_display = ('task', 'status', 'run_at', 'attempts', 'created')
+
+    list_filter = ('status', 'task')
+
+    ordering = ('run_at',)
+
+    actions = ('retry',)
+
+    def retry(self, request, queryset):
+        queryset.update(status=Job.QUEUED, attempts=0, run_at=timezone.now())
+    retry.short_description = 'Retry selected jobs now'
+
+
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,93 @@
+import threading
+from contextlib import contextmanager
+
+from django.core.mail import EmailMultiAlternatives, get_connection
+
+
+class _Batch(threading.local):
+    active = False
+    connection = None
+
+
+_batch = _Batch()
+
+
+@contextmanager
+def batch():
+    """
+    Within this block every message sent through connection() goes
+    over the same mail connection, opened on first use
+    """
+    _batch.active = True
+    try:
+        yield
+    finally:
+        _close()
+        _batch.active = False
+
+
+def _close():
+    connection, _batch.connection = _batch.connection, None
+    if connection is not None:
+        connection.close()
+
+
+def connection():
+    """ The current batch's mail connection, or a new one outside a batch """
+    if not _batch.active:
+        return get_connection()
+    if _batch.connection is None:
+        _batch.connection = get_connection()
+        _batch.connection.open()
+    return _batch.connection
+
+
+def send_message(data):
+    """ Send a message serialised by queue_message """
+    message = EmailMultiAlternatives(
+        subject=data['subject'],
+        body=data['body'],
+        from_email=data['from_email'],
+        to=data['to'],
+        cc=data['cc'],
+        bcc=data['bcc'],
+        reply_to=data['reply_to'],
+        headers=data['headers'],
+        alternatives=[tuple(a) for a in data['alternatives']],
+        connection=connection(),
+    )
+    message.content_subtype = data['content_subtype']
+    try:
+        message.send()
+    except Exception:
+        # Don't reuse a connection the server may have dropped
+        _close()
+        raise
+
+
+def queue_message(message):
+    """ Send an EmailMessage, which must have no attachments, from a worker """
+    from .queue import enqueue
+
+    if message.attachments:
+        raise ValueError('Messages with attachments cannot be queued')
+    return enqueue(send_message, {
+        'subject': message.subject,
+        'body': message.body,
+        'from_email': message.from_email,
+        'to': message.to,
+        'cc': message.cc,
+        'bcc': message.bcc,
+        'reply_to': message.reply_to,
+        'headers': message.extra_headers,
+        'alternatives': getattr(message, 'alternatives', []),
+        'content_subtype': message.content_subtype,
+    })
+
+
+def queue_mail(subject, message, from_email, recipient_list, html_message=None):
+    """ Like django.core.mail.send_mail, but sent from a worker """
+    email = EmailMultiAlternatives(subject, message, from_email, recipient_list)
+    if html_message:
+        email.attach_alternative(html_message, 'text/html')
+    return queue_message(email)
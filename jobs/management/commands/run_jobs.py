@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs.queue import run_batch
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Run the jobs that are due now, then exit')
+        parser.add_argument('--batch-size', type=int, default=settings.JOB_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait when no jobs are due')
+
+    def handle(self, *args, **options):
+        while True:
+            done, failed = run_batch(options['batch_size'])
+            if done or failed:
+                self.stdout.write(f'Ran {done} jobs, {failed} failed')
+            if options['once'] and done + failed < options['batch_size']:
+                return
+            if not done and not failed:
+                time.sleep(options['interval'])
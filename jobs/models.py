@@ -0,0 +1,34 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    A call to a module-level function, stored until a worker runs it.
+    Jobs are deleted once they succeed and marked failed once they
+    have used up their attempts.
+    """
+    QUEUED = 'queued'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (FAILED, 'Failed'),
+    )
+
+    task = models.CharField(max_length=200)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    last_error = models.TextField(blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.task} #{self.pk}'
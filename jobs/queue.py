@@ -0,0 +1,94 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import mail
+from .models import Job
+
+
+def _task_name(func):
+    if isinstance(func, str):
+        return func
+    if '<' in func.__qualname__:
+        raise ValueError(f'{func.__qualname__} is not importable, so cannot be queued')
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def schedule(delay, func, *args, **kwargs):
+    """
+    Queue func(*args, **kwargs) to run in a worker after delay seconds.
+    func must be importable from its module and its arguments JSON
+    serialisable. Enqueued within a transaction, the job only becomes
+    visible to workers if the transaction commits.
+    """
+    return Job.objects.create(
+        task=_task_name(func),
+        args=list(args),
+        kwargs=kwargs,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def enqueue(func, *args, **kwargs):
+    """ Queue func(*args, **kwargs) to run in a worker as soon as possible """
+    return schedule(0, func, *args, **kwargs)
+
+
+def _claim(job, now):
+    """
+    Push run_at back by the lease so no other worker picks job up,
+    returning False if one already has
+    """
+    lease = now + timedelta(seconds=settings.JOB_LEASE)
+    claimed = Job.objects.filter(
+        pk=job.pk, status=Job.QUEUED, run_at=job.run_at,
+    ).update(run_at=lease)
+    return bool(claimed)
+
+
+def _retry_delay(attempts):
+    return settings.JOB_RETRY_DELAY * 2 ** (attempts - 1)
+
+
+def run_job(job):
+    """ Run one claimed job, deleting it if it succeeds """
+    with transaction.atomic():
+        import_string(job.task)(*job.args, **job.kwargs)
+        job.delete()
+
+
+def run_batch(limit=None, now=None):
+    """
+    Run up to limit due jobs in the order they became due, sharing one
+    mail connection between them. Failed jobs are retried with
+    exponential backoff until they run out of attempts.
+    Returns the number that succeeded and the number that failed.
+    """
+    now = now or timezone.now()
+    limit = limit or settings.JOB_BATCH_SIZE
+    due = list(Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+               .order_by('run_at', 'pk')[:limit])
+
+    done = failed = 0
+    with mail.batch():
+        for job in due:
+            if not _claim(job, now):
+                continue
+            try:
+                run_job(job)
+                done += 1
+            except Exception as e:
+                failed += 1
+                attempts = job.attempts + 1
+                update = {'attempts': attempts, 'last_error': repr(e)}
+                if attempts >= job.max_attempts:
+                    update['status'] = Job.FAILED
+                else:
+                    update['run_at'] = timezone.now() + timedelta(
+                        seconds=_retry_delay(attempts))
+                Job.objects.filter(pk=job.pk).update(**update)
+    return done, failed
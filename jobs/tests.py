@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .mail import queue_mail
+from .models import Job
+from .queue import enqueue, run_batch, schedule
+
+calls = []
+
+
+def record(*args, **kwargs):
+    calls.append((args, kwargs))
+
+
+def explode():
+    raise RuntimeError('boom')
+
+
+class CountingBackend(EmailBackend):
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return super().open()
+
+
+@override_settings(JOB_RETRY_DELAY=10, JOB_MAX_ATTEMPTS=2)
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_due_jobs_run_once(self):
+        enqueue(record, 1, 'two', three=3)
+        schedule(60, record, 'later')
+
+        self.assertEqual(run_batch(), (1, 0))
+        self.assertEqual(calls, [((1, 'two'), {'three': 3})])
+        self.assertEqual(run_batch(), (0, 0))
+        self.assertEqual(Job.objects.count(), 1)
+
+        run_batch(now=timezone.now() + timedelta(seconds=61))
+        self.assertEqual(calls[-1], (('later',), {}))
+        self.assertFalse(Job.objects.exists())
+
+    def test_failures_back_off_then_give_up(self):
+        enqueue(explode)
+        self.assertEqual(run_batch(), (0, 1))
+        job = Job.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('boom', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=9))
+
+        self.assertEqual(run_batch(now=job.run_at), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(run_batch(now=job.run_at + timedelta(days=1)), (0, 0))
+
+    def test_unimportable_functions_are_rejected(self):
+        with self.assertRaises(ValueError):
+            enqueue(lambda: None)
+
+    @override_settings(EMAIL_BACKEND='jobs.tests.CountingBackend')
+    def test_batch_shares_one_mail_connection(self):
+        CountingBackend.opened = 0
+        for i in range(3):
+            queue_mail(f'Subject {i}', 'Body', 'shop@example.com',
+                       ['buyer@example.com'], html_message='<p>Body</p>')
+        self.assertEqual(mail.outbox, [])
+
+        self.assertEqual(run_batch(), (3, 0))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(CountingBackend.opened, 1)
+        self.assertEqual(mail.outbox[0].alternatives, [('<p>Body</p>', 'text/html')])
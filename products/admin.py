@@ -13,6 +13,11 @@ class ProductAdmin(admin.ModelAdmin):
         'image',
     )
 
+    list_select_related = ('category',)
+
+    # Used by the product autocomplete on order line items
+    search_fields = ('sku', 'name')
+
     ordering = ('sku',)
 
 class CategoryAdmin(admin.ModelAdmin):
@@ -26,7 +26,8 @@
 
 from django import forms
 from .widgets import CustomClearableFileInput
-from .models import Product, Category
+from .models import Product
+from .registry import category_registry
 
 
 class ProductForm(forms.ModelForm):
@@ -39,7 +40,7 @@ class ProductForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        categories = Category.objects.all()
+        categories = category_registry.all()
         friendly_names = [(c.id, c.get_friendly_name()) for c in categories]
 
         self.fields['category'].choices = friendly_names
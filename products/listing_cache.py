@@ -0,0 +1,61 @@
+from django.conf import settings
+
+from boutique_ado.cache import TieredCache, VersionCounter
+from .models import Product
+from .pagination import KeysetPage
+from .search import normalize_query
+
+
+class ListingCache:
+    """
+    Caches each page of all_products as the ordered list of product ids
+    it contains, in a TieredCache shared by all workers. Keys include a
+    generation number which is bumped on any Product or Category change,
+    so stale pages are never served and simply age out of the LRU.
+    """
+
+    def __init__(self):
+        self._pages = TieredCache(
+            'catalog.listing',
+            l1_size=settings.PRODUCT_LISTING_CACHE_SIZE,
+            l1_ttl=settings.PRODUCT_LISTING_CACHE_TTL,
+        )
+        self._generation = VersionCounter('products:listing_cache:generation')
+
+    def key(self, sort_key, category_ids, query, cursor):
+        return (
+            self._generation.get(),
+            sort_key,
+            tuple(sorted(category_ids)) if category_ids is not None else None,
+            normalize_query(query) if query else None,
+            cursor,
+        )
+
+    def get_page(self, key, compute):
+        """
+        Return the cached page for key, or compute, store and return it
+        """
+        computed = []
+
+        def compute_entry():
+            page = compute()
+            computed.append(page)
+            return [p.pk for p in page], page.has_next, page.next_cursor
+
+        ids, has_next, next_cursor = self._pages.get_or_set(
+            key, compute_entry, timeout=settings.PRODUCT_LISTING_CACHE_TTL)
+        if computed:
+            return computed[0]
+
+        products = Product.objects.select_related('category').in_bulk(ids)
+        return KeysetPage([products[pk] for pk in ids if pk in products],
+                          has_next, next_cursor)
+
+    def invalidate(self):
+        self._generation.bump()
+
+    def clear(self):
+        self._pages.l1.clear()
+
+
+listing_cache = ListingCache()
@@ -0,0 +1,87 @@
+import json
+import platform
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from boutique_ado.benchmarks import BENCHMARKS, find_regressions, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the hot functions of the bag, checkout and product pages '
+        'against fixed synthetic datasets of several sizes, in a throwaway '
+        'test database, and fail if any is slower than its baseline by '
+        'more than the regression threshold'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', metavar='benchmark',
+                            help=f'Benchmarks to run, of: {", ".join(BENCHMARKS)}')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--baseline', default=str(settings.BENCHMARK_BASELINE))
+        parser.add_argument('--threshold', type=float,
+                            default=settings.BENCHMARK_REGRESSION_THRESHOLD,
+                            help='Percentage slowdown that counts as a regression')
+        parser.add_argument('--save', action='store_true',
+                            help='Store these timings as the new baseline')
+
+    def handle(self, *args, **options):
+        unknown = set(options['names']) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f'Unknown benchmarks: {", ".join(sorted(unknown))}')
+        baseline = self._load(options['baseline'])
+
+        self.stdout.write(f'{"benchmark":<28} {"best":>12} {"median":>12} {"baseline":>12} {"change":>8}')
+
+        def report(label, timings):
+            line = (f'{label:<28} {timings["min_us"]:>10.1f}us '
+                    f'{timings["median_us"]:>10.1f}us')
+            before = baseline.get(label)
+            if before:
+                change = (timings['min_us'] - before['min_us']) / before['min_us'] * 100
+                line += f' {before["min_us"]:>10.1f}us {change:>+7.1f}%'
+            self.stdout.write(line)
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = run_benchmarks(options['names'], options['repeat'],
+                                     options['seed'], on_result=report)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['save']:
+            self._save(options['baseline'], dict(baseline, **results))
+            self.stdout.write(f'Baseline saved to {options["baseline"]}')
+            return
+        if not baseline:
+            self.stdout.write(f'No baseline at {options["baseline"]}; run with --save to store one')
+            return
+
+        regressions = find_regressions(baseline, results, options['threshold'])
+        if regressions:
+            raise CommandError(
+                f'{len(regressions)} benchmark(s) regressed by more than '
+                f'{options["threshold"]:g}%: ' + ', '.join(
+                    f'{label} ({before:.1f}us -> {after:.1f}us)'
+                    for label, (before, after) in regressions.items()))
+
+    def _load(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)['benchmarks']
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f'Cannot read the baseline {path}: {e}')
+
+    def _save(self, path, benchmarks):
+        with open(path, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'database': connection.vendor,
+                'benchmarks': benchmarks,
+            }, f, indent=2, sort_keys=True)
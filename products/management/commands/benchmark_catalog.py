@@ -0,0 +1,142 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+
+from boutique_ado import datagen
+from products.pagination import keyset_queryset
+from products.registry import category_registry
+from products.views import SORT_EXPRESSIONS
+
+BEFORE_MIGRATION = '0003_product_search_index'
+AFTER_MIGRATION = '0004_catalog_indexes'
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every all_products sort/filter combination against a '
+        'synthetic catalog in a throwaway test database, before and after '
+        'the catalog index migration'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--plans', action='store_true',
+                            help='Print the full query plan for every query')
+
+    def handle(self, *args, **options):
+        self.options = options
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            call_command('migrate', 'products', BEFORE_MIGRATION, verbosity=0)
+            # The models as of these migrations, as later ones add columns
+            state = MigrationExecutor(connection).loader.project_state(
+                ('products', BEFORE_MIGRATION))
+            self.Product = state.apps.get_model('products', 'Product')
+            self.Category = state.apps.get_model('products', 'Category')
+            self._populate()
+            before = self._run_all()
+
+            call_command('migrate', 'products', AFTER_MIGRATION, verbosity=0)
+            after = self._run_all()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self._report(before, after)
+
+    def _populate(self):
+        rng = random.Random(self.options['seed'])
+        words = ['blue', 'black', 'slim', 'classic', 'cotton', 'denim', 'shirt',
+                 'jeans', 'jacket', 'sock', 'hat', 'dress', 'shoe', 'leather']
+
+        def product(i, categories):
+            return {
+                'category': rng.choice(categories + [None]),
+                'sku': f'SKU{i:08d}',
+                'name': ' '.join(rng.choice(words).title() for _ in range(3)),
+                'description': '',
+                'price': Decimal(rng.randint(100, 99999)) / 100,
+                'rating': (None if rng.random() < 0.2
+                           else Decimal(rng.randint(0, 500)) / 100),
+            }
+
+        categories = datagen.create_catalog(
+            self.options['categories'], self.options['products'], product,
+            product_model=self.Product, category_model=self.Category, batch_size=5000)
+        self.category_names = [c.name for c in categories[:2]]
+
+    def _combinations(self):
+        sorts = [None] + list(SORT_EXPRESSIONS)
+        category_filters = [None, tuple(self.category_names[:1]), tuple(self.category_names)]
+        for sort in sorts:
+            for direction in ('asc', 'desc'):
+                for categories in category_filters:
+                    for deep in (False, True):
+                        yield sort, direction, categories, deep
+
+    def _queryset(self, sort, direction, categories, deep):
+        products = self.Product.objects.all()
+        if categories:
+            products = products.filter(
+                category_id__in=category_registry.ids_for_names(categories))
+        expression = SORT_EXPRESSIONS.get(sort)
+        descending = direction == 'desc'
+
+        position = None
+        if deep:
+            # Seek to a position halfway through the listing, as a
+            # cursor from a later page would
+            middle = keyset_queryset(products, expression, descending)
+            count = middle.count()
+            row = middle[count // 2] if count else None
+            if row is not None:
+                position = (getattr(row, 'keyset_value', None), row.pk)
+
+        queryset = keyset_queryset(products, expression, descending, position)
+        return queryset[:settings.PRODUCTS_PER_PAGE + 1]
+
+    def _run_all(self):
+        results = {}
+        for combination in self._combinations():
+            queryset = self._queryset(*combination)
+            timings = []
+            for _ in range(self.options['repeat']):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            results[combination] = {
+                'ms': statistics.median(timings),
+                'plan': queryset.explain(),
+            }
+        return results
+
+    def _label(self, sort, direction, categories, deep):
+        label = f'sort={sort or "-"} {direction:<4}'
+        label += f' categories={len(categories) if categories else 0}'
+        return label + (' page=middle' if deep else ' page=first')
+
+    def _report(self, before, after):
+        self.stdout.write(
+            f'{self.options["products"]} products, '
+            f'{self.options["categories"]} categories, '
+            f'median of {self.options["repeat"]} runs ({connection.vendor})\n')
+        self.stdout.write(f'{"query":<48} {"before":>10} {"after":>10} {"speedup":>8}')
+        for combination, result in before.items():
+            label = self._label(*combination)
+            old_ms = result['ms']
+            new_ms = after[combination]['ms']
+            speedup = old_ms / new_ms if new_ms else float('inf')
+            self.stdout.write(
+                f'{label:<48} {old_ms:>8.2f}ms {new_ms:>8.2f}ms {speedup:>7.1f}x')
+            if self.options['plans']:
+                self.stdout.write('  before: ' + result['plan'].replace('\n', '\n          '))
+                self.stdout.write('  after:  ' + after[combination]['plan'].replace('\n', '\n          '))
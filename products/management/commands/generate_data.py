@@ -0,0 +1,139 @@
+import os
+import time
+from datetime import datetime
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from boutique_ado import datagen
+from checkout.models import Order, OrderLineItem
+from products.listing_cache import listing_cache
+from products.models import Product, Category
+from products.registry import category_registry
+from products.search import rebuild_index
+from products.thumbnails import create_pool
+from profiles.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        'Add generated products, users with profiles, and orders with line '
+        'items to the database, e.g. --products 1000000 --users 50000 '
+        '--orders 4000000. The same seed and chunk size always add the '
+        'same rows to the same database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--orders', type=int, default=20000,
+                            help='Orders to add, each with 1 to 5 line items')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--since', default='2020-01-01',
+                            help='Date of the first order, YYYY-MM-DD')
+        parser.add_argument('--days', type=int, default=3 * 365,
+                            help='Days the orders are spread over')
+        parser.add_argument('--password', default='password',
+                            help='Password of every generated user')
+        parser.add_argument('--chunk-size', type=int, default=20000,
+                            help='Rows generated by each task')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Rows per INSERT')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Size of the process pool; 0 runs inline')
+
+    def handle(self, *args, **options):
+        self.options = options
+        try:
+            since = timezone.make_aware(datetime.strptime(options['since'], '%Y-%m-%d'))
+        except ValueError:
+            raise CommandError('--since must be a date in the form YYYY-MM-DD')
+        seed = options['seed']
+        batch_size = options['batch_size']
+
+        pool = create_pool(options['workers']) if options['workers'] > 0 else None
+        try:
+            self.pool = pool
+            if options['products']:
+                category_ids = self._categories(options['categories'])
+                first_pk = self._next_pk(Product)
+                self._run('products', options['products'], datagen.generate_products,
+                          lambda start, count: (seed, start, count, first_pk,
+                                                category_ids, batch_size))
+                rebuild_index()
+                category_registry.invalidate()
+                listing_cache.invalidate()
+
+            if options['users']:
+                first_user_pk = self._next_pk(User)
+                first_profile_pk = self._next_pk(UserProfile)
+                password = make_password(options['password'], salt=f'generated{seed}')
+                self._run('users', options['users'], datagen.generate_users,
+                          lambda start, count: (seed, start, count, first_user_pk,
+                                                first_profile_pk, password, since,
+                                                batch_size))
+
+            if options['orders']:
+                product_range = self._pk_range(Product)
+                if not product_range:
+                    raise CommandError('Orders need products; add some with --products')
+                profile_range = self._pk_range(UserProfile)
+                first_pk = self._next_pk(Order)
+                total = options['orders']
+                self._run('orders', total, datagen.generate_orders,
+                          lambda start, count: (seed, start, count, total, first_pk,
+                                                product_range, profile_range, since,
+                                                options['days'], batch_size))
+        finally:
+            if pool:
+                pool.shutdown()
+
+        self._reset_sequences()
+
+    def _run(self, kind, total, generate, arguments):
+        started = time.monotonic()
+        chunks = datagen.chunks(total, self.options['chunk_size'])
+        if self.pool:
+            futures = [self.pool.submit(generate, *arguments(start, count))
+                       for start, count in chunks]
+            done = sum(future.result() for future in futures)
+        else:
+            done = sum(generate(*arguments(start, count)) for start, count in chunks)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {done} {kind} in {elapsed:.1f}s ({done / elapsed:.0f}/s)'))
+
+    def _categories(self, count):
+        """ The ids of generated categories, created on the first run """
+        names = [f'generated_{i}' for i in range(count)]
+        existing = set(Category.objects.filter(name__in=names).values_list('name', flat=True))
+        Category.objects.bulk_create(
+            Category(name=name, friendly_name=f'Generated {i}')
+            for i, name in enumerate(names) if name not in existing
+        )
+        category_registry.invalidate()
+        return list(Category.objects.filter(name__in=names)
+                    .order_by('pk').values_list('pk', flat=True))
+
+    def _next_pk(self, model):
+        return (model.objects.aggregate(Max('pk'))['pk__max'] or 0) + 1
+
+    def _pk_range(self, model):
+        bounds = model.objects.aggregate(Min('pk'), Max('pk'))
+        if bounds['pk__min'] is None:
+            return None
+        return bounds['pk__min'], bounds['pk__max']
+
+    def _reset_sequences(self):
+        """ Rows were inserted with explicit ids, which sequences don't see """
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [Category, Product, User, UserProfile, Order, OrderLineItem])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -0,0 +1,37 @@
+from concurrent.futures import as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from products.models import Product
+from products.thumbnails import create_pool, process_product
+
+
+class Command(BaseCommand):
+    help = 'Generate responsive WebP and JPEG derivatives of product images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='*', type=int,
+                            help='Only these products (default: all with an image)')
+        parser.add_argument('--workers', type=int, default=settings.THUMBNAIL_WORKERS,
+                            help='Size of the process pool; 0 runs inline')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate derivatives that already exist')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image__isnull=True)
+        if options['product_ids']:
+            products = products.filter(pk__in=options['product_ids'])
+        product_ids = list(products.values_list('pk', flat=True))
+        force = options['force']
+
+        if options['workers'] > 0:
+            with create_pool(options['workers']) as pool:
+                futures = [pool.submit(process_product, pk, force) for pk in product_ids]
+                results = [future.result() for future in as_completed(futures)]
+        else:
+            results = [process_product(pk, force) for pk in product_ids]
+
+        generated = [pk for pk, widths in results if widths is not None]
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated derivatives for {len(generated)} of {len(product_ids)} products'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for all products'
+
+    def handle(self, *args, **options):
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} products'))
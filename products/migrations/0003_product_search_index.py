@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from products.search import rebuild_index
+    rebuild_index(schema_editor.connection, apps.get_model('products', 'Product'))
+
+
+def drop_search_index(apps, schema_editor):
+    from products.search import get_backend
+    backend = get_backend(schema_editor.connection)
+    if backend:
+        with schema_editor.connection.cursor() as cursor:
+            backend.drop(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_auto_20201014_1413'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.1.3 on 2026-10-18 08:39
+
+from django.db import migrations, models
+
+# SQLite adds and removes this field by rebuilding the table, which drops
+# the expression index 0004 created outside the model state
+CREATE_LOWER_NAME_INDEX = (
+    'CREATE INDEX IF NOT EXISTS product_lower_name_idx ON products_product (LOWER(name), id)'
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_catalog_indexes'),
+    ]
+
+    operations = [
+        # Restores the index after the rebuild when migrating back
+        migrations.RunSQL(migrations.RunSQL.noop, reverse_sql=CREATE_LOWER_NAME_INDEX),
+        migrations.AddField(
+            model_name='product',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunSQL(CREATE_LOWER_NAME_INDEX, reverse_sql=migrations.RunSQL.noop),
+    ]
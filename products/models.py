@@ -8,7 +8,7 @@ class Category(models.Model):
     class Meta:
         verbose_name_plural = 'Categories'
 
-    name = models.CharField(max_length=254)
+    name = models.CharField(max_length=254, db_index=True)
     friendly_name = models.CharField(max_length=254, null=True, blank=True)
 
     def __str__(self):
@@ -19,6 +19,16 @@ class Category(models.Model):
 
 
 class Product(models.Model):
+
+    class Meta:
+        # lower(name) is indexed in migration 0004 as Django 3.1
+        # indexes can't hold expressions
+        indexes = [
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['rating', 'id'], name='product_rating_idx'),
+            models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+        ]
+
     category = models.ForeignKey('Category', null=True, blank=True, on_delete=models.SET_NULL)
     sku = models.CharField(max_length=254, null=True, blank=True)
     name = models.CharField(max_length=254)
@@ -28,6 +38,7 @@ class Product(models.Model):
     rating = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
     image_url = models.URLField(max_length=1024, null=True, blank=True)
     image = models.ImageField(null=True, blank=True)
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.name
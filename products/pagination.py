@@ -0,0 +1,103 @@
+from decimal import Decimal
+
+from django.core import signing
+from django.db.models import F, Q
+
+CURSOR_SALT = 'products.pagination.cursor'
+
+
+class KeysetPage:
+    """ One page of results plus the cursor for the page after it """
+
+    def __init__(self, object_list, has_next, next_cursor):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _encode(sort_key, value, pk):
+    if isinstance(value, Decimal):
+        value = ['decimal', str(value)]
+    return signing.dumps([sort_key, value, pk], salt=CURSOR_SALT, compress=True)
+
+
+def _decode(sort_key, cursor):
+    """
+    Return the (value, pk) position stored in the cursor, or None if it
+    is missing, tampered with or was issued for a different sort
+    """
+    if not cursor:
+        return None
+    try:
+        cursor_sort_key, value, pk = signing.loads(cursor, salt=CURSOR_SALT)
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    if cursor_sort_key != sort_key or not isinstance(pk, int):
+        return None
+    if isinstance(value, list) and len(value) == 2 and value[0] == 'decimal':
+        value = Decimal(value[1])
+    return value, pk
+
+
+def _after(value, pk, descending):
+    """
+    Rows that come after (value, pk). NULL values sort after everything
+    else ascending and before everything else descending on every
+    database, matching the way Postgres B-tree indexes are ordered.
+    """
+    if descending:
+        if value is None:
+            return Q(keyset_value__isnull=True, pk__lt=pk) | Q(keyset_value__isnull=False)
+        return Q(keyset_value__lt=value) | Q(keyset_value=value, pk__lt=pk)
+    if value is None:
+        return Q(keyset_value__isnull=True, pk__gt=pk)
+    return (Q(keyset_value__gt=value)
+            | Q(keyset_value=value, pk__gt=pk)
+            | Q(keyset_value__isnull=True))
+
+
+def keyset_queryset(queryset, sort_expression, descending, position=None):
+    """
+    Order queryset by sort_expression with ties broken on pk, keeping
+    only the rows after position, a (value, pk) pair
+    """
+    if sort_expression is None:
+        if position:
+            queryset = queryset.filter(
+                **{'pk__lt' if descending else 'pk__gt': position[1]})
+        return queryset.order_by('-pk' if descending else 'pk')
+
+    queryset = queryset.annotate(keyset_value=sort_expression)
+    if position:
+        queryset = queryset.filter(_after(*position, descending))
+    if descending:
+        return queryset.order_by(F('keyset_value').desc(nulls_first=True), '-pk')
+    return queryset.order_by(F('keyset_value').asc(nulls_last=True), 'pk')
+
+
+def paginate(queryset, sort_key, sort_expression, descending, cursor, per_page):
+    """
+    Return the page of queryset following cursor, ordered by
+    sort_expression with ties broken on pk. One extra row is fetched to
+    tell whether there is a next page, so no COUNT(*) is needed.
+    """
+    position = _decode(sort_key, cursor)
+    queryset = keyset_queryset(queryset, sort_expression, descending, position)
+
+    rows = list(queryset[:per_page + 1])
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+
+    next_cursor = None
+    if has_next:
+        last = rows[-1]
+        value = getattr(last, 'keyset_value', None)
+        next_cursor = _encode(sort_key, value, last.pk)
+
+    return KeysetPage(rows, has_next, next_cursor)
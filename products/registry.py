@@ -0,0 +1,63 @@
+import threading
+import time
+
+from boutique_ado.cache import VersionCounter
+from .models import Category
+
+# Upper bound on staleness should a worker miss an invalidation,
+# e.g. when the cache holding the version is not shared between workers
+MAX_AGE = 300
+
+
+class CategoryRegistry:
+    """
+    In-process copy of the Category table, loaded once per worker.
+
+    A version number kept in the Django cache is bumped whenever a
+    Category is saved or deleted. Each worker compares it with the
+    version it loaded and reloads when they differ.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counter = VersionCounter('products:category_registry:version')
+        self._version = None
+        self._loaded_at = 0
+        self._by_id = {}
+        self._by_name = {}
+
+    def _ensure_loaded(self):
+        version = self._counter.get()
+        if version == self._version and time.monotonic() - self._loaded_at < MAX_AGE:
+            return
+        with self._lock:
+            categories = list(Category.objects.order_by('pk'))
+            self._by_id = {c.pk: c for c in categories}
+            self._by_name = {c.name: c for c in categories}
+            self._version = version
+            self._loaded_at = time.monotonic()
+
+    def all(self):
+        """ Every category, ordered by pk """
+        self._ensure_loaded()
+        return list(self._by_id.values())
+
+    def get(self, pk):
+        self._ensure_loaded()
+        return self._by_id.get(pk)
+
+    def filter_names(self, names):
+        """ The categories with the given names, skipping unknown ones """
+        self._ensure_loaded()
+        return [self._by_name[n] for n in names if n in self._by_name]
+
+    def ids_for_names(self, names):
+        return [c.pk for c in self.filter_names(names)]
+
+    def invalidate(self):
+        """ Tell every worker to reload on its next access """
+        self._counter.bump()
+        self._version = None
+
+
+category_registry = CategoryRegistry()
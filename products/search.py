@@ -0,0 +1,210 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Product, Category
+
+
+SQLITE_TABLE = 'products_product_fts'
+POSTGRES_TABLE = 'products_product_search'
+
+# Relative weights of name, description, sku and category
+SQLITE_WEIGHTS = (10.0, 1.0, 5.0, 3.0)
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _terms(query):
+    return TERM_RE.findall(query.lower())
+
+
+def normalize_query(query):
+    """
+    Canonical form of a search query; queries with the same canonical
+    form always return the same results
+    """
+    return ' '.join(_terms(query))
+
+
+def _document(name, description, sku, category_name=None,
+              category_friendly_name=None):
+    """
+    Return the (name, description, sku, category) text indexed for a product
+    """
+    category = ' '.join(n for n in (category_name, category_friendly_name) if n)
+    return (name or '', description or '', sku or '', category)
+
+
+def _product_document(product):
+    category = (None, None)
+    if product.category_id:
+        category = Category.objects.filter(
+            pk=product.category_id).values_list(
+                'name', 'friendly_name').first() or category
+    return _document(product.name, product.description, product.sku, *category)
+
+
+class SQLiteSearchBackend:
+    """ Inverted index stored in an SQLite FTS5 virtual table """
+
+    def create(self, cursor):
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} USING fts5('
+            'name, description, sku, category, '
+            "tokenize = 'porter unicode61')")
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {SQLITE_TABLE}')
+
+    def index(self, cursor, product_id, document):
+        self.remove(cursor, product_id)
+        cursor.execute(
+            f'INSERT INTO {SQLITE_TABLE} '
+            '(rowid, name, description, sku, category) '
+            'VALUES (%s, %s, %s, %s, %s)', [product_id, *document])
+
+    def remove(self, cursor, product_id):
+        cursor.execute(
+            f'DELETE FROM {SQLITE_TABLE} WHERE rowid = %s', [product_id])
+
+    def match(self, terms):
+        """
+        Every term must match, each one as a prefix so that
+        'jean' finds 'jeans'. Returns the table to join, the conditions
+        joining and matching it, their params and the rank expression.
+        """
+        expression = ' '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(w) for w in SQLITE_WEIGHTS)
+        where = [f'{SQLITE_TABLE}.rowid = {Product._meta.db_table}.id',
+                 f'{SQLITE_TABLE} MATCH %s']
+        rank = RawSQL(f'-bm25({SQLITE_TABLE}, {weights})', [])
+        return SQLITE_TABLE, where, [expression], rank
+
+
+class PostgresSearchBackend:
+    """ Weighted tsvector documents in a side table with a GIN index """
+
+    DOCUMENT_SQL = (
+        "setweight(to_tsvector('english', %s), 'A') || "
+        "setweight(to_tsvector('english', %s), 'C') || "
+        "setweight(to_tsvector('simple', %s), 'A') || "
+        "setweight(to_tsvector('english', %s), 'B')")
+
+    def create(self, cursor):
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} ('
+            'product_id integer PRIMARY KEY '
+            f'REFERENCES {Product._meta.db_table} (id) '
+            'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            'document tsvector NOT NULL)')
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {POSTGRES_TABLE}_document_gin '
+            f'ON {POSTGRES_TABLE} USING GIN (document)')
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {POSTGRES_TABLE}')
+
+    def index(self, cursor, product_id, document):
+        cursor.execute(
+            f'INSERT INTO {POSTGRES_TABLE} (product_id, document) '
+            f'VALUES (%s, {self.DOCUMENT_SQL}) '
+            'ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document',
+            [product_id, *document])
+
+    def remove(self, cursor, product_id):
+        cursor.execute(
+            f'DELETE FROM {POSTGRES_TABLE} WHERE product_id = %s', [product_id])
+
+    def match(self, terms):
+        expression = ' & '.join(f'{term}:*' for term in terms)
+        where = [f'{POSTGRES_TABLE}.product_id = {Product._meta.db_table}.id',
+                 f"{POSTGRES_TABLE}.document @@ to_tsquery('english', %s)"]
+        rank = RawSQL(
+            f"ts_rank({POSTGRES_TABLE}.document, to_tsquery('english', %s))",
+            [expression])
+        return POSTGRES_TABLE, where, [expression], rank
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(conn=None):
+    """
+    Return the search backend for the given connection, or None when
+    the database has no full-text support we know how to use
+    """
+    backend = BACKENDS.get((conn or connection).vendor)
+    return backend() if backend else None
+
+
+def index_product(product):
+    """ Add or refresh a single product in the search index """
+    backend = get_backend()
+    if backend:
+        with connection.cursor() as cursor:
+            backend.index(cursor, product.pk, _product_document(product))
+
+
+def remove_product(product_id):
+    """ Drop a single product from the search index """
+    backend = get_backend()
+    if backend:
+        with connection.cursor() as cursor:
+            backend.remove(cursor, product_id)
+
+
+def rebuild_index(conn=None, product_model=Product):
+    """
+    Recreate the search index from scratch. Migrations pass their
+    historical Product model.
+    """
+    conn = conn or connection
+    backend = get_backend(conn)
+    if not backend:
+        return 0
+    rows = product_model.objects.using(conn.alias).values_list(
+        'pk', 'name', 'description', 'sku',
+        'category__name', 'category__friendly_name')
+    count = 0
+    # One transaction, rather than a commit for every product
+    with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+        backend.drop(cursor)
+        backend.create(cursor)
+        for pk, *fields in rows.iterator():
+            backend.index(cursor, pk, _document(*fields))
+            count += 1
+    return count
+
+
+def search_products(products, query, order_by_rank=True):
+    """
+    Filter a product queryset down to those matching every term of
+    the query. Results always carry a search_rank annotation (higher is
+    more relevant, 0 without a full-text index) and are ordered by it
+    unless order_by_rank is False.
+    """
+    no_rank = Value(0.0, output_field=FloatField())
+    terms = _terms(query)
+    if not terms:
+        return products.none().annotate(search_rank=no_rank)
+
+    backend = get_backend()
+    if backend is None:
+        for term in terms:
+            products = products.filter(
+                Q(name__icontains=term) | Q(description__icontains=term))
+        products = products.annotate(search_rank=no_rank)
+    else:
+        # Joined rather than matched in a subquery per row, so the index is
+        # searched once however many products match
+        table, where, params, rank = backend.match(terms)
+        products = products.extra(tables=[table], where=where, params=params)
+        products = products.annotate(search_rank=rank)
+    if order_by_rank:
+        products = products.order_by('-search_rank', 'pk')
+    return products
@@ -0,0 +1,73 @@
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from .models import Product, Category
+from .registry import category_registry
+from .listing_cache import listing_cache
+from . import search
+
+
+@receiver(post_save, sender=Product)
+def index_on_save(sender, instance, **kwargs):
+    """
+    Refresh the product's search index entry on create/update
+    """
+    search.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_on_delete(sender, instance, **kwargs):
+    """
+    Remove the product from the search index on delete
+    """
+    search.remove_product(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_on_save(sender, instance, **kwargs):
+    """
+    Category names are indexed with each product, so refresh them all
+    """
+    for product in instance.product_set.all():
+        search.index_product(product)
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_products(sender, instance, **kwargs):
+    instance._indexed_product_ids = list(
+        instance.product_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def reindex_category_on_delete(sender, instance, **kwargs):
+    """
+    Products lose their category name once it is deleted
+    """
+    products = Product.objects.filter(
+        pk__in=getattr(instance, '_indexed_product_ids', []))
+    for product in products:
+        search.index_product(product)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_registry(sender, **kwargs):
+    """
+    Reload the category registry in this worker straight away, and in
+    every worker once the change is committed
+    """
+    category_registry.invalidate()
+    transaction.on_commit(category_registry.invalidate)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_listing_cache(sender, **kwargs):
+    """
+    Any catalog change may alter which products a listing page shows
+    """
+    listing_cache.invalidate()
+    transaction.on_commit(listing_cache.invalidate)
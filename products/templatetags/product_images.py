@@ -0,0 +1,27 @@
+from django import template
+
+from products.thumbnails import srcset
+
+
+register = template.Library()
+
+
+@register.inclusion_tag('products/includes/product_picture.html')
+def product_picture(product, css_class='', sizes='100vw', lazy=True):
+    """
+    Render a product's image as a <picture> offering its WebP and JPEG
+    derivatives, falling back to the original image
+    """
+    return {
+        'product': product,
+        'css_class': css_class,
+        'sizes': sizes,
+        'lazy': lazy,
+        'webp_srcset': srcset(product, 'webp'),
+        'jpeg_srcset': srcset(product, 'jpeg'),
+    }
+
+
+@register.filter(name='srcset')
+def srcset_filter(product, fmt='jpeg'):
+    return srcset(product, fmt)
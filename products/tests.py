@@ -1,3 +1,491 @@
-from django.test import TestCase
+import io
+import json
+import multiprocessing
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+
+from boutique_ado import datagen
+from boutique_ado.benchmarks import _products, find_regressions, run_benchmarks
+from boutique_ado.cache import LRUCache, TieredCache, cache_stats
+from checkout.models import Order
+from profiles.models import UserProfile
+from .models import Product, Category
+from .forms import ProductForm
+from .registry import category_registry
+from .search import search_products
+from .thumbnails import derivative_name, srcset
+
+
+class ProductSearchTests(TestCase):
+
+    def setUp(self):
+        self.jeans = Category.objects.create(name='jeans', friendly_name='Jeans')
+        self.slim = Product.objects.create(
+            name='Slim Blue Jeans', description='Stretch denim', price=30,
+            sku='SKU123', category=self.jeans)
+        self.jacket = Product.objects.create(
+            name='Denim Jacket', description='A jacket to go with blue jeans',
+            price=50)
+
+    def search(self, query):
+        return list(search_products(Product.objects.all(), query))
+
+    def test_results_are_ranked_by_relevance(self):
+        self.assertEqual(self.search('jeans'), [self.slim, self.jacket])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.search('blue jacket'), [self.jacket])
+
+    def test_sku_and_category_are_searchable(self):
+        self.assertEqual(self.search('sku123'), [self.slim])
+        self.jacket.category = self.jeans
+        self.jacket.save()
+        self.jeans.friendly_name = 'Trousers'
+        self.jeans.save()
+        self.assertEqual(set(self.search('trousers')), {self.slim, self.jacket})
+
+    def test_index_follows_saves_and_deletes(self):
+        self.slim.name = 'Skinny Black Chinos'
+        self.slim.save()
+        self.assertEqual(self.search('chinos'), [self.slim])
+
+        self.slim.delete()
+        self.assertEqual(self.search('chinos'), [])
+
+    def test_all_products_view_searches(self):
+        response = self.client.get('/products/', {'q': 'denim jacket'})
+        self.assertEqual(list(response.context['products']), [self.jacket])
+
+    def test_punctuation_only_queries_find_nothing(self):
+        for query in ('"', '!', '?!'):
+            with self.subTest(query=query):
+                response = self.client.get('/products/', {'q': query})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(list(response.context['products']), [])
+
+    def test_databases_without_full_text_search_fall_back_to_icontains(self):
+        with mock.patch('products.search.get_backend', return_value=None):
+            response = self.client.get('/products/', {'q': 'denim jacket'})
+        self.assertEqual(list(response.context['products']), [self.jacket])
+
+    def test_ranked_search_cost_does_not_grow_with_the_hits(self):
+        def ranked(query):
+            products = search_products(Product.objects.all(), query)
+            with CaptureQueriesContext(connection) as ctx:
+                list(products[:24])
+            return len(ctx.captured_queries), products[:24].explain()
+
+        few = ranked('slim')
+        for i in range(40):
+            Product.objects.create(name=f'Slim Shirt {i}', description='', price=10)
+        many = ranked('slim')
+
+        self.assertEqual(few, many)
+        # The index is searched once, not once per matching row
+        self.assertNotIn('CORRELATED', many[1])
+
+
+@override_settings(PRODUCTS_PER_PAGE=3)
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        shirts = Category.objects.create(name='shirts', friendly_name='Shirts')
+        jeans = Category.objects.create(name='jeans', friendly_name='Jeans')
+        rows = [
+            ('b shirt', 10, 4, shirts), ('A shirt', 10, None, shirts),
+            ('c jeans', 20, 4, jeans), ('d jeans', 5, 2, jeans),
+            ('e hat', 20, None, None), ('F hat', 15, 3, None),
+            ('g sock', 5, 4, shirts),
+        ]
+        for name, price, rating, category in rows:
+            Product.objects.create(name=name, description='', price=price,
+                                   rating=rating, category=category)
+
+    def walk(self, params):
+        names = []
+        page_params = dict(params)
+        for _ in range(10):
+            response = self.client.get('/products/', page_params)
+            page = response.context['products']
+            names += [p.name for p in page]
+            if not page.has_next:
+                break
+            page_params['after'] = page.next_cursor
+        return names
+
+    def expected(self, key, descending):
+        products = list(Product.objects.order_by('pk'))
+
+        def sort_key(p):
+            value = key(p)
+            return (value is None, value if value is not None else 0)
+        return [p.name for p in sorted(products, key=sort_key, reverse=descending)]
+
+    def test_every_sort_and_direction_pages_through_all_products(self):
+        keys = {
+            'name': lambda p: p.name.lower(),
+            'price': lambda p: p.price,
+            'rating': lambda p: p.rating,
+            'category': lambda p: p.category.name if p.category else None,
+        }
+        for sort, key in keys.items():
+            for direction in ('asc', 'desc'):
+                with self.subTest(sort=sort, direction=direction):
+                    names = self.walk({'sort': sort, 'direction': direction})
+                    self.assertEqual(len(names), 7)
+                    self.assertEqual(
+                        [key(Product.objects.get(name=n)) for n in names],
+                        [key(Product.objects.get(name=n))
+                         for n in self.expected(key, direction == 'desc')])
+
+    def test_ties_are_broken_on_pk(self):
+        names = self.walk({'sort': 'price', 'direction': 'asc'})
+        self.assertEqual(names, self.expected(lambda p: p.price, False))
+
+    def test_invalid_cursor_starts_from_first_page(self):
+        response = self.client.get('/products/', {'after': 'garbage'})
+        self.assertEqual(len(response.context['products']), 3)
+
+    @override_settings(PRODUCTS_PER_PAGE=2)
+    def test_listing_says_how_many_products_the_page_shows(self):
+        response = self.client.get('/products/', {'q': 'shirt'})
+        self.assertContains(response, 'Showing 2 products found for')
+
+
+class ListingQueryCountTests(TestCase):
+
+    def add_products(self, count):
+        category = Category.objects.create(name='shirts', friendly_name='Shirts')
+        for i in range(count):
+            Product.objects.create(name=f'Shirt {i}', description='', price=10,
+                                   category=category)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    def test_all_products_query_count_is_constant(self):
+        self.add_products(1)
+        baseline = self.count_queries('/products/')
+        self.add_products(10)
+
+        with self.assertNumQueries(baseline):
+            self.client.get('/products/')
+        with self.assertNumQueries(baseline):
+            self.client.get('/products/?sort=category&direction=asc')
+
+    def test_admin_changelist_query_count_is_constant(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        self.add_products(1)
+        baseline = self.count_queries('/admin/products/product/')
+        self.add_products(10)
+
+        with self.assertNumQueries(baseline):
+            self.client.get('/admin/products/product/')
+
+
+class CatalogIndexTests(TestCase):
+
+    def test_migrations_leave_every_catalog_index(self):
+        # product_lower_name_idx is raw SQL outside the model state, so a
+        # later migration that rebuilds the table can drop it unnoticed
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, 'products_product')
+        for name in ('product_price_idx', 'product_rating_idx',
+                     'product_category_price_idx', 'product_lower_name_idx'):
+            with self.subTest(index=name):
+                self.assertIn(name, constraints)
+                self.assertTrue(constraints[name]['index'])
+
+
+class CategoryRegistryTests(TestCase):
+
+    def setUp(self):
+        self.jeans = Category.objects.create(name='jeans', friendly_name='Jeans')
+
+    def test_categories_are_loaded_once(self):
+        ProductForm()
+        with self.assertNumQueries(0):
+            form = ProductForm()
+        self.assertEqual(form.fields['category'].choices, [(self.jeans.id, 'Jeans')])
+
+    def test_saving_a_category_invalidates_the_registry(self):
+        self.assertEqual(category_registry.ids_for_names(['shirts']), [])
+        shirts = Category.objects.create(name='shirts', friendly_name='Shirts')
+        self.assertEqual(category_registry.ids_for_names(['shirts']), [shirts.id])
+
+        shirts.delete()
+        self.assertEqual(category_registry.ids_for_names(['shirts']), [])
+
+    def test_listing_filters_on_category_id(self):
+        product = Product.objects.create(name='Jeans', description='', price=10,
+                                         category=self.jeans)
+        category_registry.all()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/products/', {'category': 'jeans,unknown'})
+
+        self.assertEqual(list(response.context['products']), [product])
+        self.assertEqual(response.context['current_categories'], [self.jeans])
+        self.assertFalse(any('FROM "products_category"' in q['sql']
+                             for q in queries.captured_queries))
+
+
+class ListingCacheTests(TestCase):
+
+    def setUp(self):
+        self.jeans = Category.objects.create(name='jeans', friendly_name='Jeans')
+        self.cheap = Product.objects.create(name='Cheap Jeans', description='',
+                                            price=10, category=self.jeans)
+        self.dear = Product.objects.create(name='Dear Jeans', description='',
+                                           price=90, category=self.jeans)
+        self.params = {'category': 'jeans', 'sort': 'price', 'direction': 'desc', 'q': 'Jeans'}
+
+    def listing(self, params):
+        return list(self.client.get('/products/', params).context['products'])
+
+    def test_repeat_requests_load_cached_ids(self):
+        self.assertEqual(self.listing(self.params), [self.dear, self.cheap])
+
+        with CaptureQueriesContext(connection) as queries:
+            products = self.listing(dict(self.params, q='  JEANS! '))
+
+        self.assertEqual(products, [self.dear, self.cheap])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('MATCH', queries[0]['sql'])
+        self.assertNotIn('ORDER BY', queries[0]['sql'])
+
+    def test_product_changes_invalidate_cached_pages(self):
+        self.listing(self.params)
+        self.cheap.price = 100
+        self.cheap.save()
+        self.assertEqual(self.listing(self.params), [self.cheap, self.dear])
+
+        self.cheap.delete()
+        self.assertEqual(self.listing(self.params), [self.dear])
+
+
+class LRUCacheTests(TestCase):
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+    def test_entries_expire(self):
+        cache = LRUCache(max_size=2, ttl=-1)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+
+class TieredCacheTests(TestCase):
+
+    def setUp(self):
+        self.namespace = f'test.{uuid.uuid4().hex}'
+        self.cache = TieredCache(self.namespace)
+
+    def test_values_are_served_from_l1_then_l2(self):
+        self.cache.get_or_set('key', lambda: 'value', timeout=60)
+        self.assertEqual(self.cache.get_or_set('key', lambda: 'other', timeout=60), 'value')
+
+        self.cache.l1.clear()
+        self.assertEqual(self.cache.get_or_set('key', lambda: 'other', timeout=60), 'value')
+        self.assertEqual(cache_stats(self.namespace),
+                         {'miss': 1, 'l1_hit': 1, 'l2_hit': 1})
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                self.cache.get_or_set('key', compute, timeout=60)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * 5)
+
+    def test_slow_values_are_refreshed_before_they_expire(self):
+        self.cache.set('key', 'old', timeout=1, delta=1000)
+        self.assertEqual(self.cache.get_or_set('key', lambda: 'new', timeout=60), 'new')
+        self.assertEqual(cache_stats(self.namespace)['early_refresh'], 1)
+
+    def test_stale_value_is_served_while_another_worker_recomputes(self):
+        self.cache.set('key', 'old', timeout=1, delta=1000)
+        self.cache.l2.add(f'{self.namespace}:key:lock', 1, 10)
+        self.assertEqual(self.cache.get_or_set('key', lambda: 'new', timeout=60), 'old')
+        self.assertEqual(cache_stats(self.namespace)['stale_hit'], 1)
+
+    def test_add_and_incr_are_atomic_across_processes(self):
+        counter = f'{self.namespace}:counter'
+        self.cache.l2.set(counter, 0, None)
+        context = multiprocessing.get_context('fork')
+        with context.Pool(4) as pool:
+            took = pool.starmap(_add_and_incr, [(self.namespace, counter)] * 4)
+
+        self.assertEqual(sorted(took), [False, False, False, True])
+        self.assertEqual(self.cache.l2.get(counter), 200)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.gettempdir(),
+    }})
+    def test_l2_must_have_an_atomic_add(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.cache.get('key')
+
+
+def _add_and_incr(namespace, counter):
+    # Run in a forked worker process, sharing the test cache directory
+    from django.core.cache import caches
+    l2 = caches['default']
+    took = l2.add(f'{namespace}:lock', 1, 60)
+    for _ in range(50):
+        l2.incr(counter)
+    return took
+
+
+class ThumbnailTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root, PRODUCT_IMAGE_WIDTHS=[240, 480, 960])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 400), 'red').save(buffer, 'JPEG')
+        name = default_storage.save('shirt.jpg', ContentFile(buffer.getvalue()))
+        self.product = Product.objects.create(name='Shirt', description='',
+                                              price=10, image=name)
+
+    def test_command_generates_each_width_and_format(self):
+        call_command('generate_thumbnails', '--workers', '0', stdout=io.StringIO())
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image_derivatives,
+                         {'name': 'shirt.jpg', 'widths': [240, 480]})
+        for width in (240, 480):
+            for fmt in ('webp', 'jpeg'):
+                with default_storage.open(derivative_name('shirt.jpg', width, fmt)) as f:
+                    self.assertEqual(Image.open(f).width, width)
+        self.assertEqual(
+            srcset(self.product, 'webp'),
+            '/media/derivatives/shirt_240w.webp 240w, /media/derivatives/shirt_480w.webp 480w')
+
+    def test_listing_offers_srcset_only_for_current_image(self):
+        response = self.client.get('/products/')
+        self.assertNotContains(response, 'srcset=')
+
+        call_command('generate_thumbnails', '--workers', '0', stdout=io.StringIO())
+        response = self.client.get('/products/')
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, 'shirt_480w.jpg 480w')
+
+        self.product.refresh_from_db()
+        self.product.image = 'other.jpg'
+        self.assertEqual(srcset(self.product, 'jpeg'), '')
+
+
+class BenchmarkTests(TestCase):
+
+    def test_datasets_are_rolled_back_after_each_run(self):
+        results = run_benchmarks(['calc_subtotal', 'ProductForm.__init__'], repeat=1)
+
+        self.assertEqual(list(results), [
+            'ProductForm.__init__[5]', 'ProductForm.__init__[50]',
+            'ProductForm.__init__[500]', 'calc_subtotal',
+        ])
+        self.assertTrue(all(r['min_us'] > 0 for r in results.values()))
+        self.assertFalse(Category.objects.exists())
+
+    def test_benchmark_products_belong_to_saved_categories(self):
+        products = _products(10, random.Random(0))
+
+        self.assertEqual(len(products), 10)
+        self.assertTrue(all(p.category and p.category.pk for p in products))
+
+    def test_regressions_beyond_the_threshold_are_reported(self):
+        baseline = {'a': {'min_us': 100.0}, 'b': {'min_us': 100.0}}
+        results = {'a': {'min_us': 115.0}, 'b': {'min_us': 130.0},
+                   'new': {'min_us': 500.0}}
+
+        self.assertEqual(find_regressions(baseline, results, 20), {'b': (100.0, 130.0)})
+        self.assertEqual(find_regressions(baseline, results, 10),
+                         {'a': (100.0, 115.0), 'b': (100.0, 130.0)})
+
+
+class GenerateDataTests(TestCase):
+
+    def generate(self):
+        call_command('generate_data', products=40, users=6, orders=25, workers=0,
+                     chunk_size=10, stdout=io.StringIO())
+        return list(Order.objects.order_by('pk').values())
+
+    def test_orders_match_their_bags_and_line_items(self):
+        self.generate()
+
+        self.assertEqual(Product.objects.count(), 40)
+        self.assertEqual(UserProfile.objects.count(), 6)
+        self.assertEqual(search_products(Product.objects.all(), 'generated').count(), 40)
+        for order in Order.objects.with_lineitems():
+            lines = list(order.lineitems.all())
+            self.assertEqual(order.order_total, sum(line.lineitem_total for line in lines))
+            self.assertEqual(order.item_count, sum(line.quantity for line in lines))
+            bag = json.loads(order.original_bag)
+            for line in lines:
+                quantity = bag[str(line.product_id)]
+                if line.product.has_sizes:
+                    quantity = quantity['items_by_size'][line.product_size]
+                self.assertEqual(quantity, line.quantity)
+
+    def test_the_same_seed_generates_the_same_rows(self):
+        first = self.generate()
+        Order.objects.all().delete()
+        Product.objects.all().delete()
+        User.objects.all().delete()
+        self.assertEqual(self.generate(), first)
+
+        self.generate()
+        self.assertEqual(Order.objects.values('stripe_pid').distinct().count(), 50)
+
+    def test_catalog_products_belong_to_saved_categories(self):
+        categories = datagen.create_catalog(3, 12, lambda i, categories: {
+            'name': f'Product {i}', 'description': '', 'price': 10,
+            'category': categories[i % len(categories)],
+        })
+
+        self.assertTrue(all(c.pk for c in categories))
+        self.assertEqual(Product.objects.filter(category__isnull=True).count(), 0)
+        self.assertEqual(Product.objects.filter(category=categories[0]).count(), 4)
@@ -0,0 +1,121 @@
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from PIL import Image
+
+DERIVATIVES_DIR = 'derivatives'
+
+# Pillow format name, file extension and save options for each output format
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def derivative_name(name, width, fmt):
+    """ Storage name of the derivative of image `name` at the given width """
+    stem = os.path.splitext(name)[0]
+    return f'{DERIVATIVES_DIR}/{stem}_{width}w.{FORMATS[fmt][1]}'
+
+
+def _target_widths(original_width):
+    widths = [w for w in settings.PRODUCT_IMAGE_WIDTHS if w <= original_width]
+    return widths or [original_width]
+
+
+def generate_derivatives(name, storage=None):
+    """
+    Write resized WebP and JPEG copies of image `name` through the given
+    storage (the active default storage if not given) and return the
+    list of widths written
+    """
+    storage = storage or default_storage
+    with storage.open(name, 'rb') as f:
+        original = Image.open(f)
+        original.load()
+
+    widths = _target_widths(original.width)
+    for width in widths:
+        height = round(original.height * width / original.width)
+        resized = original.resize((width, height), Image.LANCZOS)
+        for fmt, (pil_format, _, options) in FORMATS.items():
+            image = resized
+            if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, pil_format, **options)
+            target = derivative_name(name, width, fmt)
+            if storage.exists(target):
+                storage.delete(target)
+            storage.save(target, ContentFile(buffer.getvalue()))
+    return widths
+
+
+def process_product(product_id, force=False):
+    """
+    Generate derivatives for one product and record them on it.
+    Returns (product_id, widths), widths being None if nothing was done.
+    """
+    from .models import Product
+
+    product = Product.objects.filter(pk=product_id).first()
+    if not product or not product.image:
+        return product_id, None
+    name = product.image.name
+    if not force and product.image_derivatives.get('name') == name:
+        return product_id, None
+
+    widths = generate_derivatives(name)
+    # Only record them if the image hasn't been replaced meanwhile
+    Product.objects.filter(pk=product_id, image=name).update(
+        image_derivatives={'name': name, 'widths': widths})
+    return product_id, widths
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def create_pool(workers):
+    """
+    A process pool whose workers each set up Django. Workers are spawned
+    rather than forked so they never share the parent's DB connections.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+    )
+
+
+def schedule_derivatives(product):
+    """
+    Queue derivative generation for product, to run in a job worker
+    once the current transaction commits
+    """
+    # Imported here, like the models, so pool workers can unpickle
+    # _init_worker before Django is set up
+    from jobs.queue import enqueue
+
+    enqueue(process_product, product.pk, True)
+
+
+def srcset(product, fmt):
+    """
+    The srcset attribute value for product's derivatives in the given
+    format, or '' if none have been generated for its current image
+    """
+    derivatives = product.image_derivatives or {}
+    if not product.image or derivatives.get('name') != product.image.name:
+        return ''
+    return ', '.join(
+        f'{default_storage.url(derivative_name(product.image.name, w, fmt))} {w}w'
+        for w in derivatives.get('widths', [])
+    )
@@ -12,11 +12,25 @@ from django.contrib import messages
 # want to decorate.
 from django.contrib.auth.decorators import login_required
 
-from django.db.models import Q
+from django.conf import settings
+from django.db.models import F
 from django.db.models.functions import Lower
 
-from .models import Product, Category
+from .models import Product
 from .forms import ProductForm
+from .search import search_products
+from .pagination import paginate
+from .registry import category_registry
+from .listing_cache import listing_cache
+from .thumbnails import schedule_derivatives
+
+
+SORT_EXPRESSIONS = {
+    'name': Lower('name'),
+    'category': F('category__name'),
+    'price': F('price'),
+    'rating': F('rating'),
+}
 
 # Create your views here.
 
@@ -24,31 +38,25 @@ from .forms import ProductForm
 def all_products(request):
     """ A view to show all products, including sorting and search queries """
 
-    products = Product.objects.all()
+    products = Product.objects.select_related('category')
     query = None
     categories = None
     sort = None
     direction = None
+    sort_expression = None
 
     if request.GET:
         if 'sort' in request.GET:
             sortkey = request.GET['sort']
             sort = sortkey
-            if sortkey == 'name':
-                sortkey = 'lower_name'
-                products = products.annotate(lower_name=Lower('name'))
-            if sortkey == 'category':
-                sortkey = 'category__name'
+            sort_expression = SORT_EXPRESSIONS.get(sortkey)
             if 'direction' in request.GET:
                 direction = request.GET['direction']
-                if direction == 'desc':
-                    sortkey = f'-{sortkey}'
-            products = products.order_by(sortkey)
 
         if 'category' in request.GET:
-            categories = request.GET['category'].split(',')
-            products = products.filter(category__name__in=categories)
-            categories = Category.objects.filter(name__in=categories)
+            categories = category_registry.filter_names(
+                request.GET['category'].split(','))
+            products = products.filter(category_id__in=[c.pk for c in categories])
 
         if 'q' in request.GET:
             query = request.GET['q']
@@ -56,16 +64,51 @@ def all_products(request):
                 messages.error(request, "You didn't enter any search criteria!")
                 return redirect(reverse('products'))
 
-            queries = Q(name__icontains=query) | Q(description__icontains=query)
-            products = products.filter(queries)
+            products = search_products(products, query, order_by_rank=False)
 
     current_sorting = f'{sort}_{direction}'
+    sort_key = current_sorting
+    descending = direction == 'desc'
+    if query and sort_expression is None:
+        sort_key = 'relevance'
+        sort_expression = F('search_rank')
+        descending = True
+
+    cursor = request.GET.get('after')
+    cache_key = listing_cache.key(
+        sort_key=sort_key,
+        category_ids=[c.pk for c in categories] if categories is not None else None,
+        query=query,
+        cursor=cursor,
+    )
+    page = listing_cache.get_page(cache_key, lambda: paginate(
+        products,
+        sort_key=sort_key,
+        sort_expression=sort_expression,
+        descending=descending,
+        cursor=cursor,
+        per_page=settings.PRODUCTS_PER_PAGE,
+    ))
+
+    next_page_query = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['after'] = page.next_cursor
+        next_page_query = params.urlencode()
+
+    first_page_query = None
+    if 'after' in request.GET:
+        params = request.GET.copy()
+        del params['after']
+        first_page_query = params.urlencode()
 
     context = {
-        'products': products,
+        'products': page,
         'search_term': query,
         'current_categories': categories,
         'current_sorting': current_sorting,
+        'next_page_query': next_page_query,
+        'first_page_query': first_page_query,
     }
 
     return render(request, 'products/products.html', context)
@@ -124,6 +167,8 @@ def add_product(request):
         form = ProductForm(request.POST, request.FILES)
         if form.is_valid():
             product = form.save()
+            if product.image:
+                schedule_derivatives(product)
             messages.success(request, 'Successfully added product!')
             return redirect(reverse('product_detail', args=[product.id]))
         else:
@@ -176,6 +221,8 @@ def edit_product(request, product_id):
         form = ProductForm(request.POST, request.FILES, instance=product)
         if form.is_valid():
             form.save()
+            if product.image and 'image' in form.changed_data:
+                schedule_derivatives(product)
             messages.success(request, 'Successfully updated product!')
             return redirect(reverse('product_detail', args=[product.id]))
         else:
@@ -0,0 +1,85 @@
+import os
+
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+
+from .models import RequestProfile
+
+DOWNLOADS = ('profile', 'allocations')
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created', 'method', 'path', 'status_code', 'total_ms',
+                    'view_ms', 'template_ms', 'db_ms', 'stripe_ms', 'queries',
+                    'trigger', 'downloads')
+
+    list_filter = ('trigger', 'method', 'status_code')
+
+    search_fields = ('path', 'view_name', 'username')
+
+    ordering = ('-created',)
+
+    fields = ('created', 'method', 'path', 'view_name', 'status_code',
+              'username', 'trigger', 'total_ms', 'view_ms', 'template_ms',
+              'db_ms', 'stripe_ms', 'queries', 'peak_memory', 'downloads',
+              'slowest_functions', 'largest_allocations')
+
+    readonly_fields = fields
+
+    # Profiles are only made by the middleware, and never edited
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path('<int:pk>/download/<str:kind>/',
+                 self.admin_site.admin_view(self.download),
+                 name='profiler_requestprofile_download'),
+        ]
+        return urls + super().get_urls()
+
+    def download(self, request, pk, kind):
+        """ The profile's pstats or tracemalloc file, as an attachment """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        if kind not in DOWNLOADS:
+            raise Http404
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        field = getattr(profile, kind)
+        if not field or not field.storage.exists(field.name):
+            raise Http404
+        filename = f'request-{profile.pk}-{os.path.basename(field.name)}'
+        return FileResponse(field.open('rb'), as_attachment=True, filename=filename)
+
+    def downloads(self, obj):
+        return format_html_join(' | ', '<a href="{}">{}</a>', (
+            (reverse('admin:profiler_requestprofile_download', args=(obj.pk, kind)), kind)
+            for kind in DOWNLOADS
+        ))
+
+    def slowest_functions(self, obj):
+        rows = format_html_join('', '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>', (
+            (row['function'], row['calls'], f'{row["own_ms"]:.1f}',
+             f'{row["cumulative_ms"]:.1f}')
+            for row in obj.summary.get('functions', [])
+        ))
+        return format_html('<table><tr><th>Function</th><th>Calls</th><th>Own ms</th>'
+                           '<th>Cumulative ms</th></tr>{}</table>', rows)
+
+    def largest_allocations(self, obj):
+        rows = format_html_join('', '<tr><td>{}</td><td>{}</td><td>{}</td></tr>', (
+            (row['line'], f'{row["kb"]:.1f}', row['blocks'])
+            for row in obj.summary.get('allocations', [])
+        ))
+        return format_html('<table><tr><th>Line</th><th>KiB</th><th>Blocks</th></tr>'
+                           '{}</table>', rows)
+
+
+admin.site.register(RequestProfile, RequestProfileAdmin)
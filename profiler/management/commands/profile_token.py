@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from profiler.middleware import make_token
+
+
+class Command(BaseCommand):
+    help = (
+        'Print a token for a superuser which profiles any request sent with '
+        'it in the X-Profile-Token header, e.g. '
+        'curl -H "X-Profile-Token: <token>" https://example.com/products/'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'],
+                                    is_active=True, is_superuser=True)
+        except User.DoesNotExist:
+            raise CommandError(f'No active superuser named {options["username"]}')
+        self.stdout.write(make_token(user))
+        self.stderr.write(f'Valid for {settings.PROFILER_TOKEN_MAX_AGE} seconds')
@@ -0,0 +1,229 @@
+import cProfile
+import logging
+import marshal
+import pickle
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.db import connections
+from django.template.base import Template
+
+from checkout.stripe_client import StripeClient
+from .models import RequestProfile
+
+logger = logging.getLogger(__name__)
+
+QUERY_FLAG = '_profile'
+TOKEN_HEADER = 'HTTP_X_PROFILE_TOKEN'
+TOKEN_SALT = 'profiler.token'
+
+# Functions whose cumulative time in the profile is the time spent in
+# templates and in calls to Stripe
+TEMPLATE_RENDER = Template.render.__code__
+STRIPE_REQUEST = StripeClient.request.__code__
+
+# tracemalloc traces the whole process, so one request is profiled at a time
+_profiling = threading.Lock()
+
+
+def make_token(user):
+    """
+    A token for the X-Profile-Token header which profiles any request
+    sent with it, for PROFILER_TOKEN_MAX_AGE seconds
+    """
+    return signing.dumps(user.get_username(), salt=TOKEN_SALT)
+
+
+def token_user(token):
+    """ The active superuser a valid, unexpired token was made for """
+    try:
+        username = signing.loads(token, salt=TOKEN_SALT,
+                                 max_age=settings.PROFILER_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    return User.objects.filter(username=username, is_active=True,
+                               is_superuser=True).first()
+
+
+def _key(code):
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+def _rendering_template():
+    frame = sys._getframe(2)
+    while frame:
+        if frame.f_code is TEMPLATE_RENDER:
+            return True
+        frame = frame.f_back
+    return False
+
+
+class _QueryTimer:
+    """ Time spent in queries, and how much of it while rendering templates """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.in_templates = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.total += duration
+            if _rendering_template():
+                self.in_templates += duration
+
+
+class RequestProfiler:
+    """ Profiles one call of get_response(request) """
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.queries = _QueryTimer()
+
+    def run(self, get_response, request):
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(settings.PROFILER_TRACEBACK_DEPTH)
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self.queries))
+                self.profile.enable()
+                try:
+                    response = get_response(request)
+                finally:
+                    self.profile.disable()
+        finally:
+            self.total = time.perf_counter() - start
+            self.snapshot = tracemalloc.take_snapshot().filter_traces(
+                (tracemalloc.Filter(False, tracemalloc.__file__),))
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+        return response
+
+    def split(self, stats):
+        """
+        Seconds spent in the view, templates, the database and Stripe.
+        Queries run while rendering count as database time, not template
+        time, and the view's time is whatever is left.
+        """
+        template = stats.get(_key(TEMPLATE_RENDER), (0, 0, 0, 0))[3]
+        stripe = stats.get(_key(STRIPE_REQUEST), (0, 0, 0, 0))[3]
+        template = max(0.0, template - self.queries.in_templates)
+        view = max(0.0, self.total - template - self.queries.total - stripe)
+        return {'view': view, 'template': template,
+                'db': self.queries.total, 'stripe': stripe}
+
+    def summary(self):
+        """ The slowest functions and the lines that allocated most """
+        lines = settings.PROFILER_SUMMARY_LINES
+        stats = pstats.Stats(self.profile).sort_stats('cumulative')
+        functions = []
+        for key in stats.fcn_list[:lines]:
+            _, calls, own, cumulative, _ = stats.stats[key]
+            functions.append({
+                'function': pstats.func_std_string(key),
+                'calls': calls,
+                'own_ms': own * 1000,
+                'cumulative_ms': cumulative * 1000,
+            })
+        allocations = [
+            {'line': str(stat.traceback[0]), 'kb': stat.size / 1024, 'blocks': stat.count}
+            for stat in self.snapshot.statistics('lineno')[:lines]
+        ]
+        return {'functions': functions, 'allocations': allocations}
+
+    def save(self, request, response, trigger):
+        self.profile.create_stats()
+        stats = self.profile.stats
+        split = self.split(stats)
+        user = getattr(request, 'user', None)
+        match = request.resolver_match
+        profile = RequestProfile(
+            method=request.method,
+            path=request.get_full_path()[:2000],
+            view_name=match.view_name if match else '',
+            status_code=response.status_code,
+            username=user.get_username() if user and user.is_authenticated else '',
+            trigger=trigger,
+            total_ms=self.total * 1000,
+            view_ms=split['view'] * 1000,
+            template_ms=split['template'] * 1000,
+            db_ms=split['db'] * 1000,
+            stripe_ms=split['stripe'] * 1000,
+            queries=self.queries.count,
+            peak_memory=self.peak_memory,
+            summary=self.summary(),
+        )
+        profile.profile.save('request.prof', ContentFile(marshal.dumps(stats)), save=False)
+        snapshot = pickle.dumps(self.snapshot, pickle.HIGHEST_PROTOCOL)
+        profile.allocations.save('request.tracemalloc', ContentFile(snapshot), save=False)
+        profile.save()
+        return profile
+
+
+def prune_profiles(keep):
+    """ Delete all but the newest `keep` profiles, with their files """
+    stale = RequestProfile.objects.order_by('-created', '-pk').values_list('pk', flat=True)
+    # Deleted one by one so post_delete removes each one's files
+    for profile in RequestProfile.objects.filter(pk__in=list(stale[keep:])):
+        profile.delete()
+
+
+class RequestProfilerMiddleware:
+    """
+    Profiles a request when a superuser adds ?_profile to the URL, when
+    it carries a token from make_token in the X-Profile-Token header,
+    or at random in PROFILER_SAMPLE_RATE of all requests. Each profile
+    is saved as a RequestProfile, listed in the admin.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _trigger(self, request):
+        if QUERY_FLAG in request.GET and request.user.is_superuser:
+            return RequestProfile.FLAG
+        token = request.META.get(TOKEN_HEADER)
+        if token and token_user(token):
+            return RequestProfile.TOKEN
+        if random.random() < settings.PROFILER_SAMPLE_RATE:
+            return RequestProfile.SAMPLE
+        return None
+
+    def __call__(self, request):
+        trigger = self._trigger(request)
+        if trigger is None or not _profiling.acquire(blocking=False):
+            return self.get_response(request)
+
+        profiler = RequestProfiler()
+        try:
+            response = profiler.run(self.get_response, request)
+        finally:
+            _profiling.release()
+        try:
+            profile = profiler.save(request, response, trigger)
+            prune_profiles(settings.PROFILER_KEEP)
+        except Exception:
+            # Never fail the request being profiled
+            logger.exception('Could not save the profile of %s', request.path)
+        else:
+            response['X-Profile-Id'] = str(profile.pk)
+        return response
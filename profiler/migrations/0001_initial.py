@@ -0,0 +1,38 @@
+# Generated by Django 3.1.3 on 2026-10-18 09:15
+
+from django.db import migrations, models
+import profiler.models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=2000)),
+                ('view_name', models.CharField(blank=True, default='', max_length=200)),
+                ('status_code', models.PositiveIntegerField()),
+                ('username', models.CharField(blank=True, default='', max_length=150)),
+                ('trigger', models.CharField(choices=[('flag', 'Query flag'), ('token', 'Signed header'), ('sample', 'Random sample')], max_length=10)),
+                ('total_ms', models.FloatField()),
+                ('view_ms', models.FloatField()),
+                ('template_ms', models.FloatField()),
+                ('db_ms', models.FloatField()),
+                ('stripe_ms', models.FloatField()),
+                ('queries', models.PositiveIntegerField()),
+                ('peak_memory', models.PositiveIntegerField(help_text='Bytes')),
+                ('profile', models.FileField(storage=profiler.models.ProfileStorage(), upload_to='%Y/%m/%d')),
+                ('allocations', models.FileField(storage=profiler.models.ProfileStorage(), upload_to='%Y/%m/%d')),
+                ('summary', models.JSONField(default=dict)),
+            ],
+        ),
+    ]
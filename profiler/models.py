@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils.functional import cached_property
+
+
+class ProfileStorage(FileSystemStorage):
+    """
+    Files under PROFILER_ROOT. That is outside MEDIA_ROOT, as profiles
+    may hold anything the request touched, and they are only served
+    through the admin.
+    """
+
+    @cached_property
+    def base_location(self):
+        return settings.PROFILER_ROOT
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == 'PROFILER_ROOT':
+            self.__dict__.pop('base_location', None)
+            self.__dict__.pop('location', None)
+
+
+profile_storage = ProfileStorage()
+
+
+class RequestProfile(models.Model):
+    """
+    A call-graph profile and allocation snapshot of one request, with
+    its time split between the view, templates, the database and Stripe
+    """
+    FLAG = 'flag'
+    TOKEN = 'token'
+    SAMPLE = 'sample'
+    TRIGGER_CHOICES = (
+        (FLAG, 'Query flag'),
+        (TOKEN, 'Signed header'),
+        (SAMPLE, 'Random sample'),
+    )
+
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000)
+    view_name = models.CharField(max_length=200, blank=True, default='')
+    status_code = models.PositiveIntegerField()
+    username = models.CharField(max_length=150, blank=True, default='')
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    total_ms = models.FloatField()
+    view_ms = models.FloatField()
+    template_ms = models.FloatField()
+    db_ms = models.FloatField()
+    stripe_ms = models.FloatField()
+    queries = models.PositiveIntegerField()
+    peak_memory = models.PositiveIntegerField(help_text='Bytes')
+    # pstats data, readable with pstats.Stats or snakeviz
+    profile = models.FileField(storage=profile_storage, upload_to='%Y/%m/%d')
+    # A tracemalloc.Snapshot, readable with tracemalloc.Snapshot.load
+    allocations = models.FileField(storage=profile_storage, upload_to='%Y/%m/%d')
+    summary = models.JSONField(default=dict)
+
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.total_ms:.0f}ms)'
+
+
+@receiver(post_delete, sender=RequestProfile)
+def delete_profile_files(sender, instance, **kwargs):
+    """
+    Remove a deleted profile's files
+    """
+    for field in (instance.profile, instance.allocations):
+        if field:
+            field.delete(save=False)
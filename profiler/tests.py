@@ -0,0 +1,147 @@
+import io
+import marshal
+import pickle
+import shutil
+import tempfile
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from checkout.fake_stripe import FakeStripe
+from products.models import Product
+from .middleware import TOKEN_SALT, make_token
+from .models import RequestProfile, profile_storage
+
+
+class RequestProfilerTests(TestCase):
+
+    def setUp(self):
+        profiler_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, profiler_root)
+        settings_override = override_settings(PROFILER_ROOT=profiler_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.shopper = User.objects.create_user('shopper', 'shopper@example.com', 'pw')
+        self.shirt = Product.objects.create(name='Shirt', description='', price=100)
+
+    def test_superuser_query_flag_profiles_the_request(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/products/?_profile')
+
+        self.assertEqual(response.status_code, 200)
+        profile = RequestProfile.objects.get()
+        self.assertEqual(response['X-Profile-Id'], str(profile.pk))
+        self.assertEqual((profile.trigger, profile.view_name, profile.username),
+                         (RequestProfile.FLAG, 'products', 'admin'))
+        self.assertGreater(profile.queries, 0)
+        self.assertGreater(profile.template_ms, 0)
+        self.assertGreater(profile.db_ms, 0)
+        self.assertEqual(profile.stripe_ms, 0)
+        self.assertAlmostEqual(
+            profile.view_ms + profile.template_ms + profile.db_ms + profile.stripe_ms,
+            profile.total_ms, places=3)
+        self.assertTrue(profile.summary['functions'])
+        self.assertTrue(profile.summary['allocations'])
+        self.assertTrue(profile_storage.exists(profile.profile.name))
+
+    def test_profiles_are_listed_and_downloaded_in_the_admin(self):
+        self.client.force_login(self.admin)
+        self.client.get('/products/?_profile')
+        profile = RequestProfile.objects.get()
+
+        response = self.client.get('/admin/profiler/requestprofile/')
+        self.assertContains(response, f'/admin/profiler/requestprofile/{profile.pk}/download/profile/')
+        response = self.client.get(f'/admin/profiler/requestprofile/{profile.pk}/change/')
+        self.assertContains(response, 'Cumulative ms')
+
+        response = self.client.get(f'/admin/profiler/requestprofile/{profile.pk}/download/profile/')
+        self.assertIn('attachment', response['Content-Disposition'])
+        stats = marshal.loads(b''.join(response.streaming_content))
+        self.assertTrue(any(name == 'all_products' for _, _, name in stats))
+
+        response = self.client.get(f'/admin/profiler/requestprofile/{profile.pk}/download/allocations/')
+        snapshot = pickle.loads(b''.join(response.streaming_content))
+        self.assertIsInstance(snapshot, tracemalloc.Snapshot)
+
+        response = self.client.get(f'/admin/profiler/requestprofile/{profile.pk}/download/other/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_downloads_need_the_admin(self):
+        self.client.force_login(self.admin)
+        self.client.get('/products/?_profile')
+        profile = RequestProfile.objects.get()
+
+        self.client.force_login(self.shopper)
+        response = self.client.get(f'/admin/profiler/requestprofile/{profile.pk}/download/profile/')
+        self.assertEqual(response.status_code, 302)
+
+    def test_query_flag_is_ignored_for_other_users(self):
+        self.client.get('/products/?_profile')
+        self.client.force_login(self.shopper)
+        response = self.client.get('/products/?_profile')
+
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_signed_header_profiles_the_request(self):
+        token = make_token(self.admin)
+        response = self.client.get('/products/', HTTP_X_PROFILE_TOKEN=token)
+
+        profile = RequestProfile.objects.get()
+        self.assertEqual(response['X-Profile-Id'], str(profile.pk))
+        self.assertEqual((profile.trigger, profile.username), (RequestProfile.TOKEN, ''))
+
+    def test_invalid_and_expired_tokens_are_ignored(self):
+        forged = signing.dumps('admin', key='not the secret key', salt=TOKEN_SALT)
+        not_superuser = make_token(self.shopper)
+        for token in ('nonsense', forged, not_superuser):
+            self.client.get('/products/', HTTP_X_PROFILE_TOKEN=token)
+        with override_settings(PROFILER_TOKEN_MAX_AGE=-1):
+            self.client.get('/products/', HTTP_X_PROFILE_TOKEN=make_token(self.admin))
+
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_stripe_time_is_split_out(self):
+        fake = FakeStripe().start()
+        self.addCleanup(fake.stop)
+        session = self.client.session
+        session['bag'] = {str(self.shirt.pk): 1}
+        session.save()
+        self.client.force_login(self.admin)
+
+        with override_settings(STRIPE_API_BASE=fake.url, STRIPE_SECRET_KEY='sk_test'):
+            response = self.client.get('/checkout/?_profile')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(RequestProfile.objects.get().stripe_ms, 0)
+
+    @override_settings(PROFILER_SAMPLE_RATE=1, PROFILER_KEEP=2)
+    def test_sampling_keeps_the_newest_profiles(self):
+        for _ in range(3):
+            self.client.get('/products/')
+
+        profiles = RequestProfile.objects.all()
+        self.assertEqual(len(profiles), 2)
+        self.assertTrue(all(p.trigger == RequestProfile.SAMPLE for p in profiles))
+        self.assertEqual(len(profile_storage.listdir(
+            profiles[0].profile.name.rsplit('/', 1)[0])[1]), 4)
+
+    def test_deleting_a_profile_removes_its_files(self):
+        self.client.force_login(self.admin)
+        self.client.get('/products/?_profile')
+        profile = RequestProfile.objects.get()
+        names = (profile.profile.name, profile.allocations.name)
+
+        profile.delete()
+        self.assertFalse(any(profile_storage.exists(name) for name in names))
+
+    def test_profile_token_command(self):
+        out = io.StringIO()
+        call_command('profile_token', 'admin', stdout=out, stderr=io.StringIO())
+        username = signing.loads(out.getvalue().strip(), salt=TOKEN_SALT)
+        self.assertEqual(username, 'admin')
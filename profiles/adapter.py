@@ -0,0 +1,10 @@
+from allauth.account.adapter import DefaultAccountAdapter
+
+from jobs.mail import queue_message
+
+
+class AccountAdapter(DefaultAccountAdapter):
+    """ Sends allauth's emails from the job queue instead of inline """
+
+    def send_mail(self, template_prefix, email, context):
+        queue_message(self.render_mail(template_prefix, email, context))
@@ -1,3 +1,73 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core import mail
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
-# Create your tests here.
+from checkout.models import Order
+from checkout.services import build_order
+from jobs.queue import run_batch
+from products.models import Product
+
+
+class AccountEmailTests(TestCase):
+
+    def test_verification_email_is_sent_from_the_queue(self):
+        response = self.client.post('/accounts/signup/', {
+            'username': 'shopper',
+            'email': 'shopper@example.com',
+            'email2': 'shopper@example.com',
+            'password1': 'a-long-Passw0rd',
+            'password2': 'a-long-Passw0rd',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(mail.outbox, [])
+
+        self.assertEqual(run_batch(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['shopper@example.com'])
+
+
+@override_settings(ORDERS_PER_PAGE=3)
+class OrderHistoryTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'pass')
+        self.client.force_login(self.user)
+        self.products = [Product.objects.create(name=f'Product {i}', description='', price=5)
+                         for i in range(4)]
+
+    def place_order(self, lines):
+        order = Order(user_profile=self.user.userprofile, full_name='Shopper',
+                      email='shopper@example.com', phone_number='0123',
+                      country='IE', town_or_city='Dublin', street_address1='1 Main St')
+        bag = {str(p.pk): 2 for p in self.products[:lines]}
+        return build_order(order, bag)
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_profile_queries_do_not_grow_with_orders(self):
+        self.place_order(1)
+        few, _ = self.queries('/profile/')
+        for lines in range(2, 5):
+            self.place_order(lines)
+        many, response = self.queries('/profile/')
+        self.assertEqual(few, many)
+        self.assertContains(response, '8 items')
+
+    def test_profile_orders_are_paginated_newest_first(self):
+        orders = [self.place_order(1) for _ in range(5)]
+        _, response = self.queries('/profile/')
+        self.assertEqual(list(response.context['orders']), orders[:-4:-1])
+        _, response = self.queries('/profile/?page=2')
+        self.assertEqual(list(response.context['orders']), orders[1::-1])
+
+    def test_order_history_queries_do_not_grow_with_line_items(self):
+        small = self.place_order(1)
+        large = self.place_order(4)
+        self.assertEqual(self.queries(f'/profile/order_history/{small.order_number}')[0],
+                         self.queries(f'/profile/order_history/{large.order_number}')[0])
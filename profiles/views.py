@@ -7,6 +7,8 @@
 from django.shortcuts import render, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.conf import settings
 
 # Then go to our profiles views. Import the user profile model.
 # Get the profile for the current user. And then return it to the template.
@@ -47,7 +49,8 @@ def profile(request):
             messages.error(request, 'Update failed. Please ensure the form is valid.')
     else:
         form = UserProfileForm(instance=profile)
-    orders = profile.orders.all()
+    orders = Paginator(profile.orders.order_by('-date', '-pk'), settings.ORDERS_PER_PAGE)
+    orders = orders.get_page(request.GET.get('page'))
 
     template = 'profiles/profile.html'
     context = {
@@ -74,7 +77,7 @@ def profile(request):
 # view.
 
 def order_history(request, order_number):
-    order = get_object_or_404(Order, order_number=order_number)
+    order = get_object_or_404(Order.objects.with_lineitems(), order_number=order_number)
 
     messages.info(request, (
         f'This is a past confirmation for order number {order_number}. '